@@ -0,0 +1,406 @@
+"""Benchmark cases for the app's hot paths.
+
+Every case runs against an in-process FakeSupabase behind the normal
+SupabaseRepository, and Sheets sync against FakeClient, so results measure
+this code rather than the network. Cases are registered with @case and
+yield (name, seconds, extra) tuples.
+"""
+import gc
+import glob
+import hashlib
+import os
+import random
+import statistics
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Iterator, List, Tuple
+import pandas as pd
+from PIL import Image
+from benchmarks.fake_supabase import FakeSupabase
+from modules.storage import SupabaseRepository, set_repository
+
+SAMPLE_IMAGES = "images/slip_images"
+SLIP_TYPES = ["Online Slip", "Cash Slip"]
+STATUSES = ["pending", "approved", "rejected"]
+
+Result = Tuple[str, float, Dict]
+CASES: Dict[str, Callable[[Dict], Iterator[Result]]] = {}
+
+def case(name: str):
+    def register(func):
+        CASES[name] = func
+        return func
+    return register
+
+@contextmanager
+def no_gc():
+    """Collect garbage left by setup, then keep the collector out of the timing (as timeit does)"""
+    gc.collect()
+    gc.disable()
+    try:
+        yield
+    finally:
+        gc.enable()
+
+def measure(func: Callable[[], object], repeat: int = 3, setup: Callable[[], object] = None) -> float:
+    """Median wall time of func() over `repeat` runs, calling setup() untimed before each"""
+    timings = []
+    for _ in range(max(1, repeat)):
+        if setup:
+            setup()
+        with no_gc():
+            start = time.perf_counter()
+            func()
+            timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+def reset_caches():
+    """Drop every process-wide cache so the next call starts cold"""
+    from modules.directory import BranchDirectory
+    from modules.hash_index import ImageHashIndex
+    from modules.phash import NearDuplicateIndex
+    from modules.rollups import WeeklyRollups
+    from modules.slip_query import invalidate_slip_queries
+    from modules.thumbnails import ThumbnailCache
+    from modules.transaction_index import TransactionIndex
+    for singleton in (BranchDirectory, ImageHashIndex, NearDuplicateIndex, ThumbnailCache, TransactionIndex,
+                      WeeklyRollups):
+        singleton._instance = None
+    invalidate_slip_queries()
+
+def fake_backend(branches: int = 0, riders_per_branch: int = 0, slips: int = 0) -> FakeSupabase:
+    """Install a fresh FakeSupabase seeded with deterministic data"""
+    client = FakeSupabase()
+    codes = [f"BR{i:05d}" for i in range(max(branches, 1))]
+    client.seed("branches", ({"code": code, "name": f"Branch {code}", "riders": []} for code in codes[:branches]))
+    client.seed("riders", (
+        {"branch_code": code, "name": f"Rider {j}"} for code in codes[:branches] for j in range(riders_per_branch)
+    ))
+    client.seed("slips", make_slips(slips, codes))
+    set_repository(SupabaseRepository(client))
+    reset_caches()
+    return client
+
+def make_slips(count: int, branch_codes: List[str]) -> Iterator[Dict]:
+    rng = random.Random(count)
+    start = datetime(2025, 1, 6)
+    weeks = [start + timedelta(weeks=i) for i in range(52)]
+    for i in range(count):
+        week_start = weeks[i * len(weeks) // max(count, 1)]
+        quantity = rng.randint(1, 20)
+        yield {
+            "branch_code": branch_codes[rng.randrange(len(branch_codes))],
+            "rider_name": f"Rider {rng.randrange(10)}",
+            "slip_type": SLIP_TYPES[i % 2],
+            "quantity": quantity,
+            "commission": quantity * 10.0,
+            "status": STATUSES[rng.randrange(3)],
+            "week": f"{week_start.date()} to {(week_start + timedelta(days=6)).date()}",
+            "transaction_id": f"{i:012d}",
+            "image_hash": hashlib.sha256(str(i).encode()).hexdigest(),
+            "submitted_at": (week_start + timedelta(seconds=i % 604800)).isoformat(),
+            "idempotency_key": f"bench-{i}",
+        }
+
+class _Upload:
+    """Minimal stand-in for Streamlit's UploadedFile"""
+
+    def __init__(self, path: str):
+        self.name = os.path.basename(path)
+        with open(path, "rb") as f:
+            self._data = f.read()
+
+    def getvalue(self) -> bytes:
+        return self._data
+
+def sample_images() -> List[str]:
+    """Distinct sample images, largest first"""
+    seen, samples = set(), []
+    for path in sorted(glob.glob(os.path.join(SAMPLE_IMAGES, "*", "*", "*"))):
+        if path.lower().endswith((".jpg", ".jpeg", ".png")):
+            with open(path, "rb") as f:
+                digest = hashlib.sha256(f.read()).hexdigest()
+            if digest not in seen:
+                seen.add(digest)
+                samples.append(path)
+    return sorted(samples, key=lambda p: -os.path.getsize(p))
+
+@case("images")
+def bench_images(options: Dict) -> Iterator[Result]:
+    from modules.utils import save_uploaded_image
+    for path in sample_images():
+        with Image.open(path) as image:
+            size = f"{image.width}x{image.height}"
+        upload = _Upload(path)
+        client = fake_backend()
+        seconds = measure(lambda: save_uploaded_image(upload, "BENCH", "Rider"), options["repeat"], reset_caches)
+        stored = next(iter(client.files["slip_images"].values()))
+        yield f"save_uploaded_image[{size} {os.path.splitext(path)[1][1:]}]", seconds, {
+            "input_bytes": len(upload.getvalue()),
+            "stored_bytes": len(stored),
+        }
+
+@case("commission")
+def bench_commission(options: Dict) -> Iterator[Result]:
+    from modules.commission import get_rate_table
+    from modules.utils import calculate_commission
+    calls = 100_000
+    seconds = measure(
+        lambda: [calculate_commission(SLIP_TYPES[i % 2], i % 20 + 1, "2025-06-01") for i in range(calls)],
+        options["repeat"]
+    )
+    yield f"calculate_commission[{calls} calls]", seconds, {}
+
+    for size in options["sizes"]:
+        rng = random.Random(size)
+        df = pd.DataFrame({
+            "slip_type": [SLIP_TYPES[i % 2] for i in range(size)],
+            "quantity": [rng.randint(1, 20) for _ in range(size)],
+            "week": [f"2025-{rng.randint(1, 12):02d}-01 to 2025-01-07" for _ in range(size)],
+        })
+        table = get_rate_table()
+        yield f"commission.apply[{size} slips]", measure(lambda: table.apply(df), options["repeat"]), {}
+
+@case("branches")
+def bench_branches(options: Dict) -> Iterator[Result]:
+    from modules.directory import get_branch_directory
+    for branches in (1000, 5000):
+        client = fake_backend(branches=branches, riders_per_branch=10)
+        cold = measure(lambda: get_branch_directory().as_mapping(), options["repeat"], reset_caches)
+        calls = sum(client.calls.values())
+        warm = measure(lambda: get_branch_directory().as_mapping(), options["repeat"])
+        yield f"load_branch_data[cold, {branches} branches]", cold, {"requests": calls // max(1, options["repeat"])}
+        yield f"load_branch_data[warm, {branches} branches]", warm, {}
+
+@case("admin")
+def bench_admin(options: Dict) -> Iterator[Result]:
+    from modules.rollups import get_weekly_rollups
+    from modules.slip_query import fetch_slip_page, invalidate_slip_queries
+    from modules.storage import get_repository
+    for size in options["sizes"]:
+        fake_backend(branches=200, riders_per_branch=10, slips=size)
+        # Untimed warm-up so the fake's sort indexes are not billed to the app
+        repository = get_repository()
+        repository.slip_page({}, ['id'], None, 1)
+        repository.slips_after(['id'], None, 1)
+        repeat = options["repeat"] if size < 1_000_000 else 1
+        filters = {"branch_code": "BR00007", "status": "pending"}
+        yield f"admin.first_page[{size} slips]", measure(
+            lambda: fetch_slip_page({}), repeat, invalidate_slip_queries
+        ), {}
+        yield f"admin.deep_page[{size} slips]", measure(
+            lambda: fetch_slip_page({}, after_id=size // 2), repeat, invalidate_slip_queries
+        ), {}
+        yield f"admin.filtered_page[{size} slips]", measure(
+            lambda: fetch_slip_page(filters), repeat, invalidate_slip_queries
+        ), {}
+        rollups = get_weekly_rollups()
+        yield f"admin.rollups_rebuild[{size} slips]", measure(rollups.rebuild, repeat), {}
+        week = next(iter(rollups.snapshot()))
+        yield f"admin.branch_totals[{size} slips]", measure(lambda: rollups.branch_totals(week), repeat), {}
+
+@case("transactions")
+def bench_transactions(options: Dict) -> Iterator[Result]:
+    from modules import transaction_index
+    from modules.transaction_index import get_transaction_index
+    for size in options["sizes"]:
+        fake_backend(branches=200, slips=size)
+        repeat = options["repeat"] if size < 1_000_000 else 1
+
+        def cold():
+            reset_caches()
+            if os.path.exists(transaction_index.TRANSACTION_INDEX_FILE):
+                os.remove(transaction_index.TRANSACTION_INDEX_FILE)
+        yield f"transactions.seed[cold, {size} slips]", measure(
+            lambda: get_transaction_index().contains("Online Slip", "0"), repeat, cold
+        ), {"index_bytes": get_transaction_index()._sorted.buffer_info()[1] * 8}
+        # Restart with the snapshot on disk; only slips after its watermark are pulled
+        yield f"transactions.seed[snapshot, {size} slips]", measure(
+            lambda: get_transaction_index().contains("Online Slip", "0"), repeat, reset_caches
+        ), {}
+        batch = [
+            {"slip_type": SLIP_TYPES[i % 2], "transaction_id": f"{i * 7919 % (2 * size):012d}"} for i in range(100)
+        ]
+        index = get_transaction_index()
+        yield f"transactions.check_batch[100 entries, {size} slips]", measure(
+            lambda: index.check_batch(batch), options["repeat"]
+        ), {"duplicates": len(index.check_batch(batch))}
+
+@case("thumbnails")
+def bench_thumbnails(options: Dict) -> Iterator[Result]:
+    import shutil
+    from modules import thumbnails
+    from modules.thumbnails import get_thumbnail_cache
+    page_size = 24
+    client = fake_backend()
+    samples = sample_images()
+    slips = []
+    for i in range(page_size):
+        path = samples[i % len(samples)]
+        with open(path, "rb") as f:
+            data = f.read()
+        image_path = f"BENCH/Rider/{i}{os.path.splitext(path)[1]}"
+        client.storage.from_("slip_images").upload(image_path, data)
+        slips.append({"image_path": image_path, "image_hash": hashlib.sha256(data + bytes([i])).hexdigest()})
+
+    def cold():
+        shutil.rmtree(thumbnails.THUMBNAIL_DIR, ignore_errors=True)
+        reset_caches()
+    seconds = measure(lambda: get_thumbnail_cache().get_many(slips), options["repeat"], cold)
+    cache = get_thumbnail_cache()
+    yield f"thumbnails.page[cold, {page_size} images]", seconds, {
+        "original_bytes": cache.stats["original_bytes"],
+        "thumbnail_bytes": cache.size()["bytes"],
+    }
+    yield f"thumbnails.page[warm, {page_size} images]", measure(
+        lambda: cache.get_many(slips), options["repeat"]
+    ), {}
+
+def _write_workbook(path: str, rows: int, changed: int = 0):
+    rng = random.Random(rows)
+    df = pd.DataFrame({
+        "Branch Code": [f"BR{i % 200:05d}" for i in range(rows)],
+        "Rider": [f"Rider {i % 10}" for i in range(rows)],
+        "Slip Type": [SLIP_TYPES[i % 2] for i in range(rows)],
+        "Quantity": [rng.randint(1, 20) for _ in range(rows)],
+        "Transaction ID": [f"{i:012d}" for i in range(rows)],
+    })
+    for i in range(changed):
+        df.loc[i * rows // changed, "Quantity"] += 100
+    with pd.ExcelWriter(path) as writer:
+        df.to_excel(writer, sheet_name="Slips", index=False)
+
+@case("sheets")
+def bench_sheets(options: Dict) -> Iterator[Result]:
+    from modules import google_sync
+    from benchmarks.fake_gspread import FakeClient
+    from modules.sheet_sync import SheetSyncState
+    workdir = options["workdir"]
+    for rows in (1000, 10000):
+        path = os.path.join(workdir, f"sheets_{rows}.xlsx")
+        _write_workbook(path, rows)
+        google_sync.DATA_FILE = path
+        client = FakeClient()
+
+        def full_sync():
+            google_sync._sync_state = SheetSyncState(os.path.join(workdir, "sheet_sync_state.json"))
+            return google_sync.save_to_google_sheets(client, full=True)
+        yield f"sheets.full_sync[{rows} rows]", measure(full_sync, options["repeat"]), {}
+
+        result = {}
+
+        def incremental():
+            _write_workbook(path, rows)
+            full_sync()
+            _write_workbook(path, rows, changed=rows // 100)
+            with no_gc():
+                start = time.perf_counter()
+                result.update(google_sync.save_to_google_sheets(client))
+                return time.perf_counter() - start
+        # Time only the incremental sync, not the workbook rewrite
+        seconds = statistics.median(incremental() for _ in range(max(1, options["repeat"])))
+        yield f"sheets.incremental_sync[{rows} rows, 1% changed]", seconds, {
+            "rows_written": result["Slips"]["rows_written"],
+            "api_calls": result["Slips"]["api_calls"],
+        }
+        yield f"excel.read[{rows} rows]", measure(lambda: pd.read_excel(path, sheet_name=None), options["repeat"]), {}
+
+def _write_legacy_workbook(path: str, rows: int):
+    from openpyxl import Workbook
+    rng = random.Random(rows)
+    workbook = Workbook(write_only=True)
+    sheets = [workbook.create_sheet(f"Branch {b}") for b in range(20)]
+    header = ["Rider Name", "Slip Type", "Slip Quantity", "Transaction ID", "Image Path",
+              "Submitted By", "Branch Code", "Week", "Commission"]
+    for sheet in sheets:
+        sheet.append(header)
+    for i in range(rows):
+        quantity = rng.randint(1, 20)
+        sheets[i % 20].append([
+            f"Rider {i % 10}", SLIP_TYPES[i % 2], quantity, f"{i:012d}", f"{1747000000 + i}_slip.png",
+            "Manager", f"BR{i % 20:05d}", "2025-05-12 to 2025-05-18", quantity * 25
+        ])
+    workbook.save(path)
+
+def _write_legacy_requests(path: str, rows: int):
+    import csv
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["Request Type", "Branch Code", "Requested By", "Description", "Timestamp", "Status"])
+        for i in range(rows):
+            writer.writerow(["Change", f"BR{i % 20:05d}", "Manager", f"Fix slip {i}",
+                             f"2025-05-14T06:{i // 60 % 60:02d}:{i % 60:02d}.{i:06d}", "Resolved"])
+
+@case("legacy_import")
+def bench_legacy_import(options: Dict) -> Iterator[Result]:
+    import tracemalloc
+    from modules.legacy_import import LegacyImporter
+    workdir = options["workdir"]
+    inputs = [("xlsx", 10000), ("xlsx", 200000), ("csv", 300000)]
+    for kind, rows in inputs:
+        path = os.path.join(workdir, f"legacy_{rows}.{kind}")
+        (_write_legacy_workbook if kind == "xlsx" else _write_legacy_requests)(path, rows)
+
+        def run():
+            fake_backend()
+            LegacyImporter().run([path])
+        seconds = measure(run, 1)
+        # Separate traced dry run: tracemalloc slows the import down, and the
+        # fake keeps every written row in memory, which is not the importer's
+        tracemalloc.start()
+        LegacyImporter(dry_run=True).run([path])
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        yield f"legacy_import[{kind}, {rows} rows]", seconds, {
+            "rows_per_second": round(rows / seconds),
+            "peak_traced_bytes": peak,
+        }
+
+HEAVY_MODULES = ["pandas", "numpy", "PIL", "pyarrow", "gspread", "oauth2client", "google.auth", "supabase"]
+
+_IMPORT_PROBE = """
+import json, sys, time
+start = time.perf_counter()
+for name in sys.argv[1].split(","):
+    __import__(name)
+seconds = time.perf_counter() - start
+print(json.dumps({"seconds": seconds, "heavy": [m for m in sys.argv[2].split(",") if m in sys.modules]}))
+"""
+
+_FIRST_PAINT_PROBE = """
+import json, time
+start = time.perf_counter()
+from streamlit.testing.v1 import AppTest
+app = AppTest.from_file("streamlit_app.py")
+app.secrets["ADMIN_SECRET"] = "bench-admin"
+app.run(timeout=60)
+print(json.dumps({"seconds": time.perf_counter() - start, "exception": bool(app.exception)}))
+"""
+
+def _probe(code: str, *args: str) -> Dict:
+    import json
+    import subprocess
+    import sys
+    output = subprocess.run(
+        [sys.executable, "-c", code, *args], capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+@case("startup")
+def bench_startup(options: Dict) -> Iterator[Result]:
+    # Each measurement runs in a fresh interpreter, as on a cold container
+    imports = {
+        "login": "streamlit,modules.directory,modules.metrics,modules.jobs",
+        "admin": "streamlit,modules.admin",
+        "branch": "streamlit,modules.branch",
+    }
+    for label, modules in imports.items():
+        runs = [_probe(_IMPORT_PROBE, modules, ",".join(HEAVY_MODULES)) for _ in range(max(1, options["repeat"]))]
+        yield f"startup.import[{label}]", statistics.median(run["seconds"] for run in runs), {
+            "heavy_modules": runs[0]["heavy"],
+        }
+    runs = [_probe(_FIRST_PAINT_PROBE) for _ in range(max(1, options["repeat"]))]
+    yield "startup.first_paint[login]", statistics.median(run["seconds"] for run in runs), {
+        "exception": runs[0]["exception"],
+    }
@@ -0,0 +1,104 @@
+"""In-memory stand-in for the parts of gspread used by the sheet sync.
+
+Worksheets are sparse {(row, col): value} grids and every API call is
+counted in `FakeClient.calls`, so sync behaviour and quota use can be
+checked without Google credentials.
+"""
+import re
+from collections import Counter
+from typing import Dict, List
+import gspread
+
+_A1 = re.compile(r"([A-Z]+)(\d+):([A-Z]+)(\d+)")
+
+def _col_number(letters: str) -> int:
+    number = 0
+    for letter in letters:
+        number = number * 26 + ord(letter) - 64
+    return number
+
+def _parse_range(a1: str):
+    first_col, first_row, last_col, last_row = _A1.fullmatch(a1).groups()
+    return int(first_row), _col_number(first_col), int(last_row), _col_number(last_col)
+
+class FakeWorksheet:
+    def __init__(self, client, title: str, rows: int = 100, cols: int = 20):
+        self.client = client
+        self.title = title
+        self.row_count = int(rows)
+        self.col_count = int(cols)
+        self.cells: Dict[tuple, object] = {}
+
+    def _write(self, first_row, first_col, values):
+        for r, row in enumerate(values):
+            for c, value in enumerate(row):
+                if first_row + r > self.row_count or first_col + c > self.col_count:
+                    raise ValueError("Range exceeds grid limits")
+                if value == "":
+                    self.cells.pop((first_row + r, first_col + c), None)
+                else:
+                    self.cells[(first_row + r, first_col + c)] = value
+
+    def clear(self):
+        self.client.calls["clear"] += 1
+        self.cells.clear()
+
+    def resize(self, rows=None, cols=None):
+        self.client.calls["resize"] += 1
+        self.row_count = int(rows or self.row_count)
+        self.col_count = int(cols or self.col_count)
+
+    def batch_update(self, data: List[Dict], **kwargs):
+        self.client.calls["batch_update"] += 1
+        for item in data:
+            first_row, first_col, _, _ = _parse_range(item["range"])
+            self._write(first_row, first_col, item["values"])
+
+    def batch_clear(self, ranges: List[str]):
+        self.client.calls["batch_clear"] += 1
+        for a1 in ranges:
+            first_row, first_col, last_row, last_col = _parse_range(a1)
+            for key in [k for k in self.cells if first_row <= k[0] <= last_row and first_col <= k[1] <= last_col]:
+                del self.cells[key]
+
+    def get_all_values(self) -> List[List]:
+        self.client.calls["get_all_values"] += 1
+        if not self.cells:
+            return []
+        rows = max(r for r, _ in self.cells)
+        cols = max(c for _, c in self.cells)
+        return [[self.cells.get((r, c), "") for c in range(1, cols + 1)] for r in range(1, rows + 1)]
+
+class FakeSpreadsheet:
+    def __init__(self, client, title: str):
+        self.client = client
+        self.title = title
+        self.worksheets: Dict[str, FakeWorksheet] = {}
+
+    @property
+    def sheet1(self) -> FakeWorksheet:
+        if not self.worksheets:
+            self.worksheets["Sheet1"] = FakeWorksheet(self.client, "Sheet1")
+        return next(iter(self.worksheets.values()))
+
+    def worksheet(self, title: str) -> FakeWorksheet:
+        self.client.calls["worksheet"] += 1
+        if title not in self.worksheets:
+            raise gspread.exceptions.WorksheetNotFound(title)
+        return self.worksheets[title]
+
+    def add_worksheet(self, title: str, rows=100, cols=20) -> FakeWorksheet:
+        self.client.calls["add_worksheet"] += 1
+        self.worksheets[title] = FakeWorksheet(self.client, title, rows, cols)
+        return self.worksheets[title]
+
+class FakeClient:
+    def __init__(self):
+        self.calls = Counter()
+        self.spreadsheets: Dict[str, FakeSpreadsheet] = {}
+
+    def open(self, title: str) -> FakeSpreadsheet:
+        self.calls["open"] += 1
+        if title not in self.spreadsheets:
+            self.spreadsheets[title] = FakeSpreadsheet(self, title)
+        return self.spreadsheets[title]
@@ -0,0 +1,425 @@
+"""In-memory stand-in for the parts of the Supabase client used by the app.
+
+Tables are lists of row dicts queried through a PostgREST-like builder
+(select/insert/upsert/update/delete with eq, lt, gte, in_, order, range
+and limit). Unique keys mirror the real tables, so idempotent upserts and
+duplicate riders behave as they do against Postgres, and slip status
+changes and deletes are logged to slip_status_changes like the trigger in
+migrations/003_slip_status_changes.sql. Every request is
+counted in `FakeSupabase.calls` and can be delayed by `latency` seconds to
+model the network round-trip. Used by the benchmarks and load tests via
+SupabaseRepository(FakeSupabase()).
+"""
+import bisect
+import datetime
+import itertools
+import operator
+import threading
+import time
+from collections import Counter
+from types import SimpleNamespace
+from typing import Dict, Iterable, List, Optional, Tuple
+
+UNIQUE_KEYS = {
+    "branches": [("code",)],
+    "riders": [("branch_code", "name")],
+    "slips": [("idempotency_key",)],
+}
+DEFAULTS = {
+    "slips": {"status": "pending"},
+    "change_requests": {"status": "pending"},
+}
+_STATUS_CHANGE_FIELDS = (
+    "idempotency_key", "branch_code", "week", "rider_name", "slip_type", "quantity", "commission",
+)
+_OPS = {
+    "eq": operator.eq,
+    "neq": operator.ne,
+    "lt": operator.lt,
+    "lte": operator.le,
+    "gt": operator.gt,
+    "gte": operator.ge,
+    "in": lambda value, options: value in options,
+}
+
+class FakeAPIError(Exception):
+    """Raised like postgrest.APIError, with the Postgres error code"""
+
+    def __init__(self, message: str, code: str):
+        super().__init__(message)
+        self.code = code
+
+_RANGE_OPS = ("lt", "lte", "gt", "gte")
+
+def _row_matches(filters: List[Tuple[str, str, object]], row: Dict) -> bool:
+    for column, op, value in filters:
+        current = row.get(column)
+        # Comparisons with NULL are never true in SQL
+        if current is None or not _OPS[op](current, value):
+            return False
+    return True
+
+def _window(rows: Iterable[Dict], offset: int, limit: Optional[int]) -> Iterable[Dict]:
+    stop = None if limit is None else offset + limit
+    return itertools.islice(rows, offset, stop)
+
+def _sort_key(column: str):
+    # Postgres puts NULLs last in ascending order and first in descending order
+    return lambda row: (row.get(column) is None, row.get(column))
+
+class FakeQuery:
+    def __init__(self, client: "FakeSupabase", table: str):
+        self.client = client
+        self.table = table
+        self._action = "select"
+        self._columns: Optional[List[str]] = None
+        self._payload = None
+        self._on_conflict: Optional[Tuple[str, ...]] = None
+        self._ignore_duplicates = False
+        self._filters: List[Tuple[str, str, object]] = []
+        self._orders: List[Tuple[str, bool]] = []
+        self._offset = 0
+        self._limit: Optional[int] = None
+
+    # Actions
+    def select(self, columns: str = "*", count=None):
+        self._action = "select"
+        if columns.strip() != "*":
+            self._columns = [column.strip() for column in columns.split(",")]
+        return self
+
+    def insert(self, rows):
+        self._action = "insert"
+        self._payload = rows if isinstance(rows, list) else [rows]
+        return self
+
+    def upsert(self, rows, on_conflict: str = "", ignore_duplicates: bool = False):
+        self._action = "upsert"
+        self._payload = rows if isinstance(rows, list) else [rows]
+        self._on_conflict = tuple(c.strip() for c in on_conflict.split(",")) if on_conflict else ("id",)
+        self._ignore_duplicates = ignore_duplicates
+        return self
+
+    def update(self, fields: Dict):
+        self._action = "update"
+        self._payload = dict(fields)
+        return self
+
+    def delete(self):
+        self._action = "delete"
+        return self
+
+    # Filters and modifiers
+    def _filter(self, column: str, op: str, value):
+        self._filters.append((column, op, value))
+        return self
+
+    def eq(self, column, value):
+        return self._filter(column, "eq", value)
+
+    def neq(self, column, value):
+        return self._filter(column, "neq", value)
+
+    def lt(self, column, value):
+        return self._filter(column, "lt", value)
+
+    def lte(self, column, value):
+        return self._filter(column, "lte", value)
+
+    def gt(self, column, value):
+        return self._filter(column, "gt", value)
+
+    def gte(self, column, value):
+        return self._filter(column, "gte", value)
+
+    def in_(self, column, values: Iterable):
+        return self._filter(column, "in", set(values))
+
+    def order(self, column: str, desc: bool = False):
+        self._orders.append((column, desc))
+        return self
+
+    def range(self, start: int, end: int):
+        self._offset = start
+        self._limit = end - start + 1
+        return self
+
+    def limit(self, count: int):
+        self._limit = count
+        return self
+
+    def _matches(self, row: Dict) -> bool:
+        return _row_matches(self._filters, row)
+
+    def _project(self, row: Dict) -> Dict:
+        if self._columns is None:
+            return dict(row)
+        return {column: row.get(column) for column in self._columns}
+
+    def _select(self) -> List[Dict]:
+        if not self._orders:
+            candidates = (row for row in self.client.tables.get(self.table, []) if self._matches(row))
+            return [self._project(row) for row in _window(candidates, self._offset, self._limit)]
+
+        rows, keys = self.client._sorted(self.table, tuple(self._orders))
+        start, end = 0, len(rows)
+        residual = self._filters
+        if keys is not None:
+            # Single-column order: range filters on that column become a bisect
+            column, desc = self._orders[0]
+            residual = []
+            for filter_column, op, value in self._filters:
+                if filter_column != column or op not in _RANGE_OPS or value is None:
+                    residual.append((filter_column, op, value))
+                    continue
+                end = min(end, bisect.bisect_left(keys, (True,)))
+                if op in ("gt", "gte"):
+                    find = bisect.bisect_right if op == "gt" else bisect.bisect_left
+                    start = max(start, find(keys, (False, value)))
+                else:
+                    find = bisect.bisect_left if op == "lt" else bisect.bisect_right
+                    end = min(end, find(keys, (False, value)))
+            if not residual:
+                # Nothing left to filter: offset and limit are plain slices
+                stop = end - start if self._limit is None else min(end - start, self._offset + self._limit)
+                picked = range(end - 1 - self._offset, end - 1 - stop, -1) if desc else range(start + self._offset, start + stop)
+                return [self._project(rows[i]) for i in picked]
+            indexes = range(end - 1, start - 1, -1) if desc else range(start, end)
+            candidates = (rows[i] for i in indexes)
+        else:
+            candidates = iter(rows)
+        matching = (row for row in candidates if _row_matches(residual, row))
+        return [self._project(row) for row in _window(matching, self._offset, self._limit)]
+
+    def execute(self):
+        client = self.client
+        client.calls[f"{self.table}.{self._action}"] += 1
+        if client.latency:
+            time.sleep(client.latency)
+        with client._lock:
+            if self._action == "select":
+                return SimpleNamespace(data=self._select(), count=None)
+            if self._action == "insert":
+                return SimpleNamespace(data=client._insert(self.table, self._payload), count=None)
+            if self._action == "upsert":
+                return SimpleNamespace(data=client._upsert(
+                    self.table, self._payload, self._on_conflict, self._ignore_duplicates
+                ), count=None)
+            matched = [row for row in client.tables.get(self.table, []) if self._matches(row)]
+            if self._action == "update":
+                return SimpleNamespace(data=client._update(self.table, matched, self._payload), count=None)
+            return SimpleNamespace(data=client._delete(self.table, matched), count=None)
+
+class FakeBucket:
+    def __init__(self, client: "FakeSupabase", name: str):
+        self.client = client
+        self.name = name
+
+    def upload(self, path: str, data: bytes, file_options: Optional[Dict] = None):
+        self.client.calls[f"storage.{self.name}.upload"] += 1
+        if self.client.latency:
+            time.sleep(self.client.latency)
+        with self.client._lock:
+            files = self.client.files.setdefault(self.name, {})
+            if path in files:
+                raise FakeAPIError(f"The resource already exists: {path}", "409")
+            files[path] = bytes(data)
+        return SimpleNamespace(path=path)
+
+    def download(self, path: str) -> bytes:
+        self.client.calls[f"storage.{self.name}.download"] += 1
+        if self.client.latency:
+            time.sleep(self.client.latency)
+        try:
+            return self.client.files[self.name][path]
+        except KeyError:
+            raise FakeAPIError(f"Object not found: {path}", "404")
+
+class FakeStorage:
+    def __init__(self, client: "FakeSupabase"):
+        self.client = client
+
+    def from_(self, bucket: str) -> FakeBucket:
+        return FakeBucket(self.client, bucket)
+
+class FakeSupabase:
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.calls = Counter()
+        self.tables: Dict[str, List[Dict]] = {}
+        self.files: Dict[str, Dict[str, bytes]] = {}
+        self._lock = threading.RLock()
+        self._next_id: Dict[str, int] = {}
+        self._unique: Dict[Tuple[str, Tuple[str, ...]], Dict[tuple, Dict]] = {}
+        self._versions = Counter()
+        self._indexes: Dict[tuple, Tuple[int, List[Dict], Optional[List[tuple]]]] = {}
+
+    def table(self, name: str) -> FakeQuery:
+        return FakeQuery(self, name)
+
+    @property
+    def storage(self) -> FakeStorage:
+        return FakeStorage(self)
+
+    def seed(self, table: str, rows: Iterable[Dict]) -> int:
+        """Bulk-load rows without counting calls, e.g. to build a large fixture"""
+        with self._lock:
+            return len(self._insert(table, list(rows), copy=False))
+
+    def _sorted(self, table: str, orders: Tuple[Tuple[str, bool], ...]) -> Tuple[List[Dict], Optional[List[tuple]]]:
+        """Rows in the requested order, cached until the table changes.
+
+        For a single ascending-sorted column the sort keys are returned too
+        so range filters on it can be bisected (descending reads walk the
+        same list backwards).
+        """
+        if len(orders) == 1:
+            orders = ((orders[0][0], False),)
+        version = self._versions[table]
+        cached = self._indexes.get((table, orders))
+        if cached is None or cached[0] != version:
+            rows = list(self.tables.get(table, []))
+            for column, desc in reversed(orders):
+                rows.sort(key=_sort_key(column), reverse=desc)
+            keys = [_sort_key(orders[0][0])(row) for row in rows] if len(orders) == 1 else None
+            cached = (version, rows, keys)
+            self._indexes[(table, orders)] = cached
+        return cached[1], cached[2]
+
+    def _unique_index(self, table: str, columns: Tuple[str, ...]) -> Dict[tuple, Dict]:
+        index = self._unique.get((table, columns))
+        if index is None:
+            index = {}
+            for row in self.tables.get(table, []):
+                key = tuple(row.get(c) for c in columns)
+                if None not in key:
+                    index[key] = row
+            self._unique[(table, columns)] = index
+        return index
+
+    def _constraints(self, table: str) -> List[Tuple[str, ...]]:
+        return [("id",)] + UNIQUE_KEYS.get(table, [])
+
+    def _conflict(self, table: str, row: Dict, pending: Dict) -> Optional[Tuple[str, ...]]:
+        for columns in self._constraints(table):
+            key = tuple(row.get(c) for c in columns)
+            if None in key:
+                continue
+            if key in self._unique_index(table, columns) or key in pending.get(columns, ()):
+                return columns
+        return None
+
+    def _duplicate(self, table: str, columns: Tuple[str, ...]):
+        return FakeAPIError(
+            f'duplicate key value violates unique constraint "{table}_{"_".join(columns)}_key"', "23505"
+        )
+
+    def _insert(self, table: str, rows: List[Dict], copy: bool = True) -> List[Dict]:
+        prepared, pending = [], {}
+        next_id = self._next_id.get(table, 1)
+        for row in rows:
+            if copy:
+                row = {**DEFAULTS.get(table, {}), **row}
+            else:
+                for column, value in DEFAULTS.get(table, {}).items():
+                    row.setdefault(column, value)
+            if row.get("id") is None:
+                row["id"] = next_id
+                next_id += 1
+            else:
+                next_id = max(next_id, row["id"] + 1)
+            conflict = self._conflict(table, row, pending)
+            if conflict:
+                raise self._duplicate(table, conflict)
+            for columns in self._constraints(table):
+                pending.setdefault(columns, set()).add(tuple(row.get(c) for c in columns))
+            prepared.append(row)
+        # The whole batch is validated before anything is written, like one statement
+        self._next_id[table] = next_id
+        self.tables.setdefault(table, []).extend(prepared)
+        for columns in self._constraints(table):
+            index = self._unique_index(table, columns)
+            for row in prepared:
+                key = tuple(row.get(c) for c in columns)
+                if None not in key:
+                    index[key] = row
+        self._versions[table] += 1
+        return [dict(row) for row in prepared]
+
+    def _upsert(self, table: str, rows: List[Dict], on_conflict: Tuple[str, ...],
+                ignore_duplicates: bool) -> List[Dict]:
+        index = self._unique_index(table, on_conflict)
+        new_rows, written, seen = [], [], set()
+        for row in rows:
+            key = tuple(row.get(c) for c in on_conflict)
+            existing = index.get(key) if None not in key else None
+            if existing is None and key in seen and None not in key:
+                raise FakeAPIError("ON CONFLICT DO UPDATE command cannot affect row a second time", "21000")
+            seen.add(key)
+            if existing is None:
+                new_rows.append(row)
+            elif not ignore_duplicates:
+                written.extend(self._update(table, [existing], {k: v for k, v in row.items() if k != "id"}))
+        return self._insert(table, new_rows) + written
+
+    def _update(self, table: str, rows: List[Dict], fields: Dict) -> List[Dict]:
+        for columns in self._constraints(table):
+            if not any(c in fields for c in columns):
+                continue
+            index = self._unique_index(table, columns)
+            new_keys = set()
+            for row in rows:
+                key = tuple(fields.get(c, row.get(c)) for c in columns)
+                if None in key:
+                    continue
+                owner = index.get(key)
+                if (owner is not None and owner is not row) or key in new_keys:
+                    raise self._duplicate(table, columns)
+                new_keys.add(key)
+        for columns in self._constraints(table):
+            if any(c in fields for c in columns):
+                index = self._unique_index(table, columns)
+                for row in rows:
+                    index.pop(tuple(row.get(c) for c in columns), None)
+                for row in rows:
+                    key = tuple(fields.get(c, row.get(c)) for c in columns)
+                    if None not in key:
+                        index[key] = row
+        if table == "slips" and "status" in fields:
+            self._log_status_changes(
+                [row for row in rows if row.get("status") != fields["status"]], fields["status"]
+            )
+        for row in rows:
+            row.update(fields)
+        if rows:
+            self._versions[table] += 1
+        return [dict(row) for row in rows]
+
+    def _log_status_changes(self, rows: List[Dict], new_status: Optional[str]):
+        if not rows:
+            return
+        changed_at = datetime.datetime.now(datetime.timezone.utc).isoformat()
+        self._insert("slip_status_changes", [
+            {
+                "slip_id": row["id"],
+                **{column: row.get(column) for column in _STATUS_CHANGE_FIELDS},
+                "old_status": row.get("status"),
+                "new_status": new_status,
+                "changed_at": changed_at,
+            }
+            for row in rows
+        ], copy=False)
+
+    def _delete(self, table: str, rows: List[Dict]) -> List[Dict]:
+        if not rows:
+            return []
+        doomed = {id(row) for row in rows}
+        self.tables[table] = [row for row in self.tables[table] if id(row) not in doomed]
+        for (index_table, columns), index in self._unique.items():
+            if index_table == table:
+                for row in rows:
+                    index.pop(tuple(row.get(c) for c in columns), None)
+        self._versions[table] += 1
+        if table == "slips":
+            self._log_status_changes(rows, None)
+        return [dict(row) for row in rows]
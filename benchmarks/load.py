@@ -0,0 +1,437 @@
+"""Simulate concurrent branch managers and admins against one app process.
+
+    python -m benchmarks.load                          # 10 sessions, 2 scenarios each
+    python -m benchmarks.load --sessions 50 --latency 0.02
+    python -m benchmarks.load --sessions 20 --admin-share 0.5 --slips 5
+
+Every simulated session drives streamlit_app.py through Streamlit's
+AppTest in its own thread, against an in-process FakeSupabase (with
+--latency seconds added to every backend call). A branch scenario logs
+in, adds --slips slips through the real form (each with a distinct
+generated image and transaction ID) and submits them; an admin scenario
+logs in, filters slips by status and branch and pages forward. Each
+script run is one step; the report gives throughput, p50/p95/p99
+latency per step and the process memory per concurrent session, and is
+written as JSON to benchmarks/results/load.json. Each session is reported
+to modules.metrics under its own id (load-<session>-<iteration>).
+
+AppTest exists from Streamlit 1.28, but AppTest.file_uploader only from
+1.60. On older releases, including the pinned 1.28.0, a branch scenario
+prepares each slip with the form's own prepare_uploaded_image() and puts
+it into the session's slip_entries and pending_uploads, then reruns the
+page; those runs are reported as add_slip_staged instead of add_slip.
+"""
+import argparse
+import io
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, List, Optional
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_FILE = os.path.join(os.path.dirname(BENCH_DIR), "streamlit_app.py")
+RESULTS_FILE = os.path.join(BENCH_DIR, "results", "load.json")
+ADMIN_SECRET = "load-admin"
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[max(0, min(len(ordered) - 1, round(pct / 100 * len(ordered) + 0.5) - 1))]
+
+def _rss() -> int:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+class MemorySampler(threading.Thread):
+    """Track peak RSS while the load runs"""
+
+    def __init__(self, interval: float = 0.05):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.peak = _rss()
+        self._done = threading.Event()
+
+    def run(self):
+        while not self._done.wait(self.interval):
+            self.peak = max(self.peak, _rss())
+
+    def stop(self) -> int:
+        self._done.set()
+        self.join()
+        return self.peak
+
+def slip_image(seed: int) -> bytes:
+    """A distinct PNG per slip, so exact and perceptual duplicate checks pass"""
+    from PIL import Image, ImageDraw
+    rng = random.Random(seed)
+    image = Image.new("RGB", (800, 600), tuple(rng.randrange(256) for _ in range(3)))
+    draw = ImageDraw.Draw(image)
+    for _ in range(40):
+        x, y = rng.randrange(800), rng.randrange(600)
+        draw.rectangle([x, y, x + rng.randrange(40, 300), y + rng.randrange(40, 200)],
+                       fill=tuple(rng.randrange(256) for _ in range(3)))
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+@contextmanager
+def concurrent_apptest(secrets: Dict[str, str]):
+    """Let several AppTest sessions run in threads of one process.
+
+    AppTest is written for one test at a time: every run installs a mock
+    Runtime as the process-wide singleton and clears it when done, swaps
+    st.secrets, patches config.get_option, and compiles the script afresh
+    (ast.parse is not thread-safe on CPython 3.11). The real server shares
+    one Runtime, one set of secrets and one script cache across sessions,
+    so do the same here.
+    """
+    from unittest.mock import patch
+    import streamlit as st
+    from streamlit import config
+    from streamlit.runtime.secrets import Secrets
+    from streamlit.runtime import Runtime
+    from streamlit.runtime.scriptrunner.script_cache import ScriptCache
+    from streamlit.testing.v1.local_script_runner import LocalScriptRunner
+    from modules import metrics
+
+    last_runtime = []
+    bytecode = {}
+    compile_lock = threading.Lock()
+    get_option = config.get_option
+
+    def instance(cls):
+        if cls._instance is not None:
+            last_runtime[:] = [cls._instance]
+            return cls._instance
+        if last_runtime:
+            return last_runtime[0]
+        raise RuntimeError("Runtime hasn't been created!")
+
+    def exists(cls):
+        return cls._instance is not None or bool(last_runtime)
+
+    def start(self):
+        # The script runs in a new thread; carry over the session id the
+        # simulated session bound, or every session reports as AppTest's
+        # fixed "test session id"
+        self._run_script_thread = metrics.scoped(self._run_script_thread)
+        original_start(self)
+
+    def get_bytecode(self, script_path):
+        with compile_lock:
+            if script_path not in bytecode:
+                bytecode[script_path] = original_get_bytecode(self, script_path)
+            return bytecode[script_path]
+
+    original_get_bytecode = ScriptCache.get_bytecode
+    original_start = LocalScriptRunner.start
+    try:
+        shared_secrets = Secrets()
+    except TypeError:
+        # Older releases (1.28) take the secrets.toml paths to watch
+        shared_secrets = Secrets([])
+    shared_secrets._secrets = dict(secrets)
+    with patch.object(Runtime, "instance", classmethod(instance)), \
+            patch.object(Runtime, "exists", classmethod(exists)), \
+            patch.object(ScriptCache, "get_bytecode", get_bytecode), \
+            patch.object(LocalScriptRunner, "start", start), \
+            patch.object(st, "secrets", shared_secrets), \
+            patch.object(config, "get_option",
+                         lambda key: True if key == "global.appTest" else get_option(key)):
+        yield
+
+class UploadedFile:
+    """The parts of Streamlit's UploadedFile the slip form uses"""
+
+    def __init__(self, name: str, data: bytes):
+        self.name = name
+        self._data = data
+
+    def getvalue(self) -> bytes:
+        return self._data
+
+def stage_slip(app, code: str, rider: str, seed: int):
+    """Queue one slip in the session the way the Add Slip form does, without the uploader"""
+    from modules.utils import calculate_commission, generate_week_ranges, prepare_uploaded_image
+    from modules.submission import new_idempotency_key
+    entries = list(app.session_state["slip_entries"])
+    uploads = dict(app.session_state["pending_uploads"])
+    week = generate_week_ranges()[0][0]
+    quantity = seed % 5 + 1
+    image_info, upload = prepare_uploaded_image(
+        UploadedFile(f"slip_{seed}.png", slip_image(seed)), code, rider, pending=entries
+    )
+    entries.append({
+        "rider_name": rider,
+        "slip_type": "Cash Slip",
+        "quantity": quantity,
+        "transaction_id": f"{seed:010d}",
+        "manager_name": "Load Test",
+        **image_info,
+        "week": week,
+        "branch_code": code,
+        "commission": calculate_commission("Cash Slip", quantity, on=week[:10]),
+        "submitted_at": datetime.now().isoformat(),
+        "status": "pending",
+        "idempotency_key": new_idempotency_key()
+    })
+    uploads[upload["path"]] = upload
+    app.session_state["slip_entries"] = entries
+    app.session_state["pending_uploads"] = uploads
+
+def _find(elements, label: str):
+    for element in elements:
+        if element.label == label:
+            return element
+    raise LookupError(f"No widget labelled {label!r}")
+
+class Session:
+    """One simulated browser session; every script run is timed as a step"""
+
+    def __init__(self, report: "Report", timeout: float, session_id: str):
+        from streamlit.testing.v1 import AppTest
+        self.report = report
+        self.timeout = timeout
+        self.session_id = session_id
+        # Secrets are installed once for all sessions by concurrent_apptest()
+        self.app = AppTest.from_file(APP_FILE, default_timeout=timeout)
+
+    def step(self, name: str, action=None, offset: float = 0.0):
+        """Run the script once and report it as `name`, plus `offset` seconds spent before the run"""
+        from modules import metrics
+        # Picked up by concurrent_apptest() for the script thread of this run
+        metrics._local.session_id = self.session_id
+        start = time.perf_counter() - offset
+        error = None
+        try:
+            (action or self.app).run(timeout=self.timeout)
+            if self.app.exception:
+                error = self.app.exception[0].message
+            elif self.app.error:
+                error = self.app.error[0].value
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+        self.report.add(name, time.perf_counter() - start, error)
+        return error is None
+
+    def login(self, code: str) -> bool:
+        return self.step("login_page") and self.step(
+            "open_admin" if code == ADMIN_SECRET else "open_branch",
+            _find(self.app.text_input, "Enter Branch Code").input(code)
+        )
+
+def branch_scenario(session: Session, code: str, riders: List[str], slips: int, new_seed):
+    if not session.login(code):
+        return
+    from streamlit.testing.v1 import AppTest
+    app = session.app
+    for _ in range(slips):
+        seed = new_seed()
+        rider = riders[seed % len(riders)]
+        if not hasattr(AppTest, "file_uploader"):
+            # Preparing the image is part of the timed step, as in the form
+            start = time.perf_counter()
+            try:
+                stage_slip(app, code, rider, seed)
+            except Exception as e:
+                session.report.add("add_slip_staged", time.perf_counter() - start, f"{type(e).__name__}: {e}")
+                return
+            if not session.step("add_slip_staged", offset=time.perf_counter() - start):
+                return
+            continue
+        # Cash slips only: the ID field's label follows the slip type, so
+        # switching type inside the form would reset the typed ID
+        _find(app.selectbox, "Rider").select(rider)
+        _find(app.radio, "Slip Type").set_value("Cash Slip")
+        _find(app.number_input, "Quantity").set_value(seed % 5 + 1)
+        _find(app.text_input, "Serial Number").input(f"{seed:010d}")
+        _find(app.text_input, "Manager Name").input("Load Test")
+        app.file_uploader[0].set_value((f"slip_{seed}.png", slip_image(seed), "image/png"))
+        if not session.step("add_slip", _find(app.button, "Add Slip").click()):
+            return
+    session.step("submit_all", _find(app.button, "Submit All Slips").click())
+
+def admin_scenario(session: Session, branch_codes: List[str]):
+    if not session.login(ADMIN_SECRET):
+        return
+    app = session.app
+    if not session.step("admin_filter", _find(app.selectbox, "Filter by Status").select("pending")):
+        return
+    session.step("admin_filter", _find(app.selectbox, "Filter by Branch").select(random.choice(branch_codes)))
+    next_page = [b for b in app.button if b.label == "Next" and not b.disabled and b.key is None]
+    if next_page:
+        session.step("admin_next_page", next_page[0].click())
+
+class Report:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.timings = defaultdict(list)
+        self.errors = defaultdict(list)
+
+    def add(self, step: str, seconds: float, error: Optional[str]):
+        with self._lock:
+            self.timings[step].append(seconds)
+            if error:
+                self.errors[step].append(error)
+
+    def steps(self) -> Dict[str, Dict]:
+        return {
+            step: {
+                "count": len(values),
+                "errors": len(self.errors[step]),
+                "mean_ms": round(statistics.mean(values) * 1000, 1),
+                "p50_ms": round(percentile(values, 50) * 1000, 1),
+                "p95_ms": round(percentile(values, 95) * 1000, 1),
+                "p99_ms": round(percentile(values, 99) * 1000, 1),
+            }
+            for step, values in self.timings.items()
+        }
+
+def _setup(branches: int, riders_per_branch: int, latency: float):
+    from benchmarks.cases import fake_backend
+    client = fake_backend(branches=branches, riders_per_branch=riders_per_branch)
+    client.latency = latency
+    return client
+
+def _drain(timeout: float) -> float:
+    """Wait for the background job queue to finish the submitted slips"""
+    from modules.jobs import get_job_queue
+    queue = get_job_queue()
+    start = time.perf_counter()
+    while time.perf_counter() - start < timeout:
+        counts = queue.counts()
+        if not counts["queued"] and not counts["running"]:
+            break
+        time.sleep(0.1)
+    return time.perf_counter() - start
+
+def run_load(sessions: int, iterations: int, slips: int, admin_share: float, latency: float,
+             branches: int, timeout: float) -> Dict:
+    from modules import metrics
+    from modules.jobs import get_job_queue
+    client = _setup(branches, 5, latency)
+    branch_codes = [f"BR{i:05d}" for i in range(branches)]
+    riders = [f"Rider {j}" for j in range(5)]
+    # Seeds make every transaction ID and image unique across sessions and runs
+    seeds = [random.randrange(10 ** 6) * 10 ** 3]
+    seeds_lock = threading.Lock()
+
+    def new_seed() -> int:
+        with seeds_lock:
+            seeds[0] += 1
+            return seeds[0]
+
+    report = Report()
+    admins = round(sessions * admin_share)
+
+    def simulate(index: int):
+        for iteration in range(iterations):
+            session = Session(report, timeout, f"load-{index}-{iteration}")
+            try:
+                if index < admins:
+                    admin_scenario(session, branch_codes)
+                else:
+                    branch_scenario(session, branch_codes[index % branches], riders, slips, new_seed)
+            except LookupError as e:
+                # The page did not render what the scenario expected next
+                report.add("scenario", 0.0, str(e))
+
+    with concurrent_apptest({"ADMIN_SECRET": ADMIN_SECRET}):
+        # Warm imports and caches outside the measurement
+        Session(Report(), timeout, "load-warmup").step("warmup")
+        get_job_queue()
+        base_rss = _rss()
+        sampler = MemorySampler()
+        sampler.start()
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=sessions) as pool:
+            list(pool.map(simulate, range(sessions)))
+        wall = time.perf_counter() - start
+        peak_rss = sampler.stop()
+    drain = _drain(timeout)
+
+    steps = report.steps()
+    total_steps = sum(step["count"] for step in steps.values())
+    submitted = (sessions - admins) * iterations * slips
+    return {
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "config": {
+            "sessions": sessions, "iterations": iterations, "slips": slips, "admin_sessions": admins,
+            "latency": latency, "branches": branches,
+        },
+        "wall_seconds": round(wall, 2),
+        "steps_per_second": round(total_steps / wall, 2),
+        "scenarios_per_second": round(sessions * iterations / wall, 2),
+        "slips_expected": submitted,
+        "slips_inserted": len(client.tables.get("slips", [])),
+        "job_drain_seconds": round(drain, 2),
+        "memory": {
+            "base_rss_bytes": base_rss,
+            "peak_rss_bytes": peak_rss,
+            "per_session_bytes": (peak_rss - base_rss) // max(1, sessions),
+        },
+        "steps": steps,
+        "errors": {step: errors[:5] for step, errors in report.errors.items() if errors},
+        "backend": metrics.process_totals()[:15],
+    }
+
+def print_report(result: Dict):
+    config = result["config"]
+    print(f"\n{config['sessions']} sessions ({config['admin_sessions']} admin) x {config['iterations']} scenarios, "
+          f"{config['latency'] * 1000:.0f} ms backend latency")
+    print(f"{'step':<18} {'count':>6} {'errors':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for step, stats in result["steps"].items():
+        print(f"{step:<18} {stats['count']:>6} {stats['errors']:>6} {stats['p50_ms']:>9.1f} "
+              f"{stats['p95_ms']:>9.1f} {stats['p99_ms']:>9.1f}")
+    memory = result["memory"]
+    print(f"\nthroughput: {result['steps_per_second']} script runs/s, {result['scenarios_per_second']} scenarios/s "
+          f"over {result['wall_seconds']} s")
+    print(f"memory: {memory['per_session_bytes'] / 2 ** 20:.1f} MiB per session "
+          f"(peak RSS {memory['peak_rss_bytes'] / 2 ** 20:.0f} MiB)")
+    print(f"slips inserted: {result['slips_inserted']} of {result['slips_expected']} "
+          f"(job queue drained {result['job_drain_seconds']} s after the load)")
+    for step, errors in result["errors"].items():
+        print(f"errors in {step}: {errors[0]}")
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Concurrent-session load test of streamlit_app.py")
+    parser.add_argument("--sessions", type=int, default=10, help="concurrent simulated sessions")
+    parser.add_argument("--iterations", type=int, default=2, help="scenarios per session")
+    parser.add_argument("--slips", type=int, default=3, help="slips added per branch scenario")
+    parser.add_argument("--admin-share", type=float, default=0.2, help="fraction of sessions that are admins")
+    parser.add_argument("--latency", type=float, default=0.005, help="seconds added to every backend call")
+    parser.add_argument("--branches", type=int, default=50)
+    parser.add_argument("--timeout", type=float, default=120, help="seconds allowed per script run")
+    parser.add_argument("--output", default=RESULTS_FILE)
+    args = parser.parse_args(argv)
+
+    result = run_load(args.sessions, args.iterations, args.slips, args.admin_share, args.latency,
+                      args.branches, args.timeout)
+    print_report(result)
+    os.makedirs(os.path.dirname(args.output), exist_ok=True)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(result, f, indent=2)
+    failed = sum(stats["errors"] for stats in result["steps"].values())
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    from benchmarks.run import _isolate
+    with tempfile.TemporaryDirectory(prefix="slip_load_state_") as state_dir:
+        _isolate(state_dir)
+        os.environ.setdefault("JOB_POLL_INTERVAL", "0.1")
+        sys.exit(main())
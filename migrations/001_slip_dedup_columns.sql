@@ -0,0 +1,24 @@
+-- Columns the app writes on every slip insert, for duplicate detection
+-- and idempotent submission. Run once in the Supabase SQL editor (or
+-- psql) before deploying; every statement is safe to re-run. The SQLite
+-- backend creates the same schema itself.
+
+-- SHA-256 of the stored image (exact duplicates)
+ALTER TABLE slips ADD COLUMN IF NOT EXISTS image_hash text;
+CREATE INDEX IF NOT EXISTS idx_slips_image_hash ON slips (image_hash);
+
+-- 64-bit perceptual hash as 16 hex digits (near duplicates)
+ALTER TABLE slips ADD COLUMN IF NOT EXISTS image_phash text;
+
+-- One key per slip entry; inserts upsert on it with ignore-duplicates, so
+-- it needs a plain (non-partial) unique index. NULLs stay allowed for
+-- slips submitted before the column existed.
+ALTER TABLE slips ADD COLUMN IF NOT EXISTS idempotency_key text;
+CREATE UNIQUE INDEX IF NOT EXISTS idx_slips_idempotency_key ON slips (idempotency_key);
+
+-- Filters and duplicate checks used by the admin browser and indexes
+CREATE INDEX IF NOT EXISTS idx_slips_branch_code ON slips (branch_code);
+CREATE INDEX IF NOT EXISTS idx_slips_status ON slips (status);
+CREATE INDEX IF NOT EXISTS idx_slips_week ON slips (week);
+CREATE INDEX IF NOT EXISTS idx_slips_transaction_id ON slips (transaction_id);
+CREATE INDEX IF NOT EXISTS idx_slips_submitted_at ON slips (submitted_at);
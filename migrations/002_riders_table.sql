@@ -0,0 +1,9 @@
+-- Riders as one row per (branch_code, name) instead of the branches.riders
+-- array. Run once before deploying, then copy the existing arrays with
+-- `python -m modules.roster migrate` (re-runnable). Safe to re-run.
+
+CREATE TABLE IF NOT EXISTS riders (
+    branch_code text NOT NULL,
+    name text NOT NULL,
+    PRIMARY KEY (branch_code, name)
+);
@@ -0,0 +1,46 @@
+-- Log of slip status changes and deletes, read incrementally by the weekly
+-- rollups (modules/rollups.py) so a status set in one process reaches the
+-- totals of every other process within ROLLUP_REFRESH seconds. Safe to
+-- re-run. The SQLite backend creates the same table and triggers itself.
+
+CREATE TABLE IF NOT EXISTS slip_status_changes (
+    id bigserial PRIMARY KEY,
+    slip_id bigint NOT NULL,
+    idempotency_key text,
+    branch_code text,
+    week text,
+    rider_name text,
+    slip_type text,
+    quantity integer,
+    commission numeric,
+    old_status text,
+    -- NULL when the slip was deleted
+    new_status text,
+    changed_at timestamptz NOT NULL DEFAULT now()
+);
+
+CREATE OR REPLACE FUNCTION log_slip_status_change() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        INSERT INTO slip_status_changes (slip_id, idempotency_key, branch_code, week, rider_name, slip_type,
+                                         quantity, commission, old_status, new_status)
+        VALUES (OLD.id, OLD.idempotency_key, OLD.branch_code, OLD.week, OLD.rider_name, OLD.slip_type,
+                OLD.quantity, OLD.commission, OLD.status, NULL);
+        RETURN OLD;
+    END IF;
+    INSERT INTO slip_status_changes (slip_id, idempotency_key, branch_code, week, rider_name, slip_type,
+                                     quantity, commission, old_status, new_status)
+    VALUES (NEW.id, NEW.idempotency_key, NEW.branch_code, NEW.week, NEW.rider_name, NEW.slip_type,
+            NEW.quantity, NEW.commission, OLD.status, NEW.status);
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS slips_status_changed ON slips;
+CREATE TRIGGER slips_status_changed AFTER UPDATE OF status ON slips
+    FOR EACH ROW WHEN (OLD.status IS DISTINCT FROM NEW.status)
+    EXECUTE FUNCTION log_slip_status_change();
+
+DROP TRIGGER IF EXISTS slips_deleted ON slips;
+CREATE TRIGGER slips_deleted AFTER DELETE ON slips
+    FOR EACH ROW EXECUTE FUNCTION log_slip_status_change();
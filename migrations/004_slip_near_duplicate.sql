@@ -0,0 +1,9 @@
+-- Near-duplicate review flag. An upload whose perceptual hash is within
+-- PHASH_MAX_DISTANCE of another slip is still accepted; the nearest match
+-- is recorded here for an admin to review. Safe to re-run. The SQLite
+-- backend adds the same columns itself.
+
+-- image_path of the nearest match, NULL when nothing was close
+ALTER TABLE slips ADD COLUMN IF NOT EXISTS near_duplicate_of text;
+-- Hamming distance between the two perceptual hashes
+ALTER TABLE slips ADD COLUMN IF NOT EXISTS near_duplicate_distance integer;
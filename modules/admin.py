@@ -1,18 +1,38 @@
+import os
 import streamlit as st
-from supabase_client import get_supabase
+from modules.storage import get_repository
+from modules.directory import get_branch_directory
+from modules import metrics
+from modules import roster
+from modules.jobs import JOB_STATUSES, enqueue_sheet_sync, get_job_queue
+from modules.slip_query import SLIP_STATUSES, apply_slip_status_changes, fetch_slip_page
+from modules.thumbnails import get_thumbnail_cache
+from modules.change_requests import (
+    CHANGE_REQUEST_STATUSES,
+    apply_status_changes,
+    fetch_change_request_page,
+    status_changes
+)
+from modules.export import EXPORT_FORMATS, EXPORT_MAX_BYTES, export_slips
+from modules.rollups import get_weekly_rollups, verify_rollups
+from modules.utils import generate_week_ranges
 import pandas as pd
-from datetime import datetime
+from datetime import datetime, timedelta
 
 def show_admin_panel():
     """Display the admin management interface"""
     st.title("Admin Dashboard")
-    supabase = get_supabase()
+    metrics.set_page("admin")
+    repository = get_repository()
+    directory = get_branch_directory()
     
-    tab1, tab2, tab3, tab4 = st.tabs([
+    tab1, tab2, tab3, tab4, tab5, tab6 = st.tabs([
         "Branches", 
         "Riders", 
         "Slip Submissions", 
-        "Change Requests"
+        "Change Requests",
+        "Weekly Summary",
+        "Image Review"
     ])
     
     with tab1:
@@ -30,17 +50,18 @@ def show_admin_panel():
                         st.error("Both code and name are required")
                     else:
                         try:
-                            supabase.table('branches').insert({
+                            repository.insert_branch({
                                 "code": branch_code,
                                 "name": branch_name,
                                 "riders": []
-                            }).execute()
+                            })
+                            directory.invalidate(branch_code)
                             st.success("Branch added successfully!")
                         except Exception as e:
                             st.error(f"Failed to add branch: {str(e)}")
         
         # View/edit branches
-        branches = supabase.table('branches').select("*").execute().data
+        branches = directory.all()
         if branches:
             st.write("### Existing Branches")
             for branch in branches:
@@ -48,7 +69,8 @@ def show_admin_panel():
                     st.write(f"Riders: {', '.join(branch['riders']) if branch['riders'] else 'None'}")
                     if st.button(f"Delete {branch['code']}", key=f"del_{branch['code']}"):
                         try:
-                            supabase.table('branches').delete().eq('code', branch['code']).execute()
+                            repository.delete_branch(branch['code'])
+                            directory.invalidate(branch['code'])
                             st.rerun()
                         except Exception as e:
                             st.error(f"Failed to delete: {str(e)}")
@@ -67,25 +89,72 @@ def show_admin_panel():
                 add_rider = st.button("Add Rider")
                 
                 if add_rider and rider_name:
-                    branch = next(b for b in branches if b['code'] == branch_code)
-                    updated_riders = branch['riders'] + [rider_name] if branch['riders'] else [rider_name]
-                    
                     try:
-                        supabase.table('branches').update({
-                            "riders": updated_riders
-                        }).eq('code', branch_code).execute()
+                        roster.add_rider(branch_code, rider_name)
                         st.success("Rider added successfully!")
                         st.rerun()
                     except Exception as e:
                         st.error(f"Failed to add rider: {str(e)}")
         
-        # View all riders
-        st.write("### All Riders by Branch")
-        for branch in branches:
-            if branch['riders']:
-                st.write(f"**{branch['code']} - {branch['name']}**")
-                for rider in branch['riders']:
-                    st.write(f"- {rider}")
+        # Bulk import, one rider per line
+        with st.expander("Import Riders"):
+            if branches:
+                import_branch = st.selectbox(
+                    "Select Branch",
+                    options=[b['code'] for b in branches],
+                    key="import_branch"
+                )
+                names = st.text_area("Rider Names (one per line)")
+                # Shown after the rerun that refreshes the rider lists
+                imported = st.session_state.pop('riders_imported', None)
+                if imported:
+                    st.success(f"Imported {imported[0]} new riders into {imported[1]} (existing riders skipped)")
+                if st.button("Import Riders") and names:
+                    try:
+                        count = roster.import_riders(import_branch, names.splitlines())
+                        st.session_state.riders_imported = (count, import_branch)
+                        st.rerun()
+                    except Exception as e:
+                        st.error(f"Failed to import riders: {str(e)}")
+        
+        # Edit one branch's roster at a time; every rider row is a set of widgets
+        st.write("### Riders by Branch")
+        staffed = {f"{b['code']} - {b['name']}": b for b in branches if b['riders']}
+        if staffed:
+            branch = staffed[st.selectbox("Select Branch", options=list(staffed), key="roster_branch")]
+            st.caption(f"{len(branch['riders'])} riders")
+            for rider in branch['riders']:
+                col1, col2, col3, col4 = st.columns([3, 3, 1, 1])
+                col1.write(rider)
+                new_name = col2.text_input(
+                    "Rename",
+                    key=f"rename_{branch['code']}_{rider}",
+                    label_visibility="collapsed",
+                    placeholder="New name"
+                )
+                if col3.button("Save", key=f"save_{branch['code']}_{rider}", disabled=not new_name):
+                    try:
+                        roster.rename_rider(branch['code'], rider, new_name)
+                        st.rerun()
+                    except Exception as e:
+                        st.error(f"Failed to rename rider: {str(e)}")
+                if col4.button("Remove", key=f"remove_{branch['code']}_{rider}"):
+                    st.session_state.confirm_remove_rider = (branch['code'], rider)
+                
+                # Removal takes a second, explicit confirmation
+                if st.session_state.get('confirm_remove_rider') == (branch['code'], rider):
+                    st.warning(f"Remove {rider} from {branch['code']}?")
+                    confirm_col, cancel_col = st.columns(2)
+                    if confirm_col.button("Confirm Remove", key=f"confirm_remove_{branch['code']}_{rider}"):
+                        try:
+                            roster.remove_rider(branch['code'], rider)
+                            st.session_state.confirm_remove_rider = None
+                            st.rerun()
+                        except Exception as e:
+                            st.error(f"Failed to remove rider: {str(e)}")
+                    if cancel_col.button("Cancel", key=f"cancel_remove_{branch['code']}_{rider}"):
+                        st.session_state.confirm_remove_rider = None
+                        st.rerun()
     
     with tab3:
         st.subheader("Slip Submissions")
@@ -97,63 +166,399 @@ def show_admin_panel():
                 "Filter by Branch",
                 options=["All"] + [b['code'] for b in branches]
             )
+            week_filter = st.selectbox(
+                "Filter by Week",
+                options=["All"] + [week[0] for week in generate_week_ranges()]
+            )
         with col2:
             status_filter = st.selectbox(
                 "Filter by Status",
-                options=["All", "pending", "approved", "rejected"]
+                options=["All"] + SLIP_STATUSES
             )
+            date_range = st.date_input("Submitted between", value=())
         
-        # Get filtered slips
-        query = supabase.table('slips').select("*")
-        if branch_filter != "All":
-            query = query.eq('branch_code', branch_filter)
-        if status_filter != "All":
-            query = query.eq('status', status_filter)
+        filters = {
+            "branch_code": None if branch_filter == "All" else branch_filter,
+            "status": None if status_filter == "All" else status_filter,
+            "week": None if week_filter == "All" else week_filter,
+        }
+        if len(date_range) == 2:
+            filters["date_from"] = date_range[0].isoformat()
+            filters["date_to"] = (date_range[1] + timedelta(days=1)).isoformat()
         
-        slips = query.execute().data
+        # Keyset pagination: a stack of cursors, reset whenever the filters change
+        if st.session_state.get('slip_filters') != filters:
+            st.session_state.slip_filters = filters
+            st.session_state.slip_cursors = [None]
+        cursors = st.session_state.slip_cursors
+        slips, next_cursor = fetch_slip_page(filters, after_id=cursors[-1])
         
         if slips:
-            df = pd.DataFrame(slips)
-            st.dataframe(df[['branch_code', 'rider_name', 'slip_type', 'quantity', 'commission', 'status']])
-            
-            # Export button
-            if st.button("Export to CSV"):
-                csv = df.to_csv(index=False)
-                st.download_button(
-                    "Download CSV",
-                    data=csv,
-                    file_name="slip_submissions.csv",
-                    mime="text/csv"
+            # Same triage form as the change requests; status changes reach
+            # the weekly totals through the slip_status_changes log
+            with st.form("slip_review"):
+                grid = pd.DataFrame(slips)[
+                    ['id', 'branch_code', 'rider_name', 'slip_type', 'quantity', 'commission', 'status',
+                     'near_duplicate_of', 'near_duplicate_distance']
+                ]
+                grid.insert(0, "select", False)
+                edited = st.data_editor(
+                    grid,
+                    hide_index=True,
+                    disabled=['id', 'branch_code', 'rider_name', 'slip_type', 'quantity', 'commission',
+                              'near_duplicate_of', 'near_duplicate_distance'],
+                    column_config={
+                        "select": st.column_config.CheckboxColumn("Select"),
+                        "status": st.column_config.SelectboxColumn("Status", options=SLIP_STATUSES, required=True),
+                        "near_duplicate_of": st.column_config.TextColumn("Looks like"),
+                        "near_duplicate_distance": st.column_config.NumberColumn("Distance"),
+                    }
                 )
+                bulk_status = st.selectbox(
+                    "Set selected to",
+                    options=["(no change)"] + SLIP_STATUSES,
+                    key="slip_bulk_status"
+                )
+                apply_slips = st.form_submit_button("Apply Changes")
+            
+            if apply_slips:
+                rows = edited.to_dict('records')
+                if bulk_status != "(no change)":
+                    for row in rows:
+                        if row['select']:
+                            row['status'] = bulk_status
+                try:
+                    updated = apply_slip_status_changes(status_changes(slips, rows))
+                    if updated:
+                        st.success(f"Updated {updated} slips")
+                        st.rerun()
+                    else:
+                        st.info("No changes to apply")
+                except Exception as e:
+                    st.error(f"Update failed: {str(e)}")
+            
+            prev_col, page_col, next_col = st.columns(3)
+            with prev_col:
+                if st.button("Previous", disabled=len(cursors) == 1):
+                    cursors.pop()
+                    st.rerun()
+            with page_col:
+                st.write(f"Page {len(cursors)}")
+            with next_col:
+                if st.button("Next", disabled=next_cursor is None):
+                    cursors.append(next_cursor)
+                    st.rerun()
+            
+            # Export is streamed to a temp file. The download button hands the
+            # file to Streamlit once, on this rerun only; nothing is kept in
+            # session state, so later reruns do not read it again. Streamlit
+            # still reads the whole file into memory to serve it, so exports
+            # over EXPORT_MAX_BYTES are refused rather than offered
+            export_format = st.selectbox("Export Format", options=list(EXPORT_FORMATS))
+            if st.button("Export"):
+                try:
+                    export = export_slips(filters, export_format)
+                    try:
+                        too_large = export['bytes'] > EXPORT_MAX_BYTES
+                        if too_large:
+                            st.error(
+                                f"The export is {export['bytes'] // (1024 * 1024)} MB, over the "
+                                f"{EXPORT_MAX_BYTES // (1024 * 1024)} MB download limit. "
+                                "Narrow the filters or choose Parquet."
+                            )
+                        else:
+                            with open(export['path'], 'rb') as export_file:
+                                st.download_button(
+                                    f"Download {export['file_name']} ({export['rows']} rows)",
+                                    data=export_file,
+                                    file_name=export['file_name'],
+                                    mime=export['mime']
+                                )
+                    finally:
+                        os.remove(export['path'])
+                    if not too_large:
+                        st.caption("The download is available until the next action on this page")
+                except Exception as e:
+                    st.error(f"Export failed: {str(e)}")
         else:
             st.info("No slip submissions found")
     
     with tab4:
         st.subheader("Change Requests")
-        requests = supabase.table('change_requests').select("*").execute().data
+        
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            cr_status = st.selectbox(
+                "Filter by Status",
+                options=["All"] + CHANGE_REQUEST_STATUSES,
+                index=1,
+                key="cr_status"
+            )
+        with col2:
+            cr_branch = st.selectbox(
+                "Filter by Branch",
+                options=["All"] + [b['code'] for b in branches],
+                key="cr_branch"
+            )
+        with col3:
+            cr_dates = st.date_input("Requested between", value=(), key="cr_dates")
+        
+        cr_filters = {
+            "status": None if cr_status == "All" else cr_status,
+            "branch_code": None if cr_branch == "All" else cr_branch,
+        }
+        if len(cr_dates) == 2:
+            cr_filters["date_from"] = cr_dates[0].isoformat()
+            cr_filters["date_to"] = (cr_dates[1] + timedelta(days=1)).isoformat()
+        
+        if st.session_state.get('cr_filters') != cr_filters:
+            st.session_state.cr_filters = cr_filters
+            st.session_state.cr_cursors = [None]
+        cr_cursors = st.session_state.cr_cursors
+        requests, next_cr_cursor = fetch_change_request_page(cr_filters, after_id=cr_cursors[-1])
         
         if requests:
-            for req in requests:
-                with st.expander(f"{req['branch_code']} - {req['status']}"):
-                    st.write(f"**Requested by:** {req['requested_by']}")
-                    st.write(f"**Date:** {req['requested_at']}")
-                    st.write(f"**Description:** {req['description']}")
-                    
-                    # Status update
-                    new_status = st.selectbox(
-                        "Update Status",
-                        options=["pending", "approved", "rejected"],
-                        index=["pending", "approved", "rejected"].index(req['status']),
-                        key=f"status_{req['id']}"
-                    )
-                    
-                    if st.button("Update", key=f"update_{req['id']}"):
-                        try:
-                            supabase.table('change_requests').update({
-                                "status": new_status
-                            }).eq('id', req['id']).execute()
-                            st.rerun()
-                        except Exception as e:
-                            st.error(f"Update failed: {str(e)}")
+            # Edits are collected inside a form so changing a cell does not rerun the page
+            with st.form("change_request_triage"):
+                grid = pd.DataFrame(requests)[
+                    ['id', 'branch_code', 'requested_by', 'requested_at', 'description', 'status']
+                ]
+                grid.insert(0, "select", False)
+                edited = st.data_editor(
+                    grid,
+                    hide_index=True,
+                    disabled=['id', 'branch_code', 'requested_by', 'requested_at', 'description'],
+                    column_config={
+                        "select": st.column_config.CheckboxColumn("Select"),
+                        "status": st.column_config.SelectboxColumn("Status", options=CHANGE_REQUEST_STATUSES, required=True),
+                    }
+                )
+                bulk_status = st.selectbox(
+                    "Set selected to",
+                    options=["(no change)"] + CHANGE_REQUEST_STATUSES
+                )
+                apply = st.form_submit_button("Apply Changes")
+            
+            if apply:
+                rows = edited.to_dict('records')
+                if bulk_status != "(no change)":
+                    for row in rows:
+                        if row['select']:
+                            row['status'] = bulk_status
+                try:
+                    updated = apply_status_changes(status_changes(requests, rows))
+                    if updated:
+                        st.success(f"Updated {updated} change requests")
+                        st.rerun()
+                    else:
+                        st.info("No changes to apply")
+                except Exception as e:
+                    st.error(f"Update failed: {str(e)}")
+            
+            prev_col, page_col, next_col = st.columns(3)
+            with prev_col:
+                if st.button("Previous", key="cr_prev", disabled=len(cr_cursors) == 1):
+                    cr_cursors.pop()
+                    st.rerun()
+            with page_col:
+                st.write(f"Page {len(cr_cursors)}")
+            with next_col:
+                if st.button("Next", key="cr_next", disabled=next_cr_cursor is None):
+                    cr_cursors.append(next_cr_cursor)
+                    st.rerun()
         else:
             st.info("No change requests found")
+    
+    with tab5:
+        st.subheader("Weekly Summary")
+        rollups = get_weekly_rollups()
+        summary_week = st.selectbox(
+            "Week",
+            options=[week[0] for week in generate_week_ranges()],
+            key="summary_week"
+        )
+        
+        totals = rollups.branch_totals(summary_week)
+        if totals:
+            st.write("### Totals by Branch")
+            st.dataframe(pd.DataFrame(totals))
+            
+            summary_branch = st.selectbox(
+                "Branch",
+                options=[row['branch_code'] for row in totals],
+                key="summary_branch"
+            )
+            st.write("### Leaderboard")
+            st.dataframe(pd.DataFrame(rollups.leaderboard(summary_branch, summary_week)))
+            st.write("### By Rider, Slip Type and Status")
+            st.dataframe(pd.DataFrame(rollups.summary(summary_branch, summary_week)))
+        else:
+            st.info("No slips submitted for this week")
+        
+        col1, col2 = st.columns(2)
+        with col1:
+            if st.button("Rebuild Totals"):
+                rollups.rebuild()
+                st.rerun()
+        with col2:
+            if st.button("Verify Totals"):
+                if verify_rollups():
+                    st.success("Totals match a full rebuild")
+                else:
+                    st.error("Totals differ from a full rebuild, please rebuild")
+    
+    with tab6:
+        show_image_review(branches)
+    
+    # Optional timing panel; the data comes from modules.metrics
+    if st.sidebar.checkbox("Show backend timings"):
+        show_metrics_panel()
+    if st.sidebar.checkbox("Show background jobs"):
+        show_jobs_panel()
+
+GALLERY_COLUMNS = ['id', 'branch_code', 'rider_name', 'slip_type', 'quantity', 'transaction_id',
+                   'status', 'image_path', 'image_hash']
+GALLERY_PAGE_SIZE = int(os.getenv("GALLERY_PAGE_SIZE", "24"))
+GALLERY_COLUMNS_PER_ROW = 4
+
+def show_image_review(branches):
+    """Slip images as cached thumbnails, one page at a time; originals only on request"""
+    st.subheader("Image Review")
+    # st.tabs runs every tab's body on each rerun, so the gallery only loads
+    # its page and thumbnails once it is switched on
+    if not st.toggle("Load gallery", key="gallery_open"):
+        return
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        branch_filter = st.selectbox(
+            "Branch", options=["All"] + [b['code'] for b in branches], key="gallery_branch"
+        )
+    with col2:
+        week_filter = st.selectbox(
+            "Week", options=["All"] + [week[0] for week in generate_week_ranges()], key="gallery_week"
+        )
+    with col3:
+        status_filter = st.selectbox(
+            "Status", options=["All"] + SLIP_STATUSES, key="gallery_status"
+        )
+    filters = {
+        "branch_code": None if branch_filter == "All" else branch_filter,
+        "status": None if status_filter == "All" else status_filter,
+        "week": None if week_filter == "All" else week_filter,
+    }
+    if st.session_state.get('gallery_filters') != filters:
+        st.session_state.gallery_filters = filters
+        st.session_state.gallery_cursors = [None]
+        st.session_state.gallery_original = None
+    cursors = st.session_state.gallery_cursors
+    slips, next_cursor = fetch_slip_page(filters, cursors[-1], GALLERY_PAGE_SIZE, GALLERY_COLUMNS)
+    if not slips:
+        st.info("No slip images found")
+        return
+    
+    cache = get_thumbnail_cache()
+    # Only this page's thumbnails are generated now; the next page's are
+    # prefetched in the background so "Next" is served from the cache
+    thumbnails = cache.get_many(slips)
+    if next_cursor is not None:
+        next_slips, _ = fetch_slip_page(filters, next_cursor, GALLERY_PAGE_SIZE, GALLERY_COLUMNS)
+        cache.prefetch(next_slips)
+    
+    for start in range(0, len(slips), GALLERY_COLUMNS_PER_ROW):
+        row = zip(st.columns(GALLERY_COLUMNS_PER_ROW), slips[start:start + GALLERY_COLUMNS_PER_ROW],
+                  thumbnails[start:start + GALLERY_COLUMNS_PER_ROW])
+        for col, slip, thumbnail in row:
+            with col:
+                caption = f"{slip['branch_code']} / {slip['rider_name']} - {slip['slip_type']} x{slip['quantity']}"
+                if thumbnail:
+                    st.image(thumbnail, caption=caption)
+                else:
+                    st.write(caption)
+                    st.caption(slip.get('image_path') or "No image")
+                if slip.get('image_path') and st.button("Original", key=f"original_{slip['id']}"):
+                    st.session_state.gallery_original = {"path": slip['image_path'], "data": None}
+    
+    # The original is downloaded once and its bytes kept until it is closed
+    # or the page or filters change, so other reruns do not fetch it again
+    original = st.session_state.get('gallery_original')
+    if original:
+        path = original['path']
+        st.write(f"**Original:** {path}")
+        try:
+            if original['data'] is None:
+                original['data'] = get_repository().download_image(path)
+            if os.path.splitext(path)[1].lower() == ".pdf":
+                st.download_button("Download PDF", data=original['data'], file_name=os.path.basename(path))
+            else:
+                st.image(original['data'])
+        except Exception as e:
+            st.error(f"Failed to load original: {str(e)}")
+        if st.button("Close Original"):
+            st.session_state.gallery_original = None
+            st.rerun()
+    
+    prev_col, page_col, next_col = st.columns(3)
+    with prev_col:
+        if st.button("Previous", key="gallery_prev", disabled=len(cursors) == 1):
+            cursors.pop()
+            st.session_state.gallery_original = None
+            st.rerun()
+    with page_col:
+        size = cache.size()
+        st.write(f"Page {len(cursors)} · cache {size['files']} thumbnails, {size['bytes'] // 1024} KB")
+    with next_col:
+        if st.button("Next", key="gallery_next", disabled=next_cursor is None):
+            cursors.append(next_cursor)
+            st.session_state.gallery_original = None
+            st.rerun()
+
+def show_metrics_panel():
+    """Backend call timings for the previous rerun, this session and the process"""
+    st.subheader("Backend Timings")
+    last = metrics.last_rerun()
+    if last:
+        st.write(
+            f"**Previous rerun:** {last['wall_ms']:.0f} ms wall, "
+            f"{last['backend_ms']:.0f} ms in {last['calls']} backend calls, {last['bytes']} bytes"
+        )
+        if last['call_log']:
+            st.dataframe(pd.DataFrame(last['call_log']))
+    current = metrics.rerun_calls()
+    if current:
+        st.write("**This rerun so far**")
+        st.dataframe(pd.DataFrame(current))
+    st.write("**This session**")
+    st.dataframe(pd.DataFrame(metrics.session_totals()))
+    st.write("**All sessions in this process**")
+    st.dataframe(pd.DataFrame(metrics.process_totals()))
+
+def show_jobs_panel():
+    """Background job queue: counts per status, recent jobs, retries and Sheets sync"""
+    st.subheader("Background Jobs")
+    queue = get_job_queue()
+    counts = queue.counts()
+    for col, status in zip(st.columns(len(JOB_STATUSES)), JOB_STATUSES):
+        col.metric(status.capitalize(), counts[status])
+    
+    job_status = st.selectbox("Status", options=["All"] + JOB_STATUSES, key="job_status")
+    jobs = queue.list_jobs(status=None if job_status == "All" else job_status)
+    if jobs:
+        st.dataframe(pd.DataFrame(jobs)[
+            ['id', 'kind', 'owner', 'status', 'attempts', 'max_attempts', 'last_error', 'created_at', 'finished_at']
+        ])
+    else:
+        st.info("No jobs found")
+    
+    col1, col2 = st.columns(2)
+    with col1:
+        failed = [job['id'] for job in jobs if job['status'] == 'failed']
+        if failed and st.button(f"Retry {len(failed)} Failed Jobs", key="retry_failed_jobs"):
+            queue.retry(failed)
+            st.rerun()
+    with col2:
+        if st.button("Sync to Google Sheets"):
+            try:
+                job_id = enqueue_sheet_sync()
+                st.success(f"Sheets sync queued (job {job_id})")
+            except Exception as e:
+                st.error(f"Failed to queue sync: {str(e)}")
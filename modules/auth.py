@@ -1,5 +1,5 @@
 import streamlit as st
-from supabase_client import get_supabase
+from modules.directory import get_branch_directory
 import os
 from dotenv import load_dotenv
 
@@ -24,9 +24,7 @@ def authenticate_user():
             submit = st.button("Login")
             
             if submit:
-                supabase = get_supabase()
-                result = supabase.table('branches').select('*').eq('code', branch_code).execute()
-                if len(result.data) > 0:
+                if get_branch_directory().exists(branch_code):
                     st.session_state.authenticated = True
                     st.session_state.user_role = "branch_manager"
                     st.session_state.branch_code = branch_code
@@ -0,0 +1,333 @@
+import bisect
+import glob
+import gzip
+import hashlib
+import json
+import os
+import re
+import sys
+import time
+from collections import Counter
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+import pandas as pd
+
+BACKUP_DIR = os.getenv("BACKUP_DIR", "data/backups")
+# gzip members can be concatenated, so each append adds a compressed member
+JOURNAL_FILE = os.path.join(BACKUP_DIR, "journal.jsonl.gz")
+SNAPSHOT_DIR = os.path.join(BACKUP_DIR, "snapshots")
+SNAPSHOT_EVERY = int(os.getenv("BACKUP_SNAPSHOT_EVERY", "5000"))
+
+# state[sheet] = {"columns": [...], "rows": {row_key: [values...]}}, rows in sheet order
+State = Dict[str, Dict]
+
+def _json_value(value):
+    if hasattr(value, "item"):
+        value = value.item()
+    if value is None or (isinstance(value, float) and value != value):
+        return None
+    if isinstance(value, (datetime, pd.Timestamp)):
+        return value.isoformat()
+    return value
+
+def _frame_rows(df: pd.DataFrame) -> Dict[str, list]:
+    """Key rows by content; repeated identical rows get an occurrence suffix"""
+    rows = {}
+    seen = Counter()
+    for values in df.itertuples(index=False):
+        values = [_json_value(v) for v in values]
+        digest = hashlib.sha1(json.dumps(values, default=str).encode("utf-8")).hexdigest()[:20]
+        seen[digest] += 1
+        rows[f"{digest}:{seen[digest]}"] = values
+    return rows
+
+def _read_journal(start_line: int = 0):
+    if not os.path.exists(JOURNAL_FILE):
+        return
+    with gzip.open(JOURNAL_FILE, "rt", encoding="utf-8") as f:
+        for line_no, line in enumerate(f):
+            if line_no < start_line or not line.strip():
+                continue
+            yield line_no, json.loads(line)
+
+def _apply(state: State, entry: Dict):
+    sheet = state.setdefault(entry["sheet"], {"columns": [], "rows": {}})
+    if entry["op"] == "columns":
+        sheet["columns"] = entry["columns"]
+        sheet["rows"] = {}
+    elif entry["op"] == "put":
+        rows = sheet["rows"]
+        pos = entry.get("pos", len(rows))
+        if pos >= len(rows):
+            rows[entry["key"]] = entry["row"]
+        else:
+            items = list(rows.items())
+            items.insert(pos, (entry["key"], entry["row"]))
+            sheet["rows"] = dict(items)
+    elif entry["op"] == "del":
+        sheet["rows"].pop(entry["key"], None)
+    elif entry["op"] == "drop":
+        state.pop(entry["sheet"], None)
+
+def _in_order(sequence: List[int]) -> set:
+    """Indexes of a longest increasing subsequence of `sequence`"""
+    tails, tail_index, previous = [], [], [None] * len(sequence)
+    for i, value in enumerate(sequence):
+        j = bisect.bisect_left(tails, value)
+        if j == len(tails):
+            tails.append(value)
+            tail_index.append(i)
+        else:
+            tails[j] = value
+            tail_index[j] = i
+        previous[i] = tail_index[j - 1] if j else None
+    keep = set()
+    i = tail_index[-1] if tail_index else None
+    while i is not None:
+        keep.add(i)
+        i = previous[i]
+    return keep
+
+def _diff(old: State, new: State, ts: str) -> List[Dict]:
+    """Journal entries that turn `old` into `new`, row order included.
+
+    Rows that survive in the same relative order stay put; every other row
+    is deleted and re-put at its position in `new`. Puts are written in
+    ascending position, so inserting each at its position rebuilds the
+    sheet order (see _apply).
+    """
+    entries = []
+    for sheet in old:
+        if sheet not in new:
+            entries.append({"ts": ts, "sheet": sheet, "op": "drop"})
+    for sheet, info in new.items():
+        previous = old.get(sheet)
+        if previous is None or previous["columns"] != info["columns"]:
+            entries.append({"ts": ts, "sheet": sheet, "op": "columns", "columns": info["columns"]})
+            old_keys = []
+        else:
+            old_keys = list(previous["rows"])
+        position = {key: i for i, key in enumerate(info["rows"])}
+        survivors = [key for key in old_keys if key in position]
+        kept = {survivors[i] for i in _in_order([position[key] for key in survivors])}
+        for key in old_keys:
+            if key not in kept:
+                entries.append({"ts": ts, "sheet": sheet, "op": "del", "key": key})
+        for key, pos in position.items():
+            if key not in kept:
+                entries.append({"ts": ts, "sheet": sheet, "op": "put", "key": key, "pos": pos,
+                                "row": info["rows"][key]})
+    return entries
+
+def _snapshots() -> List[Tuple[str, str, int]]:
+    """(ts, path, journal_lines) of every snapshot, oldest first"""
+    snapshots = []
+    for manifest_path in glob.glob(os.path.join(SNAPSHOT_DIR, "*", "manifest.json")):
+        with open(manifest_path, encoding="utf-8") as f:
+            manifest = json.load(f)
+        snapshots.append((manifest["ts"], os.path.dirname(manifest_path), manifest["journal_lines"]))
+    return sorted(snapshots)
+
+def _load_snapshot(path: str) -> State:
+    with open(os.path.join(path, "manifest.json"), encoding="utf-8") as f:
+        manifest = json.load(f)
+    state = {}
+    for sheet, info in manifest["sheets"].items():
+        df = pd.read_parquet(os.path.join(path, info["file"]))
+        keys = df.pop("_key").tolist()
+        json_columns = {int(column[1:]) for column in info.get("json_columns", [])}
+        rows = {}
+        for key, row in zip(keys, df.itertuples(index=False)):
+            values = [_json_value(v) for v in row]
+            for j in json_columns:
+                if values[j] is not None:
+                    values[j] = json.loads(values[j])
+            rows[key] = values
+        state[sheet] = {"columns": info["columns"], "rows": rows}
+    return state
+
+def _replay(at: Optional[str] = None) -> Tuple[State, int, List[str]]:
+    """State as of `at`, the journal length and the timestamps read past the snapshot.
+
+    Entries are applied in timestamp order (journal order for equal
+    timestamps), not in the order they were appended: converted legacy
+    backups land after newer entries. A snapshot holds the state as of its
+    ts, so entries appended after it that are not newer than it are
+    already accounted for (see record).
+    """
+    state: State = {}
+    start_line, snapshot_ts = 0, None
+    for ts, path, journal_lines in reversed(_snapshots()):
+        if at is None or ts <= at:
+            state = _load_snapshot(path)
+            start_line, snapshot_ts = journal_lines, ts
+            break
+    lines, pending, stamps = start_line, [], {snapshot_ts} if snapshot_ts else set()
+    for line_no, entry in _read_journal(start_line):
+        lines = line_no + 1
+        stamps.add(entry["ts"])
+        if (snapshot_ts is None or entry["ts"] > snapshot_ts) and (at is None or entry["ts"] <= at):
+            pending.append((entry["ts"], line_no, entry))
+    for _, _, entry in sorted(pending, key=lambda item: item[:2]):
+        _apply(state, entry)
+    return state, lines, sorted(stamps)
+
+def restore_state(at: Optional[str] = None) -> Tuple[State, int]:
+    """Rebuild the state as of `at` (ISO timestamp, default now).
+
+    Starts from the newest snapshot taken at or before `at` and replays
+    the journal entries up to `at` on top of it. Also returns the number
+    of journal lines.
+    """
+    state, lines, _ = _replay(at)
+    return state, lines
+
+def restore(at: Optional[str] = None) -> Dict[str, pd.DataFrame]:
+    """Return {sheet: DataFrame} as of `at`, the same shape pd.read_excel(sheet_name=None) gives"""
+    state, _ = restore_state(at)
+    return {
+        sheet: pd.DataFrame(list(info["rows"].values()), columns=info["columns"])
+        for sheet, info in state.items()
+    }
+
+def write_snapshot(state: State, ts: str, journal_lines: int) -> str:
+    """Write a compacted Parquet snapshot of `state` covering journal_lines entries.
+
+    `ts` must not be older than any of those entries. Columns whose values
+    Arrow cannot hold as one type without changing them (mixed Excel cell
+    types, integers next to blanks) are stored as JSON text.
+    """
+    path = os.path.join(SNAPSHOT_DIR, re.sub(r"[^0-9A-Za-z]", "", ts))
+    os.makedirs(path, exist_ok=True)
+    sheets = {}
+    for i, (sheet, info) in enumerate(state.items()):
+        file_name = f"sheet_{i}.parquet"
+        positional = [f"c{j}" for j in range(len(info["columns"]))]
+        df = pd.DataFrame(list(info["rows"].values()), columns=positional, dtype=object)
+        json_columns = []
+        for column in positional:
+            types = {type(v) for v in df[column] if v is not None}
+            has_none = len(types) < 2 and df[column].isna().any()
+            if len(types) > 1 or (has_none and not types <= {str, float, bool}):
+                df[column] = df[column].map(lambda v: None if v is None else json.dumps(v, default=str))
+                json_columns.append(column)
+        df.insert(0, "_key", list(info["rows"].keys()))
+        df.to_parquet(os.path.join(path, file_name), index=False)
+        sheets[sheet] = {"file": file_name, "columns": info["columns"], "json_columns": json_columns}
+    with open(os.path.join(path, "manifest.json"), "w", encoding="utf-8") as f:
+        json.dump({"ts": ts, "journal_lines": journal_lines, "sheets": sheets}, f)
+    return path
+
+def record(tables: Dict[str, pd.DataFrame], ts: Optional[str] = None) -> int:
+    """Journal the changes between the last recorded state and `tables`.
+
+    Only added, removed and moved rows (and schema changes) are appended,
+    relative to the state as of `ts`. When `ts` is older than entries already in the
+    journal (e.g. converted legacy backups), entries at the next newer
+    timestamp restore that later state, so later restores are unchanged.
+    A new snapshot is compacted once SNAPSHOT_EVERY entries have
+    accumulated since the previous one. Returns the number of journal
+    entries written.
+    """
+    ts = ts or datetime.now().isoformat()
+    state, lines, stamps = _replay(ts)
+    last_snapshot = max((s[2] for s in _snapshots()), default=0)
+    new_state = {
+        sheet: {"columns": [str(c) for c in df.columns], "rows": _frame_rows(df)}
+        for sheet, df in tables.items()
+    }
+    entries = _diff(state, new_state, ts)
+    if entries:
+        following = sorted(stamp for stamp in set(stamps) | {s[0] for s in _snapshots()} if stamp > ts)
+        later = restore_state(following[0])[0] if following else None
+        _append(entries)
+        if following:
+            # The entries already at that timestamp were relative to the old state
+            fix = _diff(restore_state(following[0])[0], later, following[0])
+            _append(fix)
+            entries += fix
+        lines += len(entries)
+    if lines - last_snapshot >= SNAPSHOT_EVERY:
+        latest, _, stamps = _replay()
+        write_snapshot(latest, max([ts] + stamps), lines)
+    return len(entries)
+
+def _append(entries: List[Dict]):
+    os.makedirs(BACKUP_DIR, exist_ok=True)
+    with gzip.open(JOURNAL_FILE, "at", encoding="utf-8") as f:
+        for entry in entries:
+            f.write(json.dumps(entry, default=str) + "\n")
+
+def backup_data_file(ts: Optional[str] = None) -> int:
+    """Journal the current contents of DATA_FILE (replaces the daily xlsx copy)"""
+    from modules.utils import DATA_FILE
+    return record(pd.read_excel(DATA_FILE, sheet_name=None), ts)
+
+def legacy_backups() -> List[Tuple[str, str]]:
+    """(date, path) of every backup_YYYY-MM-DD.xlsx, oldest first"""
+    found = []
+    for path in glob.glob(os.path.join(BACKUP_DIR, "backup_*.xlsx")):
+        match = re.search(r"backup_(\d{4}-\d{2}-\d{2})\.xlsx$", path)
+        if match:
+            found.append((match.group(1), path))
+    return sorted(found)
+
+def convert_legacy_backups() -> int:
+    """Replay the full xlsx backups into the journal, one day at a time, then snapshot"""
+    total = 0
+    for day, path in legacy_backups():
+        total += record(pd.read_excel(path, sheet_name=None), f"{day}T23:59:59")
+    state, lines = restore_state()
+    if lines:
+        write_snapshot(state, datetime.now().isoformat(), lines)
+    return total
+
+def _disk_usage(paths: List[str]) -> int:
+    total = 0
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, files in os.walk(path):
+                total += sum(os.path.getsize(os.path.join(root, name)) for name in files)
+        elif os.path.exists(path):
+            total += os.path.getsize(path)
+    return total
+
+def benchmark() -> Dict:
+    """Compare restore time and disk usage of xlsx backups with the journal format"""
+    backups = legacy_backups()
+    results = {"xlsx_backups": len(backups)}
+    if backups:
+        day, path = backups[-1]
+        start = time.perf_counter()
+        expected = pd.read_excel(path, sheet_name=None)
+        results["xlsx_restore_seconds"] = time.perf_counter() - start
+        start = time.perf_counter()
+        restored = restore(f"{day}T23:59:59")
+        results["journal_restore_seconds"] = time.perf_counter() - start
+        results["restore_matches"] = sorted(expected) == sorted(restored) and all(
+            expected[sheet].equals(restored[sheet]) for sheet in expected
+        )
+    results["xlsx_bytes"] = _disk_usage([path for _, path in backups])
+    results["journal_bytes"] = _disk_usage([JOURNAL_FILE, SNAPSHOT_DIR])
+    return results
+
+if __name__ == "__main__":
+    # python -m modules.backup record | convert | snapshot | restore <ts> <out.xlsx> | bench
+    command = sys.argv[1] if len(sys.argv) > 1 else "record"
+    if command == "record":
+        print(f"Journaled {backup_data_file()} changes")
+    elif command == "convert":
+        print(f"Journaled {convert_legacy_backups()} changes from {len(legacy_backups())} xlsx backups")
+    elif command == "snapshot":
+        state, lines = restore_state()
+        print(f"Snapshot written to {write_snapshot(state, datetime.now().isoformat(), lines)}")
+    elif command == "restore":
+        at, out = sys.argv[2], sys.argv[3]
+        with pd.ExcelWriter(out) as writer:
+            for sheet, df in restore(at).items():
+                df.to_excel(writer, sheet_name=sheet, index=False)
+        print(f"Restored state as of {at} to {out}")
+    elif command == "bench":
+        print(json.dumps(benchmark(), indent=2))
+    else:
+        sys.exit(f"Unknown command: {command}")
@@ -1,22 +1,36 @@
 import streamlit as st
-from supabase_client import get_supabase
+from modules.storage import get_repository
+from modules.directory import get_branch_directory
+from modules import metrics
+from modules.hash_index import get_hash_index
+from modules.transaction_index import get_transaction_index
 from modules.utils import (
     calculate_commission,
     generate_week_ranges,
-    save_uploaded_image,
+    prepare_uploaded_image,
     validate_transaction_id
 )
+from modules.jobs import QueueFull, get_job_queue
+from modules.submission import (
+    enqueue_submission,
+    new_idempotency_key,
+    queued_conflicts,
+    submission_status
+)
 from datetime import datetime
 import pandas as pd
 
 def show_branch_panel():
     """Display the branch manager interface"""
     st.title("Branch Slip Submission")
+    metrics.set_page("branch")
     branch_code = st.session_state.branch_code
     
     # Get branch details
-    supabase = get_supabase()
-    branch_data = supabase.table('branches').select('name, riders').eq('code', branch_code).execute().data[0]
+    branch_data = get_branch_directory().get(branch_code)
+    if branch_data is None:
+        st.error("Branch not found. Please log in again.")
+        return
     branch_name = branch_data['name']
     riders = branch_data['riders'] or []
     
@@ -35,6 +49,9 @@ def show_branch_panel():
     # Initialize session state for slip entries
     if 'slip_entries' not in st.session_state:
         st.session_state.slip_entries = []
+    # Normalized images waiting to be uploaded on submit, keyed by image_path
+    if 'pending_uploads' not in st.session_state:
+        st.session_state.pending_uploads = {}
     
     # Slip submission form
     with st.form("slip_form"):
@@ -55,14 +72,28 @@ def show_branch_panel():
         submitted = st.form_submit_button("Add Slip")
         
         if submitted:
-            if not validate_transaction_id(slip_type, transaction_id):
+            id_conflict = None
+            if validate_transaction_id(slip_type, transaction_id):
+                id_conflict = get_transaction_index().conflict(
+                    slip_type, transaction_id, st.session_state.slip_entries
+                )
+            if not get_branch_directory().has_rider(branch_code, rider_name):
+                st.error("Rider is no longer assigned to this branch")
+            elif not validate_transaction_id(slip_type, transaction_id):
                 st.error(f"Please enter a valid {transaction_label}")
+            elif id_conflict:
+                st.error(f"{transaction_label} {transaction_id} is {id_conflict}")
             elif not slip_image:
                 st.error("Please upload slip image")
             else:
                 try:
-                    image_path = save_uploaded_image(slip_image, branch_code, rider_name)
-                    commission = calculate_commission(slip_type, slip_qty)
+                    image_info, upload = prepare_uploaded_image(
+                        slip_image,
+                        branch_code,
+                        rider_name,
+                        pending=st.session_state.slip_entries
+                    )
+                    commission = calculate_commission(slip_type, slip_qty, on=selected_week[:10])
                     
                     new_entry = {
                         "rider_name": rider_name,
@@ -70,16 +101,24 @@ def show_branch_panel():
                         "quantity": slip_qty,
                         "transaction_id": transaction_id,
                         "manager_name": manager_name,
-                        "image_path": image_path,
+                        **image_info,
                         "week": selected_week,
                         "branch_code": branch_code,
                         "commission": commission,
                         "submitted_at": datetime.now().isoformat(),
-                        "status": "pending"
+                        "status": "pending",
+                        "idempotency_key": new_idempotency_key()
                     }
                     
                     st.session_state.slip_entries.append(new_entry)
+                    st.session_state.pending_uploads[upload["path"]] = upload
                     st.success("Slip added successfully!")
+                    if image_info.get("near_duplicate_of"):
+                        st.warning(
+                            f"This image looks like {image_info['near_duplicate_of']} "
+                            f"(distance {image_info['near_duplicate_distance']}). "
+                            "The slip will be flagged for admin review."
+                        )
                 except Exception as e:
                     st.error(f"Error: {str(e)}")
     
@@ -87,16 +126,52 @@ def show_branch_panel():
     if st.session_state.slip_entries:
         st.subheader("Current Slips")
         df = pd.DataFrame(st.session_state.slip_entries)
-        st.dataframe(df[['rider_name', 'slip_type', 'quantity', 'commission']])
+        st.dataframe(df[['rider_name', 'slip_type', 'quantity', 'commission', 'near_duplicate_of']])
         
         # Submit all button
         if st.button("Submit All Slips"):
-            try:
-                supabase.table('slips').insert(st.session_state.slip_entries).execute()
-                st.session_state.slip_entries = []
-                st.success("All slips submitted successfully!")
-            except Exception as e:
-                st.error(f"Submission failed: {str(e)}")
+            hash_index = get_hash_index()
+            entries = st.session_state.slip_entries
+            transaction_index = get_transaction_index()
+            duplicates = hash_index.check_batch(e.get('image_hash') for e in entries)
+            duplicate_ids = transaction_index.check_batch(entries)
+            # Queued slips are only indexed once their insert succeeds
+            queued_hashes, queued_ids = queued_conflicts(entries)
+            duplicates.update(queued_hashes)
+            duplicate_ids.update(queued_ids)
+            if duplicates:
+                st.error(f"Submission blocked: {len(duplicates)} duplicate image(s) in this batch")
+            elif duplicate_ids:
+                st.error(f"Submission blocked: {len(duplicate_ids)} duplicate transaction ID(s) or serial(s)")
+                for (duplicate_type, duplicate_id), reason in duplicate_ids.items():
+                    st.write(f"- {duplicate_type} {duplicate_id}: {reason}")
+            else:
+                # Uploads and inserts run on the background job queue; the
+                # slips are durable once queued and their progress is shown below
+                try:
+                    enqueue_submission(entries, st.session_state.pending_uploads)
+                except QueueFull as e:
+                    st.error(str(e))
+                else:
+                    for entry in entries:
+                        st.session_state.pending_uploads.pop(entry['image_path'], None)
+                    st.session_state.slip_entries = []
+                    st.success(f"{len(entries)} slip(s) queued for submission")
+    
+    # Background progress of submitted slips, read from the job queue
+    statuses = submission_status(branch_code)
+    if statuses:
+        st.subheader("Submission Status")
+        st.dataframe(pd.DataFrame(statuses).drop(columns=["job_ids"]))
+        failed_jobs = [job_id for row in statuses for job_id in row["job_ids"]]
+        col1, col2 = st.columns(2)
+        with col1:
+            if st.button("Refresh Status"):
+                st.rerun()
+        with col2:
+            if failed_jobs and st.button(f"Retry Failed Slips ({len(failed_jobs)} jobs)", key="retry_failed_slips"):
+                get_job_queue().retry(failed_jobs)
+                st.rerun()
     
     # Change request form
     st.subheader("Change Request")
@@ -114,7 +189,7 @@ def show_branch_panel():
             }
             
             try:
-                supabase.table('change_requests').insert(request_data).execute()
+                get_repository().insert_change_request(request_data)
                 st.success("Change request submitted!")
             except Exception as e:
                 st.error(f"Failed to submit request: {str(e)}")
@@ -0,0 +1,40 @@
+import os
+from typing import Dict, Iterable, List, Optional, Tuple
+from modules.storage import get_repository
+
+CHANGE_REQUEST_STATUSES = ["pending", "approved", "rejected"]
+CHANGE_REQUEST_PAGE_SIZE = int(os.getenv("CHANGE_REQUEST_PAGE_SIZE", "50"))
+
+def fetch_change_request_page(filters: Dict, after_id: Optional[int] = None,
+                              page_size: int = CHANGE_REQUEST_PAGE_SIZE) -> Tuple[List[dict], Optional[int]]:
+    """Return one page of change requests (newest first) and the next cursor"""
+    rows = get_repository().change_request_page(filters, after_id, page_size + 1)
+    next_cursor = rows[page_size - 1]['id'] if len(rows) > page_size else None
+    return rows[:page_size], next_cursor
+
+def status_changes(original: Iterable[Dict], edited: Iterable[Dict]) -> Dict[str, List[int]]:
+    """Group the ids whose status differs between two row lists by new status.
+
+    Rows are matched on id, so only the rows an admin actually changed are
+    sent back to the database.
+    """
+    before = {row['id']: row['status'] for row in original}
+    changes: Dict[str, List[int]] = {}
+    for row in edited:
+        if row['id'] in before and row['status'] != before[row['id']]:
+            changes.setdefault(row['status'], []).append(row['id'])
+    return changes
+
+def apply_status_changes(changes: Dict[str, List[int]]) -> int:
+    """Write status changes with one update per target status.
+
+    Returns the number of change requests updated.
+    """
+    repository = get_repository()
+    updated = 0
+    for status, request_ids in changes.items():
+        if status not in CHANGE_REQUEST_STATUSES:
+            raise ValueError(f"Unknown status: {status}")
+        repository.update_change_requests(request_ids, {"status": status})
+        updated += len(request_ids)
+    return updated
@@ -0,0 +1,104 @@
+import json
+import os
+import threading
+from datetime import date, datetime
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+import numpy as np
+
+COMMISSION_RATES_FILE = os.getenv("COMMISSION_RATES_FILE", "data/commission_rates.json")
+
+# (effective_from, {slip_type: rate per slip}); the latest version whose
+# effective_from is on or before a slip's date applies to it
+DEFAULT_RATE_VERSIONS = [
+    ("2000-01-01", {"Cash Slip": 25, "Online Slip": 50}),
+]
+
+DateLike = Union[str, date, datetime, None]
+
+def _to_day(value: DateLike) -> np.datetime64:
+    if value is None:
+        return np.datetime64(date.today(), "D")
+    if isinstance(value, str):
+        return np.datetime64(value[:10], "D")
+    return np.datetime64(value, "D")
+
+class RateTable:
+    """Versioned commission rates.
+
+    Rates are held as a (versions x slip types) matrix so a whole column
+    of slips is priced with one searchsorted over the effective dates and
+    one fancy-indexed lookup. Row 0 is all zeros and prices slips dated
+    before the first version; the last column prices unknown slip types.
+    """
+
+    def __init__(self, versions: Sequence[Tuple[str, Dict[str, float]]]):
+        versions = sorted(versions, key=lambda version: version[0])
+        self.effective = np.array([_to_day(start) for start, _ in versions], dtype="datetime64[D]")
+        self.slip_types: List[str] = sorted({t for _, rates in versions for t in rates})
+        self._type_index = {slip_type: i for i, slip_type in enumerate(self.slip_types)}
+        self.rates = np.zeros((len(versions) + 1, len(self.slip_types) + 1))
+        for row, (_, rates) in enumerate(versions, start=1):
+            for slip_type, rate in rates.items():
+                self.rates[row, self._type_index[slip_type]] = rate
+
+    def rate_for(self, slip_type: str, on: DateLike = None) -> float:
+        row = int(np.searchsorted(self.effective, _to_day(on), side="right"))
+        return float(self.rates[row, self._type_index.get(slip_type, len(self.slip_types))])
+
+    def compute(self, slip_types: Sequence[str], quantities: Sequence[float],
+                dates: Optional[Sequence[DateLike]] = None) -> np.ndarray:
+        """Commission for every slip in one vectorized pass.
+
+        Slip types and dates are factorized first, so the per-value Python
+        work only touches the handful of distinct types and weeks.
+        """
+        import pandas as pd
+        codes, uniques = pd.factorize(np.asarray(slip_types, dtype=object))
+        unknown = len(self.slip_types)
+        type_lookup = np.array([self._type_index.get(u, unknown) for u in uniques] + [unknown], dtype=np.intp)
+        type_idx = type_lookup[codes]
+        if dates is None:
+            rows = np.searchsorted(self.effective, _to_day(None), side="right")
+        else:
+            days = np.asarray(dates)
+            if np.issubdtype(days.dtype, np.datetime64):
+                days = days.astype("datetime64[D]")
+            else:
+                day_codes, day_uniques = pd.factorize(days)
+                # Code -1 (missing date) picks the trailing entry: today
+                days = np.array([_to_day(d) for d in day_uniques] + [_to_day(None)], dtype="datetime64[D]")[day_codes]
+            rows = np.searchsorted(self.effective, days, side="right")
+        return self.rates[rows, type_idx] * np.asarray(quantities, dtype=np.float64)
+
+    def apply(self, df, type_col: str = "slip_type", quantity_col: str = "quantity",
+              date_col: Optional[str] = "week"):
+        """Return a commission Series for a slips DataFrame.
+
+        The date defaults to the week column, whose values start with the
+        week's first day ("YYYY-MM-DD to YYYY-MM-DD").
+        """
+        import pandas as pd
+        dates = df[date_col].values if date_col and date_col in df else None
+        values = self.compute(df[type_col].values, df[quantity_col].values, dates)
+        return pd.Series(values, index=df.index, name="commission")
+
+def load_rate_versions(path: str = COMMISSION_RATES_FILE) -> List[Tuple[str, Dict[str, float]]]:
+    """Read [{"effective_from": ..., "rates": {...}}, ...] or fall back to the defaults"""
+    if not os.path.exists(path):
+        return list(DEFAULT_RATE_VERSIONS)
+    with open(path, encoding="utf-8") as f:
+        return [(version["effective_from"], version["rates"]) for version in json.load(f)]
+
+_rate_table = None
+_rate_table_lock = threading.Lock()
+
+def get_rate_table() -> RateTable:
+    global _rate_table
+    with _rate_table_lock:
+        if _rate_table is None:
+            _rate_table = RateTable(load_rate_versions())
+        return _rate_table
+
+def recompute_commissions(df):
+    """Reprice a history of slips with the rates in force for each slip's week"""
+    return get_rate_table().apply(df)
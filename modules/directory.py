@@ -0,0 +1,112 @@
+import os
+import threading
+import time
+from typing import Dict, List, Optional
+from modules.storage import get_repository
+
+BRANCH_CACHE_TTL = int(os.getenv("BRANCH_CACHE_TTL", "300"))
+
+class BranchDirectory:
+    """Process-wide cache of the branches table keyed by branch code.
+
+    Every Streamlit session in this process shares one instance, so the
+    branches table is fetched once per TTL instead of once per rerun.
+    Each branch row's riders list comes from the riders table, with a set
+    alongside it for membership checks.
+    """
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __new__(cls):
+        with cls._instance_lock:
+            if cls._instance is None:
+                instance = super().__new__(cls)
+                instance._lock = threading.RLock()
+                instance._branches = {}
+                instance._rider_sets = {}
+                instance._expires = {}
+                instance._loaded_until = 0.0
+                cls._instance = instance
+        return cls._instance
+
+    def _fetch_all(self):
+        repository = get_repository()
+        rows = repository.list_branches()
+        riders = {}
+        for rider in repository.list_riders():
+            riders.setdefault(rider['branch_code'], []).append(rider['name'])
+        expires = time.monotonic() + BRANCH_CACHE_TTL
+        for row in rows:
+            row['riders'] = riders.get(row['code'], [])
+        self._branches = {row['code']: row for row in rows}
+        self._rider_sets = {row['code']: set(row['riders']) for row in rows}
+        self._expires = {code: expires for code in self._branches}
+        self._loaded_until = expires
+
+    def _fetch_one(self, code: str) -> Optional[dict]:
+        repository = get_repository()
+        branch = repository.get_branch(code)
+        if branch:
+            branch['riders'] = [rider['name'] for rider in repository.list_riders(code)]
+            self._branches[code] = branch
+            self._rider_sets[code] = set(branch['riders'])
+            self._expires[code] = time.monotonic() + BRANCH_CACHE_TTL
+            return branch
+        self._branches.pop(code, None)
+        self._rider_sets.pop(code, None)
+        self._expires.pop(code, None)
+        return None
+
+    def _ensure_loaded(self):
+        if time.monotonic() >= self._loaded_until:
+            self._fetch_all()
+
+    def all(self) -> List[dict]:
+        """Return every branch row, refreshing the table after the TTL"""
+        with self._lock:
+            self._ensure_loaded()
+            now = time.monotonic()
+            for code in [c for c, exp in self._expires.items() if exp <= now]:
+                self._fetch_one(code)
+            return list(self._branches.values())
+
+    def get(self, code: str) -> Optional[dict]:
+        """Return the branch row for a code, or None if it does not exist"""
+        if not code:
+            return None
+        with self._lock:
+            self._ensure_loaded()
+            if code in self._branches and self._expires.get(code, 0) > time.monotonic():
+                return self._branches[code]
+            return self._fetch_one(code)
+
+    def exists(self, code: str) -> bool:
+        return self.get(code) is not None
+
+    def riders(self, code: str) -> List[str]:
+        branch = self.get(code)
+        return list(branch['riders'] or []) if branch else []
+
+    def has_rider(self, code: str, rider_name: str) -> bool:
+        """O(1) check that a rider belongs to a branch"""
+        if self.get(code) is None:
+            return False
+        return rider_name in self._rider_sets.get(code, ())
+
+    def as_mapping(self) -> Dict[str, tuple]:
+        """Return {code: (name, riders)} as used by the legacy entry point"""
+        return {row['code']: (row['name'], row['riders'] or []) for row in self.all()}
+
+    def invalidate(self, code: Optional[str] = None):
+        """Drop one branch (or the whole table) so the next read refetches it"""
+        with self._lock:
+            if code is None:
+                self._branches = {}
+                self._rider_sets = {}
+                self._expires = {}
+                self._loaded_until = 0.0
+            else:
+                self._expires[code] = 0.0
+
+def get_branch_directory() -> BranchDirectory:
+    return BranchDirectory()
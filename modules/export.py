@@ -0,0 +1,111 @@
+import csv
+import os
+import tempfile
+import time
+from typing import Dict, Optional
+from modules.slip_query import iter_slips
+
+EXPORT_DIR = os.getenv("EXPORT_DIR", os.path.join(tempfile.gettempdir(), "slip_exports"))
+EXPORT_PAGE_SIZE = int(os.getenv("EXPORT_PAGE_SIZE", "1000"))
+EXPORT_MAX_AGE = int(os.getenv("EXPORT_MAX_AGE", "3600"))
+# st.download_button reads the whole file into memory, so larger exports are refused
+EXPORT_MAX_BYTES = int(os.getenv("EXPORT_MAX_BYTES", str(100 * 1024 * 1024)))
+
+# Column name -> Arrow type name, in export order
+EXPORT_COLUMNS = {
+    "id": "int64",
+    "branch_code": "string",
+    "rider_name": "string",
+    "slip_type": "string",
+    "quantity": "int64",
+    "commission": "float64",
+    "status": "string",
+    "week": "string",
+    "transaction_id": "string",
+    "manager_name": "string",
+    "image_path": "string",
+    "image_hash": "string",
+    "submitted_at": "string",
+}
+
+EXPORT_FORMATS = {
+    "CSV": (".csv", "text/csv"),
+    "XLSX": (".xlsx", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"),
+    "Parquet": (".parquet", "application/octet-stream"),
+}
+
+def _pages(filters: Dict):
+    return iter_slips(filters, columns=list(EXPORT_COLUMNS), page_size=EXPORT_PAGE_SIZE)
+
+def _write_csv(path: str, filters: Dict) -> int:
+    rows = 0
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=list(EXPORT_COLUMNS), extrasaction="ignore")
+        writer.writeheader()
+        for page in _pages(filters):
+            writer.writerows(page)
+            rows += len(page)
+    return rows
+
+def _write_xlsx(path: str, filters: Dict) -> int:
+    import xlsxwriter
+    # constant_memory flushes each row to disk once the next one starts
+    workbook = xlsxwriter.Workbook(path, {"constant_memory": True})
+    worksheet = workbook.add_worksheet("Slips")
+    worksheet.write_row(0, 0, list(EXPORT_COLUMNS))
+    rows = 0
+    for page in _pages(filters):
+        for slip in page:
+            rows += 1
+            worksheet.write_row(rows, 0, [slip.get(column) for column in EXPORT_COLUMNS])
+    workbook.close()
+    return rows
+
+def _write_parquet(path: str, filters: Dict) -> int:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    schema = pa.schema([(column, getattr(pa, type_name)()) for column, type_name in EXPORT_COLUMNS.items()])
+    rows = 0
+    with pq.ParquetWriter(path, schema) as writer:
+        for page in _pages(filters):
+            columns = {column: [slip.get(column) for slip in page] for column in EXPORT_COLUMNS}
+            writer.write_table(pa.Table.from_pydict(columns, schema=schema))
+            rows += len(page)
+    return rows
+
+_WRITERS = {"CSV": _write_csv, "XLSX": _write_xlsx, "Parquet": _write_parquet}
+
+def cleanup_exports(max_age: int = EXPORT_MAX_AGE):
+    """Delete export files older than max_age seconds"""
+    if not os.path.isdir(EXPORT_DIR):
+        return
+    cutoff = time.time() - max_age
+    for name in os.listdir(EXPORT_DIR):
+        path = os.path.join(EXPORT_DIR, name)
+        try:
+            if os.path.getmtime(path) < cutoff:
+                os.remove(path)
+        except OSError:
+            pass
+
+def export_slips(filters: Dict, fmt: str = "CSV", path: Optional[str] = None) -> Dict:
+    """Stream every slip matching the filters into a file, one page at a time.
+
+    Only one page of rows is held in memory regardless of the total row
+    count. Returns {"path", "rows", "bytes", "mime", "file_name"}; the
+    caller hands the file to the user once and removes it.
+    """
+    suffix, mime = EXPORT_FORMATS[fmt]
+    if path is None:
+        cleanup_exports()
+        os.makedirs(EXPORT_DIR, exist_ok=True)
+        fd, path = tempfile.mkstemp(prefix="slip_submissions_", suffix=suffix, dir=EXPORT_DIR)
+        os.close(fd)
+    rows = _WRITERS[fmt](path, filters)
+    return {
+        "path": path,
+        "rows": rows,
+        "bytes": os.path.getsize(path),
+        "mime": mime,
+        "file_name": f"slip_submissions{suffix}"
+    }
@@ -1,18 +1,26 @@
-import gspread
-import pandas as pd
-from oauth2client.service_account import ServiceAccountCredentials
-from gspread_dataframe import set_with_dataframe
-from modules.utils import DATA_FILE
-from google.oauth2.service_account import Credentials
-import gspread
 import streamlit as st
-from google.oauth2.service_account import Credentials
+from modules.utils import DATA_FILE
+from modules.metrics import instrument_gspread
+from modules.sheet_sync import SheetSyncState, dataframe_values, sync_worksheet
+
+# gspread, the Google auth libraries and pandas are imported inside the
+# functions that use them, so importing this module stays cheap
+
+_sync_state = None
+
+def get_sync_state() -> SheetSyncState:
+    global _sync_state
+    if _sync_state is None:
+        _sync_state = SheetSyncState()
+    return _sync_state
 
 def get_gsheet_client():
+    import gspread
+    from google.oauth2.service_account import Credentials
     creds_dict = st.secrets["service_account"]
     scopes = ["https://www.googleapis.com/auth/spreadsheets"]
     credentials = Credentials.from_service_account_info(creds_dict, scopes=scopes)
-    return gspread.authorize(credentials)
+    return instrument_gspread(gspread.authorize(credentials))
 
 
 # def get_gsheet_client():
@@ -26,8 +34,10 @@ def get_gsheet_client():
 #     return gspread.authorize(creds)
 
 # Load branch data from sheet
-def load_branch_data():
-    gc = get_gspread_client()
+def load_branch_data(gc=None):
+    import pandas as pd
+    from gspread_dataframe import get_as_dataframe
+    gc = gc or get_gsheet_client()
     sheet = gc.open("BranchData").sheet1
     df = get_as_dataframe(sheet, evaluate_formulas=True).dropna(how='all')
     
@@ -41,9 +51,10 @@ def load_branch_data():
     return branch_data
 
 # Save branch data to sheet
-def save_branch_data(branch_data):
-    gc = get_gspread_client()
-    sheet = gc.open("BranchData").sheet1
+def save_branch_data(branch_data, gc=None, full=False):
+    import pandas as pd
+    gc = gc or get_gsheet_client()
+    spreadsheet = gc.open("BranchData")
     data = []
 
     for code, (name, riders) in branch_data.items():
@@ -51,19 +62,18 @@ def save_branch_data(branch_data):
         data.append([code, name, rider_str])
 
     df = pd.DataFrame(data, columns=["Branch Code", "Branch Name", "Riders"])
-    sheet.clear()
-    set_with_dataframe(sheet, df)
+    # Only rows that changed since the last sync are written
+    return sync_worksheet(spreadsheet, spreadsheet.sheet1.title, dataframe_values(df), get_sync_state(), full=full)
     
-def save_to_google_sheets():
-    client = get_gsheet_client()
+def save_to_google_sheets(client=None, full=False):
+    import pandas as pd
+    client = client or get_gsheet_client()
     spreadsheet = client.open("Rider Slip Data")  # Your actual Google Sheet name
 
+    results = {}
     all_data = pd.read_excel(DATA_FILE, sheet_name=None)
     for sheet_name, df in all_data.items():
-        try:
-            worksheet = spreadsheet.worksheet(sheet_name)
-            worksheet.clear()
-        except gspread.exceptions.WorksheetNotFound:
-            worksheet = spreadsheet.add_worksheet(title=sheet_name, rows="100", cols="20")
-        
-        set_with_dataframe(worksheet, df)
+        results[sheet_name] = sync_worksheet(
+            spreadsheet, sheet_name, dataframe_values(df), get_sync_state(), full=full
+        )
+    return results
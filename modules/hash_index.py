@@ -0,0 +1,172 @@
+import glob
+import math
+import os
+import threading
+import time
+from typing import Dict, Iterable, Iterator, List, Optional, Set
+from modules.storage import get_repository
+
+HASH_INDEX_FILE = os.getenv("HASH_INDEX_FILE", "data/image_hashes.txt")
+SLIP_IMAGES_DIR = os.getenv("SLIP_IMAGES_DIR", "images/slip_images")
+HASH_INDEX_REFRESH = int(os.getenv("HASH_INDEX_REFRESH", "60"))
+PAGE_SIZE = 1000
+
+def iter_slip_rows(columns: List[str], after_id: Optional[int] = None) -> Iterator[dict]:
+    """Yield slips rows with id > after_id in id order, page by page.
+
+    Rows always include 'id'; callers keep the last one as their watermark.
+    """
+    repository = get_repository()
+    if 'id' not in columns:
+        columns = ['id', *columns]
+    while True:
+        rows = repository.slips_after(columns, after_id, PAGE_SIZE)
+        yield from rows
+        if len(rows) < PAGE_SIZE:
+            break
+        after_id = rows[-1]['id']
+
+class BloomFilter:
+    """Bloom filter over SHA-256 hex digests.
+
+    The digests are already uniformly distributed, so the k bit positions
+    are taken from consecutive 32-bit slices of the digest itself.
+    """
+
+    def __init__(self, capacity: int = 100_000, error_rate: float = 0.001):
+        self.capacity = capacity
+        self.size = max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.hashes = min(8, max(1, round(self.size / capacity * math.log(2))))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, digest: str):
+        for i in range(self.hashes):
+            yield int(digest[i * 8:(i + 1) * 8], 16) % self.size
+
+    def add(self, digest: str):
+        for pos in self._positions(digest):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+        self.count += 1
+
+    def __contains__(self, digest: str) -> bool:
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(digest))
+
+class ImageHashIndex:
+    """Process-wide index of SHA-256 hashes of every submitted slip image.
+
+    Seeded from the on-disk index file, the legacy per-rider hashes.txt
+    files and the slips table, then kept current by appending new hashes
+    and periodically pulling slips submitted by other processes.
+    """
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __new__(cls):
+        with cls._instance_lock:
+            if cls._instance is None:
+                instance = super().__new__(cls)
+                instance._lock = threading.RLock()
+                instance._hashes = set()
+                instance._bloom = BloomFilter()
+                instance._watermark = None
+                instance._refreshed_at = 0.0
+                instance._seeded = False
+                cls._instance = instance
+        return cls._instance
+
+    def _insert(self, digest: str) -> bool:
+        if digest in self._hashes:
+            return False
+        self._hashes.add(digest)
+        if len(self._hashes) > self._bloom.capacity:
+            self._rebuild_bloom(len(self._hashes) * 2)
+        else:
+            self._bloom.add(digest)
+        return True
+
+    def _rebuild_bloom(self, capacity: int):
+        bloom = BloomFilter(capacity)
+        for digest in self._hashes:
+            bloom.add(digest)
+        self._bloom = bloom
+
+    def _load_file(self, path: str):
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                digest = line.strip()
+                if len(digest) == 64:
+                    self._insert(digest)
+
+    def _seed(self):
+        if os.path.exists(HASH_INDEX_FILE):
+            self._load_file(HASH_INDEX_FILE)
+        for path in glob.glob(os.path.join(SLIP_IMAGES_DIR, "*", "*", "hashes.txt")):
+            self._load_file(path)
+        new_hashes = self._pull_slips()
+        self._persist(new_hashes)
+        self._seeded = True
+
+    def _pull_slips(self) -> List[str]:
+        """Fetch hashes of slips inserted after the watermark id, page by page"""
+        new_hashes = []
+        for row in iter_slip_rows(['image_hash'], self._watermark):
+            if row.get('image_hash') and self._insert(row['image_hash']):
+                new_hashes.append(row['image_hash'])
+            self._watermark = row['id']
+        self._refreshed_at = time.monotonic()
+        return new_hashes
+
+    def _persist(self, digests: Iterable[str]):
+        digests = list(digests)
+        if not digests:
+            return
+        os.makedirs(os.path.dirname(HASH_INDEX_FILE) or ".", exist_ok=True)
+        with open(HASH_INDEX_FILE, "a", encoding="utf-8") as f:
+            f.writelines(f"{digest}\n" for digest in digests)
+
+    def _ensure_fresh(self):
+        if not self._seeded:
+            self._seed()
+        elif time.monotonic() - self._refreshed_at >= HASH_INDEX_REFRESH:
+            self._persist(self._pull_slips())
+
+    def contains(self, digest: str) -> bool:
+        """Return True if the hash belongs to an already submitted image"""
+        with self._lock:
+            self._ensure_fresh()
+            if digest not in self._bloom:
+                return False
+            return digest in self._hashes
+
+    def check_batch(self, digests: Iterable[str]) -> Dict[str, str]:
+        """Check a whole submission at once.
+
+        Returns {hash: reason} for every hash that is already indexed or
+        appears more than once within the batch itself.
+        """
+        duplicates = {}
+        seen: Set[str] = set()
+        with self._lock:
+            self._ensure_fresh()
+            for digest in digests:
+                if not digest:
+                    continue
+                if digest in seen:
+                    duplicates[digest] = "repeated in this batch"
+                elif digest in self._bloom and digest in self._hashes:
+                    duplicates[digest] = "already submitted"
+                seen.add(digest)
+        return duplicates
+
+    def add_many(self, digests: Iterable[str]):
+        """Record hashes of newly submitted slips in memory and on disk"""
+        with self._lock:
+            new_hashes = [digest for digest in digests if digest and self._insert(digest)]
+            self._persist(new_hashes)
+
+    def add(self, digest: str):
+        self.add_many([digest])
+
+def get_hash_index() -> ImageHashIndex:
+    return ImageHashIndex()
@@ -0,0 +1,85 @@
+import io
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+from PIL import Image
+from modules.metrics import scoped, timed
+from modules.storage import get_repository
+
+IMAGE_MAX_SIDE = int(os.getenv("IMAGE_MAX_SIDE", "1600"))
+IMAGE_FORMAT = os.getenv("IMAGE_FORMAT", "webp").lower()
+IMAGE_QUALITY = int(os.getenv("IMAGE_QUALITY", "80"))
+UPLOAD_WORKERS = int(os.getenv("UPLOAD_WORKERS", "4"))
+IMAGE_EXTENSIONS = ['.jpg', '.jpeg', '.png']
+
+_FORMATS = {
+    "webp": ("WEBP", ".webp", "image/webp"),
+    "jpeg": ("JPEG", ".jpg", "image/jpeg"),
+}
+_PASSTHROUGH_TYPES = {".pdf": "application/pdf"}
+
+def passthrough_file(file_bytes: bytes, file_ext: str) -> Dict:
+    """Upload fields for a non-image file, stored unchanged"""
+    file_ext = file_ext.lower()
+    return {
+        "image": None,
+        "data": file_bytes,
+        "ext": file_ext,
+        "content_type": _PASSTHROUGH_TYPES.get(file_ext, "application/octet-stream"),
+    }
+
+def decode_image(file_bytes: bytes) -> Image.Image:
+    """Decode an upload once, JPEGs straight at reduced size via draft mode"""
+    with timed("image", "decode", len(file_bytes)):
+        try:
+            image = Image.open(io.BytesIO(file_bytes))
+            image.draft("RGB", (IMAGE_MAX_SIDE, IMAGE_MAX_SIDE))
+            image.load()
+        except Exception as e:
+            raise ValueError(f"Invalid image: {str(e)}")
+    return image
+
+def normalize_image(image: Image.Image) -> Dict:
+    """Downscale to IMAGE_MAX_SIDE and re-encode without metadata"""
+    pil_format, ext, content_type = _FORMATS.get(IMAGE_FORMAT, _FORMATS["webp"])
+    with timed("image", "encode") as info:
+        keep_alpha = pil_format == "WEBP" and "A" in image.getbands()
+        if image.mode not in ("RGB", "L"):
+            image = image.convert("RGBA" if keep_alpha else "RGB")
+        image.thumbnail((IMAGE_MAX_SIDE, IMAGE_MAX_SIDE), Image.LANCZOS)
+
+        # Saving without exif/icc arguments drops the source metadata
+        buffer = io.BytesIO()
+        image.save(buffer, format=pil_format, quality=IMAGE_QUALITY, optimize=pil_format == "JPEG")
+        info["bytes"] = buffer.tell()
+    return {
+        "image": image,
+        "data": buffer.getvalue(),
+        "ext": ext,
+        "content_type": content_type,
+    }
+
+def _upload(upload: Dict) -> str:
+    get_repository().upload_image(upload["path"], upload["data"], upload["content_type"])
+    return upload["path"]
+
+def upload_images(uploads: List[Dict], max_workers: int = UPLOAD_WORKERS) -> List[Optional[Exception]]:
+    """Upload prepared images to the slip_images bucket concurrently.
+
+    Returns one entry per upload, in order: None on success or the
+    exception that upload raised.
+    """
+    if not uploads:
+        return []
+
+    def run(upload):
+        try:
+            _upload(upload)
+            return None
+        except Exception as e:
+            return e
+
+    if len(uploads) == 1:
+        return [run(uploads[0])]
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(uploads))) as pool:
+        return list(pool.map(scoped(run), uploads))
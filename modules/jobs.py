@@ -0,0 +1,419 @@
+import json
+import os
+import random
+import sqlite3
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+from modules import metrics
+
+JOB_QUEUE_PATH = os.getenv("JOB_QUEUE_PATH", "data/jobs.db")
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "5"))
+JOB_BACKOFF = float(os.getenv("JOB_BACKOFF", "2.0"))
+JOB_MAX_PENDING = int(os.getenv("JOB_MAX_PENDING", "1000"))
+JOB_LEASE = float(os.getenv("JOB_LEASE", "300"))
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "1.0"))
+JOB_BATCH_SIZE = int(os.getenv("JOB_BATCH_SIZE", "100"))
+JOB_STATUSES = ["queued", "running", "done", "failed"]
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    data BLOB,
+    dedup_key TEXT,
+    ref TEXT,
+    owner TEXT,
+    depends_on INTEGER,
+    status TEXT NOT NULL DEFAULT 'queued',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL,
+    run_after REAL NOT NULL,
+    leased_until REAL,
+    last_error TEXT,
+    created_at TEXT NOT NULL,
+    finished_at TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_ready ON jobs (status, run_after);
+CREATE INDEX IF NOT EXISTS idx_jobs_dedup_key ON jobs (dedup_key);
+CREATE INDEX IF NOT EXISTS idx_jobs_depends_on ON jobs (depends_on);
+CREATE INDEX IF NOT EXISTS idx_jobs_owner ON jobs (owner, id);
+"""
+
+JOB_COLUMNS = [
+    'id', 'kind', 'payload', 'dedup_key', 'ref', 'owner', 'depends_on', 'status',
+    'attempts', 'max_attempts', 'last_error', 'created_at', 'finished_at'
+]
+
+class QueueFull(RuntimeError):
+    """Too many jobs are waiting; the caller should ask the user to retry later"""
+
+# kind -> (handler, batch). A handler takes one job and raises on failure;
+# a batch handler takes a list of jobs of its kind and returns one error
+# (or None) per job.
+_HANDLERS: Dict[str, tuple] = {}
+
+def handler(kind: str, batch: bool = False):
+    def register(func: Callable):
+        _HANDLERS[kind] = (func, batch)
+        return func
+    return register
+
+class JobQueue:
+    """Process-wide durable job queue in a local SQLite file with a worker pool.
+
+    Jobs survive restarts: a job is leased to a worker for JOB_LEASE seconds
+    and is picked up again if its worker died before finishing. Failed jobs
+    are retried with exponential backoff up to their max_attempts. A job may
+    depend on another one and only runs once that one is done; if it fails
+    for good its dependents fail with it. Several processes may share the
+    file, each running its own workers.
+    """
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __new__(cls):
+        with cls._instance_lock:
+            if cls._instance is None:
+                instance = super().__new__(cls)
+                instance.path = JOB_QUEUE_PATH
+                instance._local = threading.local()
+                instance._wake = threading.Event()
+                instance._stop = threading.Event()
+                instance._workers = []
+                if instance.path != ":memory:":
+                    os.makedirs(os.path.dirname(instance.path) or ".", exist_ok=True)
+                instance._conn().executescript(_SCHEMA)
+                cls._instance = instance
+        return cls._instance
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def _transaction(self):
+        # IMMEDIATE takes the write lock up front so two workers cannot
+        # claim the same job
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _job(self, row) -> Dict:
+        job = dict(row)
+        job["payload"] = json.loads(job["payload"])
+        return job
+
+    def enqueue_many(self, jobs: List[Dict]) -> List[int]:
+        """Add jobs in one transaction and return their ids, in order.
+
+        Each job is a dict with "kind" and "payload" and optionally "data"
+        (bytes kept outside the JSON payload), "dedup_key", "ref", "owner",
+        "max_attempts" and "after" (the index of an earlier job in the same
+        list that must finish first). A job whose dedup_key matches an
+        existing job returns that job's id instead; a failed match is
+        queued again. With "coalesce" the match is limited to jobs that
+        have not started yet. Raises QueueFull when more than
+        JOB_MAX_PENDING jobs would be waiting.
+        """
+        now = time.time()
+        ids = []
+        with self._transaction() as conn:
+            pending = conn.execute("SELECT COUNT(*) FROM jobs WHERE status IN ('queued', 'running')").fetchone()[0]
+            for job in jobs:
+                if job["kind"] not in _HANDLERS:
+                    raise ValueError(f"Unknown job kind: {job['kind']}")
+                depends_on = ids[job["after"]] if job.get("after") is not None else None
+                existing = None
+                if job.get("dedup_key"):
+                    existing = conn.execute(
+                        "SELECT id, status FROM jobs WHERE dedup_key = ? ORDER BY id DESC LIMIT 1",
+                        (job["dedup_key"],)
+                    ).fetchone()
+                    if existing and job.get("coalesce") and existing["status"] != "queued":
+                        existing = None
+                if existing and existing["status"] != "failed":
+                    ids.append(existing["id"])
+                    continue
+                pending += 1
+                if pending > JOB_MAX_PENDING:
+                    raise QueueFull(f"{JOB_MAX_PENDING} jobs are already waiting, please try again shortly")
+                if existing:
+                    self._requeue(conn, [existing["id"]], now)
+                    ids.append(existing["id"])
+                    continue
+                cursor = conn.execute(
+                    "INSERT INTO jobs (kind, payload, data, dedup_key, ref, owner, depends_on, "
+                    "max_attempts, run_after, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (
+                        job["kind"], json.dumps(job.get("payload") or {}, default=str), job.get("data"),
+                        job.get("dedup_key"), job.get("ref"), job.get("owner"), depends_on,
+                        job.get("max_attempts", JOB_MAX_ATTEMPTS), now, datetime.now().isoformat()
+                    )
+                )
+                ids.append(cursor.lastrowid)
+        self._wake.set()
+        return ids
+
+    def enqueue(self, kind: str, payload: Dict, **options) -> int:
+        return self.enqueue_many([{"kind": kind, "payload": payload, **options}])[0]
+
+    def _requeue(self, conn: sqlite3.Connection, job_ids: List[int], now: float):
+        # Jobs that failed only because these did are queued again with them
+        while job_ids:
+            marks = ", ".join("?" * len(job_ids))
+            conn.execute(
+                f"UPDATE jobs SET status = 'queued', attempts = 0, run_after = ?, last_error = NULL, "
+                f"finished_at = NULL WHERE id IN ({marks}) AND status = 'failed'",
+                (now, *job_ids)
+            )
+            job_ids = [row[0] for row in conn.execute(
+                f"SELECT id FROM jobs WHERE depends_on IN ({marks}) AND status = 'failed'", tuple(job_ids)
+            )]
+
+    def retry(self, job_ids: List[int]):
+        """Queue failed jobs (and the jobs waiting on them) again"""
+        with self._transaction() as conn:
+            self._requeue(conn, list(job_ids), time.time())
+        self._wake.set()
+
+    def _claim(self) -> List[Dict]:
+        now = time.time()
+        with self._transaction() as conn:
+            rows = conn.execute(
+                f"SELECT {', '.join(f'j.{c}' for c in JOB_COLUMNS)}, j.data FROM jobs j "
+                "LEFT JOIN jobs d ON d.id = j.depends_on "
+                "WHERE ((j.status = 'queued' AND j.run_after <= ?) OR (j.status = 'running' AND j.leased_until < ?)) "
+                "AND (d.id IS NULL OR d.status = 'done') ORDER BY j.id LIMIT ?",
+                (now, now, max(1, JOB_BATCH_SIZE))
+            ).fetchall()
+            if not rows:
+                return []
+            kind = rows[0]["kind"]
+            batch = _HANDLERS.get(kind, (None, False))[1]
+            rows = [row for row in rows if row["kind"] == kind] if batch else rows[:1]
+            conn.execute(
+                f"UPDATE jobs SET status = 'running', attempts = attempts + 1, leased_until = ? "
+                f"WHERE id IN ({', '.join('?' * len(rows))})",
+                (now + JOB_LEASE, *[row["id"] for row in rows])
+            )
+        jobs = [self._job(row) for row in rows]
+        for job in jobs:
+            job["attempts"] += 1
+        return jobs
+
+    def _finish(self, job: Dict, error: Optional[str]):
+        now = time.time()
+        with self._transaction() as conn:
+            if error is None:
+                # The blob is only needed until the job has run
+                conn.execute(
+                    "UPDATE jobs SET status = 'done', data = NULL, last_error = NULL, finished_at = ? WHERE id = ?",
+                    (datetime.now().isoformat(), job["id"])
+                )
+            elif job["attempts"] < job["max_attempts"]:
+                delay = JOB_BACKOFF * (2 ** (job["attempts"] - 1)) * (1 + random.random())
+                conn.execute(
+                    "UPDATE jobs SET status = 'queued', run_after = ?, last_error = ? WHERE id = ?",
+                    (now + delay, error, job["id"])
+                )
+            else:
+                failed = [job["id"]]
+                conn.execute(
+                    "UPDATE jobs SET status = 'failed', last_error = ?, finished_at = ? WHERE id = ?",
+                    (error, datetime.now().isoformat(), job["id"])
+                )
+                while failed:
+                    marks = ", ".join("?" * len(failed))
+                    dependents = [row[0] for row in conn.execute(
+                        f"SELECT id FROM jobs WHERE depends_on IN ({marks}) AND status = 'queued'", tuple(failed)
+                    )]
+                    if dependents:
+                        conn.execute(
+                            f"UPDATE jobs SET status = 'failed', last_error = ?, finished_at = ? "
+                            f"WHERE id IN ({', '.join('?' * len(dependents))})",
+                            (f"Depends on failed job {job['id']}", datetime.now().isoformat(), *dependents)
+                        )
+                    failed = dependents
+
+    def run_once(self) -> int:
+        """Claim and run the next ready job (or batch); returns how many jobs ran"""
+        jobs = self._claim()
+        if not jobs:
+            return 0
+        kind = jobs[0]["kind"]
+        func, batch = _HANDLERS.get(kind, (None, False))
+        if func is None:
+            errors = [f"Unknown job kind: {kind}"] * len(jobs)
+        elif batch:
+            try:
+                with metrics.timed("job", kind):
+                    errors = func(jobs)
+            except Exception as e:
+                errors = [str(e)] * len(jobs)
+        else:
+            try:
+                with metrics.timed("job", kind, len(jobs[0]["data"] or b"")):
+                    func(jobs[0])
+                errors = [None]
+            except Exception as e:
+                errors = [str(e) or type(e).__name__]
+        for job, error in zip(jobs, errors):
+            self._finish(job, error)
+        return len(jobs)
+
+    def _work(self):
+        while not self._stop.is_set():
+            try:
+                ran = self.run_once()
+            except sqlite3.Error as e:
+                metrics.logger.warning(f"Job worker error: {e}")
+                ran = 0
+            if not ran:
+                self._wake.wait(JOB_POLL_INTERVAL)
+                self._wake.clear()
+
+    def start(self, workers: int = JOB_WORKERS):
+        """Start the worker threads once per process"""
+        with self._instance_lock:
+            self._workers = [thread for thread in self._workers if thread.is_alive()]
+            self._stop.clear()
+            for i in range(len(self._workers), workers):
+                thread = threading.Thread(target=self._work, name=f"job-worker-{i}", daemon=True)
+                thread.start()
+                self._workers.append(thread)
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+        for thread in self._workers:
+            thread.join()
+        self._workers = []
+
+    def counts(self) -> Dict[str, int]:
+        """Number of jobs per status"""
+        counts = dict.fromkeys(JOB_STATUSES, 0)
+        for row in self._conn().execute("SELECT status, COUNT(*) FROM jobs GROUP BY status"):
+            counts[row[0]] = row[1]
+        return counts
+
+    def list_jobs(self, owner: Optional[str] = None, status: Optional[str] = None, limit: int = 100) -> List[Dict]:
+        """Most recent jobs first, without their data blobs"""
+        clauses, params = [], []
+        if owner:
+            clauses.append("owner = ?")
+            params.append(owner)
+        if status:
+            clauses.append("status = ?")
+            params.append(status)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        rows = self._conn().execute(
+            f"SELECT {', '.join(JOB_COLUMNS)} FROM jobs {where} ORDER BY id DESC LIMIT ?", (*params, limit)
+        )
+        return [self._job(row) for row in rows]
+
+    def pending_payloads(self, kind: str) -> List[Dict]:
+        """Payloads of the jobs of this kind that are still queued or running"""
+        rows = self._conn().execute(
+            "SELECT payload FROM jobs WHERE kind = ? AND status IN ('queued', 'running')", (kind,)
+        )
+        return [json.loads(row[0]) for row in rows]
+
+    def purge(self, older_than_days: int = 7) -> int:
+        """Delete finished jobs older than the given age; returns how many were removed"""
+        cutoff = datetime.fromtimestamp(time.time() - older_than_days * 86400).isoformat()
+        with self._transaction() as conn:
+            return conn.execute(
+                "DELETE FROM jobs WHERE status = 'done' AND finished_at < ?", (cutoff,)
+            ).rowcount
+
+def get_job_queue(start: bool = True) -> JobQueue:
+    """The process-wide queue; its workers are started on first use unless JOB_WORKERS is 0"""
+    queue = JobQueue()
+    if start and JOB_WORKERS > 0 and not queue._workers:
+        queue.start()
+    return queue
+
+def _already_stored(error) -> bool:
+    message = str(error)
+    return "409" in message or "Duplicate" in message or "already exists" in message
+
+@handler("upload_image")
+def _upload_image(job: Dict):
+    from modules.storage import get_repository
+    payload = job["payload"]
+    try:
+        get_repository().upload_image(payload["path"], job["data"], payload["content_type"])
+    except Exception as e:
+        # A retry after an upload that landed but was never marked done;
+        # if the previous attempt was already refused the path is taken
+        previous = job["last_error"]
+        if job["attempts"] > 1 and _already_stored(e) and not (previous and _already_stored(previous)):
+            return
+        raise
+
+@handler("insert_slip", batch=True)
+def _insert_slips(jobs: List[Dict]) -> List[Optional[str]]:
+    from modules.hash_index import get_hash_index
+    from modules.phash import get_near_duplicate_index
+    from modules.rollups import get_weekly_rollups
+    from modules.slip_query import invalidate_slip_queries
+    from modules.submission import submit_slips
+    from modules.transaction_index import get_transaction_index
+    entries = [job["payload"] for job in jobs]
+    # The queue does the retrying; submit_slips still isolates bad rows
+    report = submit_slips(entries, max_retries=0)
+    inserted = [entry for entry, row in zip(entries, report) if row["ok"]]
+    if inserted:
+        get_hash_index().add_many(entry.get('image_hash') for entry in inserted)
+        get_near_duplicate_index().add_many(inserted)
+        get_transaction_index().add_many(inserted)
+        rollups = get_weekly_rollups()
+        for entry in inserted:
+            rollups.apply_insert(entry)
+        invalidate_slip_queries()
+    return [None if row["ok"] else row["error"] for row in report]
+
+@handler("sync_sheets")
+def _sync_sheets(job: Dict):
+    from modules.google_sync import save_to_google_sheets
+    save_to_google_sheets(full=job["payload"].get("full", False))
+
+def enqueue_sheet_sync(full: bool = False) -> int:
+    """Queue a Google Sheets sync unless one is already waiting"""
+    return get_job_queue().enqueue("sync_sheets", {"full": full}, dedup_key="sync_sheets", coalesce=True, max_attempts=3)
+
+if __name__ == "__main__":
+    # python -m modules.jobs work|status|purge
+    command = sys.argv[1] if len(sys.argv) > 1 else None
+    if command == "work":
+        queue = get_job_queue(start=False)
+        queue.start()
+        print(f"Running {JOB_WORKERS} workers on {queue.path}, Ctrl+C to stop")
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            queue.stop()
+    elif command == "status":
+        print(json.dumps(get_job_queue(start=False).counts()))
+    elif command == "purge":
+        print(f"Removed {get_job_queue(start=False).purge()} finished jobs")
+    else:
+        sys.exit("Usage: python -m modules.jobs work|status|purge")
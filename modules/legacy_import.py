@@ -0,0 +1,408 @@
+"""Import the legacy spreadsheet-era data into the repository.
+
+    python -m modules.legacy_import                  # the default legacy files
+    python -m modules.legacy_import --dry-run        # parse and count only
+    python -m modules.legacy_import data/old.xlsx    # specific files or globs
+
+Files are streamed (openpyxl read-only mode, csv and JSONL line by line)
+and written in batches of IMPORT_BATCH_SIZE, so memory stays bounded by
+the batch size plus one 64-bit dedup key (about 100 bytes in a set) per
+distinct imported row. Slips get a
+deterministic idempotency_key, so rows repeated across the main workbook
+and its backups, or a re-run of the import, are skipped.
+"""
+import argparse
+import csv
+import glob
+import hashlib
+import json
+import os
+import sys
+import time
+from collections import Counter
+from datetime import datetime
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+from modules.storage import get_repository
+
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", "1000"))
+DEFAULT_SOURCES = [
+    "branch_data.json",
+    "data/all_branch_data.xlsx",
+    "data/backups/*.xlsx",
+    "data/requests.csv",
+]
+
+# Legacy column headers -> repository columns; snake_case headers map to themselves
+_SLIP_HEADERS = {
+    "Rider Name": "rider_name",
+    "Rider": "rider_name",
+    "Slip Type": "slip_type",
+    "Slip Quantity": "quantity",
+    "Quantity": "quantity",
+    "Transaction ID": "transaction_id",
+    "Serial Number": "transaction_id",
+    "Image Path": "image_path",
+    "Submitted By": "manager_name",
+    "Manager Name": "manager_name",
+    "Branch Code": "branch_code",
+    "Week": "week",
+    "Commission": "commission",
+    "Status": "status",
+    "Submitted At": "submitted_at",
+}
+_REQUEST_HEADERS = {
+    "Branch Code": "branch_code",
+    "Requested By": "requested_by",
+    "Description": "description",
+    "Timestamp": "requested_at",
+    "Requested At": "requested_at",
+    "Status": "status",
+    "Request Type": "request_type",
+}
+_REQUEST_STATUSES = {"resolved": "approved", "done": "approved", "closed": "approved"}
+TABLES = ["branches", "riders", "slips", "change_requests"]
+
+def _key(*parts) -> int:
+    digest = hashlib.blake2b("\x1f".join(str(p) for p in parts).encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big")
+
+def _text(value) -> Optional[str]:
+    if value is None:
+        return None
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    if isinstance(value, datetime):
+        return value.isoformat()
+    text = str(value).strip()
+    return text or None
+
+def _rename(row: Dict, headers: Dict[str, str]) -> Dict:
+    renamed = {}
+    for column, value in row.items():
+        if column is None:
+            continue
+        column = str(column).strip()
+        renamed[headers.get(column, column.lower().replace(" ", "_"))] = value
+    return renamed
+
+def iter_xlsx(path: str) -> Iterator[Tuple[str, Dict]]:
+    """Yield (sheet title, row) for every data row, one row in memory at a time"""
+    from openpyxl import load_workbook
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        for sheet in workbook.worksheets:
+            header = None
+            for values in sheet.iter_rows(values_only=True):
+                if not any(v is not None and v != "" for v in values):
+                    continue
+                if header is None:
+                    header = [_text(v) for v in values]
+                    continue
+                yield sheet.title, dict(zip(header, values))
+    finally:
+        workbook.close()
+
+def iter_csv(path: str) -> Iterator[Tuple[str, Dict]]:
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        for row in csv.DictReader(f):
+            yield os.path.basename(path), row
+
+def iter_jsonl(path: str) -> Iterator[Tuple[str, Dict]]:
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                try:
+                    row = json.loads(line)
+                except ValueError:
+                    row = None
+                yield os.path.basename(path), row if isinstance(row, dict) else {}
+
+def _submitted_at(image_name: Optional[str], week: Optional[str]) -> Optional[str]:
+    # Legacy image files are named "<unix time>_<original name>"
+    prefix = (image_name or "").split("_", 1)[0]
+    if prefix.isdigit() and len(prefix) >= 9:
+        return datetime.fromtimestamp(int(prefix)).isoformat()
+    if week and len(week) >= 10:
+        return f"{week[:10]}T00:00:00"
+    return None
+
+def normalize_slip(row: Dict, slip_images_dir: Optional[str] = None) -> Optional[Dict]:
+    """Map a legacy slip row to a slips row, or None if it is not a usable slip"""
+    row = _rename(row, _SLIP_HEADERS)
+    branch_code, rider_name = _text(row.get("branch_code")), _text(row.get("rider_name"))
+    slip_type = _text(row.get("slip_type"))
+    if not branch_code or not rider_name or not slip_type:
+        return None
+    try:
+        quantity = int(float(row.get("quantity") or 0))
+        commission = float(row["commission"]) if _text(row.get("commission")) is not None else None
+    except (TypeError, ValueError):
+        return None
+    if quantity <= 0:
+        return None
+    week = _text(row.get("week"))
+    image_name = _text(row.get("image_path"))
+    image_path = image_hash = None
+    if image_name:
+        image_name = os.path.basename(image_name)
+        image_path = f"{branch_code}/{rider_name}/{image_name}"
+        local = os.path.join(slip_images_dir, image_path) if slip_images_dir else None
+        if local and os.path.exists(local):
+            digest = hashlib.sha256()
+            with open(local, "rb") as f:
+                for block in iter(lambda: f.read(1 << 16), b""):
+                    digest.update(block)
+            image_hash = digest.hexdigest()
+    if commission is None:
+        from modules.utils import calculate_commission
+        commission = calculate_commission(slip_type, quantity, on=week[:10] if week else None)
+    slip = {
+        "branch_code": branch_code,
+        "rider_name": rider_name,
+        "slip_type": slip_type,
+        "quantity": quantity,
+        "commission": commission,
+        "status": (_text(row.get("status")) or "pending").lower(),
+        "week": week,
+        "transaction_id": _text(row.get("transaction_id")),
+        "manager_name": _text(row.get("manager_name")),
+        "image_path": image_path,
+        "image_hash": image_hash,
+        "submitted_at": _text(row.get("submitted_at")) or _submitted_at(image_name, week),
+    }
+    identity = [slip[c] for c in ("branch_code", "rider_name", "slip_type", "quantity", "week", "transaction_id", "image_path")]
+    slip["idempotency_key"] = f"legacy-{_key(*identity):016x}"
+    return slip
+
+def normalize_change_request(row: Dict) -> Optional[Dict]:
+    """Map a legacy change request row to a change_requests row, or None"""
+    row = _rename(row, _REQUEST_HEADERS)
+    branch_code, description = _text(row.get("branch_code")), _text(row.get("description"))
+    if not branch_code or not description:
+        return None
+    status = (_text(row.get("status")) or "pending").lower()
+    request_type = _text(row.get("request_type"))
+    return {
+        "branch_code": branch_code,
+        "description": f"[{request_type}] {description}" if request_type and request_type != "Change" else description,
+        "status": _REQUEST_STATUSES.get(status, status),
+        "requested_at": _text(row.get("requested_at")),
+        "requested_by": _text(row.get("requested_by")) or "Unknown",
+    }
+
+def _request_key(request: Dict) -> int:
+    return _key(request["branch_code"], request["requested_at"], request["description"])
+
+class LegacyImporter:
+    """Stream legacy files into branches, riders, slips and change_requests.
+
+    `progress` is called with the stats after every written batch. Stats
+    count, per table, rows read, written, skipped as duplicates, invalid
+    and failed. Slips already in the table are caught by their
+    idempotency_key on insert, so on a re-run they count as written.
+    """
+
+    def __init__(self, repository=None, batch_size: int = IMPORT_BATCH_SIZE, dry_run: bool = False,
+                 progress: Optional[Callable[[Dict], None]] = None, slip_images_dir: Optional[str] = None):
+        from modules.hash_index import SLIP_IMAGES_DIR
+        self.repository = repository or get_repository()
+        self.batch_size = max(1, batch_size)
+        self.dry_run = dry_run
+        self.progress = progress
+        self.slip_images_dir = slip_images_dir or SLIP_IMAGES_DIR
+        self.stats = {table: Counter() for table in TABLES}
+        self.started = time.perf_counter()
+        self._slips: List[Dict] = []
+        self._requests: List[Dict] = []
+        self._slip_keys = set()
+        self._request_keys = None
+        self._branches = None
+
+    def _known_branches(self) -> set:
+        if self._branches is None:
+            self._branches = {branch["code"] for branch in self.repository.list_branches()}
+        return self._branches
+
+    def _known_requests(self) -> set:
+        # change_requests has no natural key, so existing rows are fetched once
+        if self._request_keys is None:
+            self._request_keys, after_id = set(), None
+            while True:
+                rows = self.repository.change_request_page({}, after_id, 1000)
+                self._request_keys.update(_request_key(row) for row in rows if row.get("branch_code"))
+                if len(rows) < 1000:
+                    break
+                after_id = rows[-1]["id"]
+        return self._request_keys
+
+    def _branch(self, code: str, name: str):
+        stats = self.stats["branches"]
+        stats["read"] += 1
+        if code in self._known_branches():
+            stats["duplicates"] += 1
+            return
+        self._branches.add(code)
+        if not self.dry_run:
+            self.repository.insert_branch({"code": code, "name": name, "riders": []})
+        stats["written"] += 1
+
+    def add_slip(self, row: Dict, sheet: Optional[str] = None):
+        stats = self.stats["slips"]
+        stats["read"] += 1
+        slip = normalize_slip(row, self.slip_images_dir)
+        if slip is None:
+            stats["invalid"] += 1
+            return
+        key = _key(slip["idempotency_key"])
+        if key in self._slip_keys:
+            stats["duplicates"] += 1
+            return
+        self._slip_keys.add(key)
+        if sheet and slip["branch_code"] not in self._known_branches():
+            # Legacy workbooks had one sheet per branch, titled with its name
+            self._branch(slip["branch_code"], sheet)
+        self._slips.append(slip)
+        if len(self._slips) >= self.batch_size:
+            self.flush()
+
+    def add_change_request(self, row: Dict):
+        stats = self.stats["change_requests"]
+        stats["read"] += 1
+        request = normalize_change_request(row)
+        if request is None:
+            stats["invalid"] += 1
+            return
+        key = _request_key(request)
+        if key in self._known_requests():
+            stats["duplicates"] += 1
+            return
+        self._request_keys.add(key)
+        self._requests.append(request)
+        if len(self._requests) >= self.batch_size:
+            self.flush()
+
+    def import_branch_json(self, path: str):
+        """Legacy branch_data.json: {code: [name, [riders...]]}"""
+        with open(path, encoding="utf-8") as f:
+            branches = json.load(f)
+        existing = {(r["branch_code"], r["name"]) for r in self.repository.list_riders()}
+        riders = []
+        for code, value in branches.items():
+            name, names = (value + [[]])[:2] if isinstance(value, list) else (value, [])
+            self._branch(str(code), name or str(code))
+            for rider in names or []:
+                if not rider or not rider.strip():
+                    continue
+                self.stats["riders"]["read"] += 1
+                if (str(code), rider.strip()) in existing:
+                    self.stats["riders"]["duplicates"] += 1
+                else:
+                    existing.add((str(code), rider.strip()))
+                    riders.append({"branch_code": str(code), "name": rider.strip()})
+        for start in range(0, len(riders), self.batch_size):
+            if not self.dry_run:
+                self.repository.add_riders(riders[start:start + self.batch_size])
+            self.stats["riders"]["written"] += len(riders[start:start + self.batch_size])
+
+    def import_path(self, path: str):
+        ext = os.path.splitext(path)[1].lower()
+        if ext == ".json":
+            self.import_branch_json(path)
+            return
+        if ext in (".xlsx", ".xlsm"):
+            rows = iter_xlsx(path)
+        elif ext == ".csv":
+            rows = iter_csv(path)
+        elif ext == ".jsonl":
+            rows = iter_jsonl(path)
+        else:
+            raise ValueError(f"Unsupported legacy file: {path}")
+        for sheet, row in rows:
+            headers = {str(k).strip().lower().replace(" ", "_") for k in row if k is not None}
+            if headers & {"slip_type", "rider_name"}:
+                self.add_slip(row, sheet if ext in (".xlsx", ".xlsm") else None)
+            elif "description" in headers:
+                self.add_change_request(row)
+            else:
+                self.stats["slips" if ext in (".xlsx", ".xlsm") else "change_requests"]["invalid"] += 1
+
+    def flush(self):
+        """Write the buffered slips and change requests"""
+        from modules.submission import submit_slips
+        if self._slips:
+            stats = self.stats["slips"]
+            if self.dry_run:
+                stats["written"] += len(self._slips)
+            else:
+                report = submit_slips(self._slips, chunk_size=self.batch_size)
+                ok = sum(1 for row in report if row["ok"])
+                stats["written"] += ok
+                stats["failed"] += len(report) - ok
+            self._slips = []
+        if self._requests:
+            stats = self.stats["change_requests"]
+            for request in self._requests:
+                try:
+                    if not self.dry_run:
+                        self.repository.insert_change_request(request)
+                    stats["written"] += 1
+                except Exception:
+                    stats["failed"] += 1
+            self._requests = []
+        if self.progress:
+            self.progress(self.stats)
+
+    def run(self, paths: Iterable[str]) -> Dict[str, Counter]:
+        for path in paths:
+            self.import_path(path)
+        self.flush()
+        return self.stats
+
+    def rows_per_second(self) -> float:
+        rows = sum(stats["read"] for stats in self.stats.values())
+        return rows / max(time.perf_counter() - self.started, 1e-9)
+
+def resolve_sources(patterns: Iterable[str]) -> List[str]:
+    """Expand globs, keeping the given order and skipping missing files"""
+    paths = []
+    for pattern in patterns:
+        for path in sorted(glob.glob(pattern)) if glob.has_magic(pattern) else [pattern]:
+            if os.path.isfile(path) and path not in paths:
+                paths.append(path)
+    return paths
+
+def format_stats(stats: Dict[str, Counter]) -> str:
+    return "; ".join(
+        f"{table}: " + ", ".join(f"{stats[table][k]} {k}" for k in ("read", "written", "duplicates", "invalid", "failed"))
+        for table in TABLES if stats[table]["read"]
+    )
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Import legacy Excel/CSV/JSONL data into the repository")
+    parser.add_argument("paths", nargs="*", default=DEFAULT_SOURCES, help="files or globs (default: the legacy files)")
+    parser.add_argument("--batch-size", type=int, default=IMPORT_BATCH_SIZE)
+    parser.add_argument("--dry-run", action="store_true", help="parse and count without writing")
+    args = parser.parse_args(argv)
+
+    paths = resolve_sources(args.paths)
+    if not paths:
+        print("No legacy files found")
+        return 0
+    importer = LegacyImporter(batch_size=args.batch_size, dry_run=args.dry_run)
+    importer.progress = lambda stats: print(
+        f"\r{format_stats(stats)} ({importer.rows_per_second():.0f} rows/s)", end="", file=sys.stderr, flush=True
+    )
+    for path in paths:
+        print(f"\nImporting {path}", file=sys.stderr)
+        importer.import_path(path)
+    importer.flush()
+    print(f"\n{format_stats(importer.stats)} in {time.perf_counter() - importer.started:.1f}s")
+
+    if importer.stats["slips"]["written"] and not args.dry_run:
+        # Imported rows get new ids above every index watermark, so running
+        # apps pick them up on their next refresh
+        print("Duplicate checks and weekly totals include the imported slips after their next refresh (a minute by default)")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
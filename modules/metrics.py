@@ -0,0 +1,505 @@
+"""Latency instrumentation for backend calls.
+
+Supabase queries, storage uploads, gspread calls and image decoding are
+timed and attributed to the Streamlit session and rerun that made them.
+Each rerun is summarized as one JSON log line. At METRICS_LOG_LEVEL=DEBUG
+every call is logged too and JSON request/response bodies are sized
+(binary payloads always are). Process totals are exported in the
+Prometheus text format to METRICS_FILE and, if METRICS_PORT is set, over
+HTTP at /metrics.
+"""
+import functools
+import importlib
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional
+
+METRICS_FILE = os.getenv("METRICS_FILE", "data/metrics.prom")
+METRICS_PORT = os.getenv("METRICS_PORT")
+METRICS_FLUSH_INTERVAL = int(os.getenv("METRICS_FLUSH_INTERVAL", "15"))
+METRICS_LOG_LEVEL = os.getenv("METRICS_LOG_LEVEL", "INFO")
+METRICS_MAX_SESSIONS = 500
+RERUN_CALL_LIMIT = 500
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+logger = logging.getLogger("rider_slips.metrics")
+if not logger.handlers:
+    _handler = logging.StreamHandler(sys.stderr)
+    _handler.setFormatter(logging.Formatter("%(message)s"))
+    logger.addHandler(_handler)
+    logger.setLevel(METRICS_LOG_LEVEL)
+    logger.propagate = False
+
+_lock = threading.Lock()
+_local = threading.local()
+# (kind, operation) -> {"count", "errors", "seconds", "bytes", "buckets"}
+_totals: Dict[tuple, Dict] = {}
+_reruns: Dict[str, Dict] = {}
+_sessions: "OrderedDict[str, Dict]" = OrderedDict()
+_flushed_at = 0.0
+_server = None
+_first_rerun_seen = False
+_first_paint_seen = False
+
+def _session_id() -> Optional[str]:
+    bound = getattr(_local, "session_id", None)
+    if bound:
+        return bound
+    try:
+        from streamlit.runtime.scriptrunner import get_script_run_ctx
+        ctx = get_script_run_ctx(suppress_warning=True)
+    except Exception:
+        return None
+    return ctx.session_id if ctx else None
+
+def _session(session_id: str) -> Dict:
+    session = _sessions.get(session_id)
+    if session is None:
+        session = {"reruns": 0, "page": None, "started": None, "calls": [], "last": None, "totals": {}}
+        _sessions[session_id] = session
+        while len(_sessions) > METRICS_MAX_SESSIONS:
+            _sessions.popitem(last=False)
+    else:
+        _sessions.move_to_end(session_id)
+    return session
+
+def _observe(totals: Dict, key, seconds: float, size: int, error: bool):
+    stats = totals.get(key)
+    if stats is None:
+        stats = totals[key] = {"count": 0, "errors": 0, "seconds": 0.0, "bytes": 0, "buckets": [0] * len(BUCKETS)}
+    stats["count"] += 1
+    stats["errors"] += int(error)
+    stats["seconds"] += seconds
+    stats["bytes"] += size
+    for i, bound in enumerate(BUCKETS):
+        if seconds <= bound:
+            stats["buckets"][i] += 1
+
+def payload_size(value) -> int:
+    """Approximate wire size of a request or response body in bytes.
+
+    The client libraries do not expose the raw response, so JSON bodies
+    are re-serialized to size them; that only happens at DEBUG level.
+    """
+    if value is None:
+        return 0
+    if isinstance(value, (bytes, bytearray)):
+        return len(value)
+    if not logger.isEnabledFor(logging.DEBUG):
+        return 0
+    try:
+        return len(json.dumps(value, default=str))
+    except (TypeError, ValueError):
+        return 0
+
+def record(kind: str, operation: str, seconds: float, size: int = 0, error: Optional[str] = None):
+    """Record one backend call against the process, session and current rerun"""
+    session_id = _session_id()
+    call = {
+        "kind": kind,
+        "operation": operation,
+        "ms": round(seconds * 1000, 3),
+        "bytes": size,
+        "error": error,
+    }
+    with _lock:
+        _observe(_totals, (kind, operation), seconds, size, error is not None)
+        if session_id:
+            session = _session(session_id)
+            _observe(session["totals"], (kind, operation), seconds, size, error is not None)
+            if len(session["calls"]) < RERUN_CALL_LIMIT:
+                session["calls"].append(call)
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(json.dumps({"event": "backend_call", "session": session_id, **call}))
+
+@contextmanager
+def timed(kind: str, operation: str, size: int = 0):
+    """Time a block; the yielded dict's "bytes" can be updated inside it"""
+    info = {"bytes": size}
+    start = time.perf_counter()
+    error = None
+    try:
+        yield info
+    except Exception as e:
+        error = type(e).__name__
+        raise
+    finally:
+        record(kind, operation, time.perf_counter() - start, info["bytes"], error)
+
+def scoped(func: Callable) -> Callable:
+    """Bind func to the calling session so work done in pool threads is attributed to it"""
+    session_id = _session_id()
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        previous = getattr(_local, "session_id", None)
+        _local.session_id = session_id
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _local.session_id = previous
+    return wrapper
+
+def _process_age() -> Optional[float]:
+    """Seconds since this process started (Linux only)"""
+    try:
+        with open("/proc/self/stat") as f:
+            start_ticks = int(f.read().rsplit(")", 1)[1].split()[19])
+        with open("/proc/uptime") as f:
+            uptime = float(f.read().split()[0])
+        return uptime - start_ticks / os.sysconf("SC_CLK_TCK")
+    except (OSError, ValueError, IndexError):
+        return None
+
+def timed_import(name: str):
+    """Import a module, recording the time taken if it was not loaded yet"""
+    if name in sys.modules:
+        # import_module waits if another session's thread is still loading it
+        return importlib.import_module(name)
+    with timed("startup", f"import {name}"):
+        return importlib.import_module(name)
+
+def start_rerun(page: Optional[str] = None):
+    global _first_rerun_seen
+    session_id = _session_id()
+    if not session_id:
+        return
+    if not _first_rerun_seen:
+        _first_rerun_seen = True
+        # Interpreter start, Streamlit boot and the first connection up to this script run
+        age = _process_age()
+        if age is not None:
+            record("startup", "process_to_first_rerun", age)
+    with _lock:
+        session = _session(session_id)
+        session["reruns"] += 1
+        session["page"] = page
+        session["started"] = time.perf_counter()
+        session["calls"] = []
+    _ensure_server()
+
+def finish_rerun():
+    """Log a summary of the session's current rerun and flush the metrics file"""
+    global _first_paint_seen
+    session_id = _session_id()
+    if not session_id:
+        return
+    with _lock:
+        session = _sessions.get(session_id)
+        if not session or session["started"] is None:
+            return
+        wall = time.perf_counter() - session["started"]
+        session["started"] = None
+        calls = list(session["calls"])
+        page = session["page"]
+        reruns = session["reruns"]
+        _observe(_reruns, page or "", wall, 0, False)
+        first_paint = reruns == 1
+        first_in_process = first_paint and not _first_paint_seen
+        _first_paint_seen = _first_paint_seen or first_paint
+    if first_paint:
+        record("startup", "session_first_paint", wall)
+    if first_in_process:
+        record("startup", "process_first_paint", wall)
+    by_operation: Dict[str, List] = {}
+    for call in calls:
+        stats = by_operation.setdefault(f"{call['kind']}:{call['operation']}", [0, 0.0])
+        stats[0] += 1
+        stats[1] += call["ms"]
+    summary = {
+        "event": "rerun",
+        "session": session_id,
+        "page": page,
+        "rerun": reruns,
+        "wall_ms": round(wall * 1000, 3),
+        "backend_ms": round(sum(call["ms"] for call in calls), 3),
+        "calls": len(calls),
+        "bytes": sum(call["bytes"] for call in calls),
+        "errors": sum(1 for call in calls if call["error"]),
+        "by_operation": {name: {"calls": count, "ms": round(ms, 3)} for name, (count, ms) in by_operation.items()},
+    }
+    with _lock:
+        session["last"] = {**summary, "call_log": calls}
+    logger.info(json.dumps(summary))
+    flush()
+
+def set_page(page: str):
+    """Label the current rerun, e.g. once the app knows which panel it renders"""
+    with _lock:
+        session = _sessions.get(_session_id() or "")
+        if session:
+            session["page"] = page
+
+@contextmanager
+def rerun(page: Optional[str] = None):
+    """Wrap one script run: start_rerun() before, finish_rerun() after (also on st.rerun/st.stop)"""
+    start_rerun(page)
+    try:
+        yield
+    finally:
+        finish_rerun()
+
+def _rows(totals: Dict) -> List[Dict]:
+    return [
+        {
+            "kind": key[0],
+            "operation": key[1],
+            "calls": stats["count"],
+            "errors": stats["errors"],
+            "total_ms": round(stats["seconds"] * 1000, 3),
+            "avg_ms": round(stats["seconds"] * 1000 / stats["count"], 3),
+            "bytes": stats["bytes"],
+        }
+        for key, stats in sorted(totals.items(), key=lambda item: -item[1]["seconds"])
+    ]
+
+def rerun_calls() -> List[Dict]:
+    """Calls made so far in the current session's rerun"""
+    with _lock:
+        session = _sessions.get(_session_id() or "")
+        return list(session["calls"]) if session else []
+
+def last_rerun() -> Optional[Dict]:
+    """Summary and call log of the session's previous completed rerun"""
+    with _lock:
+        session = _sessions.get(_session_id() or "")
+        return session["last"] if session else None
+
+def session_totals() -> List[Dict]:
+    with _lock:
+        session = _sessions.get(_session_id() or "")
+        return _rows(session["totals"]) if session else []
+
+def process_totals() -> List[Dict]:
+    with _lock:
+        return _rows(_totals)
+
+def _label(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _histogram(lines: List[str], name: str, labels: str, stats: Dict):
+    for bound, count in zip(BUCKETS, stats["buckets"]):
+        lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {count}')
+    lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {stats["count"]}')
+    lines.append(f"{name}_sum{{{labels}}} {stats['seconds']:.6f}")
+    lines.append(f"{name}_count{{{labels}}} {stats['count']}")
+
+def render_prometheus() -> str:
+    """Process totals in the Prometheus text exposition format"""
+    with _lock:
+        totals = {key: dict(stats) for key, stats in _totals.items()}
+        reruns = {key: dict(stats) for key, stats in _reruns.items()}
+        sessions = len(_sessions)
+    lines = [
+        "# HELP rider_slips_backend_call_seconds Latency of backend calls.",
+        "# TYPE rider_slips_backend_call_seconds histogram",
+    ]
+    for (kind, operation), stats in sorted(totals.items()):
+        _histogram(lines, "rider_slips_backend_call_seconds", f'kind="{_label(kind)}",operation="{_label(operation)}"', stats)
+    lines += [
+        "# HELP rider_slips_backend_call_errors_total Backend calls that raised.",
+        "# TYPE rider_slips_backend_call_errors_total counter",
+    ]
+    for (kind, operation), stats in sorted(totals.items()):
+        lines.append(f'rider_slips_backend_call_errors_total{{kind="{_label(kind)}",operation="{_label(operation)}"}} {stats["errors"]}')
+    lines += [
+        "# HELP rider_slips_backend_payload_bytes_total Request plus response payload bytes (JSON bodies only at DEBUG).",
+        "# TYPE rider_slips_backend_payload_bytes_total counter",
+    ]
+    for (kind, operation), stats in sorted(totals.items()):
+        lines.append(f'rider_slips_backend_payload_bytes_total{{kind="{_label(kind)}",operation="{_label(operation)}"}} {stats["bytes"]}')
+    lines += [
+        "# HELP rider_slips_rerun_seconds Wall time of Streamlit reruns.",
+        "# TYPE rider_slips_rerun_seconds histogram",
+    ]
+    for page, stats in sorted(reruns.items()):
+        _histogram(lines, "rider_slips_rerun_seconds", f'page="{_label(page)}"', stats)
+    lines += [
+        "# HELP rider_slips_tracked_sessions Sessions with recorded metrics.",
+        "# TYPE rider_slips_tracked_sessions gauge",
+        f"rider_slips_tracked_sessions {sessions}",
+    ]
+    return "\n".join(lines) + "\n"
+
+def flush(force: bool = False):
+    """Write METRICS_FILE atomically, at most every METRICS_FLUSH_INTERVAL seconds"""
+    global _flushed_at
+    now = time.monotonic()
+    if not METRICS_FILE or (not force and now - _flushed_at < METRICS_FLUSH_INTERVAL):
+        return
+    _flushed_at = now
+    try:
+        os.makedirs(os.path.dirname(METRICS_FILE) or ".", exist_ok=True)
+        tmp_path = f"{METRICS_FILE}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(render_prometheus())
+        os.replace(tmp_path, METRICS_FILE)
+    except OSError as e:
+        logger.warning(json.dumps({"event": "metrics_flush_failed", "error": str(e)}))
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = render_prometheus().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def _ensure_server():
+    global _server
+    if not METRICS_PORT or _server is not None:
+        return
+    with _lock:
+        if _server is None:
+            try:
+                _server = ThreadingHTTPServer(("0.0.0.0", int(METRICS_PORT)), _MetricsHandler)
+            except OSError as e:
+                # Another process (e.g. a second Streamlit worker) already serves the port
+                _server = False
+                logger.warning(json.dumps({"event": "metrics_server_failed", "error": str(e)}))
+                return
+            threading.Thread(target=_server.serve_forever, name="metrics-http", daemon=True).start()
+
+# Supabase
+
+_QUERY_ACTIONS = ("select", "insert", "upsert", "update", "delete")
+
+class _InstrumentedQuery:
+    def __init__(self, builder, table: str, action: str = "select", request_bytes: int = 0):
+        self._builder = builder
+        self._table = table
+        self._action = action
+        self._request_bytes = request_bytes
+
+    def execute(self):
+        with timed("supabase", f"{self._table}.{self._action}", self._request_bytes) as info:
+            response = self._builder.execute()
+            info["bytes"] += payload_size(getattr(response, "data", None))
+        return response
+
+    def __getattr__(self, name):
+        attr = getattr(self._builder, name)
+        if not callable(attr):
+            return attr
+
+        @functools.wraps(attr)
+        def chain(*args, **kwargs):
+            result = attr(*args, **kwargs)
+            if not hasattr(result, "execute"):
+                return result
+            action = name if name in _QUERY_ACTIONS else self._action
+            request_bytes = payload_size(args[0]) if name in ("insert", "upsert", "update") and args else self._request_bytes
+            return _InstrumentedQuery(result, self._table, action, request_bytes)
+        return chain
+
+class _InstrumentedBucket:
+    def __init__(self, bucket, name: str):
+        self._bucket = bucket
+        self._name = name
+
+    def __getattr__(self, name):
+        attr = getattr(self._bucket, name)
+        if not callable(attr) or name.startswith("_"):
+            return attr
+
+        @functools.wraps(attr)
+        def call(*args, **kwargs):
+            size = len(args[1]) if name in ("upload", "update") and len(args) > 1 else 0
+            with timed("storage", f"{self._name}.{name}", size) as info:
+                result = attr(*args, **kwargs)
+                if isinstance(result, (bytes, bytearray)):
+                    info["bytes"] += len(result)
+            return result
+        return call
+
+class _InstrumentedStorage:
+    def __init__(self, storage):
+        self._storage = storage
+
+    def from_(self, bucket: str):
+        return _InstrumentedBucket(self._storage.from_(bucket), bucket)
+
+    def __getattr__(self, name):
+        return getattr(self._storage, name)
+
+class InstrumentedSupabase:
+    """Supabase client proxy that times every query and storage call"""
+
+    def __init__(self, client):
+        self._client = client
+
+    def table(self, name: str):
+        return _InstrumentedQuery(self._client.table(name), name)
+
+    @property
+    def storage(self):
+        return _InstrumentedStorage(self._client.storage)
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+def instrument_supabase(client) -> InstrumentedSupabase:
+    return client if isinstance(client, InstrumentedSupabase) else InstrumentedSupabase(client)
+
+# gspread
+
+_GSPREAD_WRITES = ("update", "batch_update", "append_row", "append_rows", "update_cells", "values_update")
+
+def _gspread_label(obj) -> Optional[str]:
+    # Checked on the class: on instances, properties like sheet1 hit the API
+    cls = type(obj)
+    if hasattr(cls, "sheet1") and hasattr(cls, "worksheet"):
+        return "spreadsheet"
+    if hasattr(cls, "batch_update") and hasattr(cls, "batch_clear"):
+        return "worksheet"
+    return None
+
+class InstrumentedGspread:
+    """gspread client/spreadsheet/worksheet proxy that times every API method"""
+
+    def __init__(self, target, label: str = "client"):
+        self._target = target
+        self._label = label
+
+    def _wrap(self, value):
+        label = _gspread_label(value)
+        return InstrumentedGspread(value, label) if label else value
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            return getattr(self._target, name)
+        start = time.perf_counter()
+        attr = getattr(self._target, name)
+        if not callable(attr):
+            wrapped = self._wrap(attr)
+            if wrapped is not attr:
+                # Properties such as sheet1 fetch metadata from the API
+                record("gspread", f"{self._label}.{name}", time.perf_counter() - start)
+            return wrapped
+
+        @functools.wraps(attr)
+        def call(*args, **kwargs):
+            size = payload_size(args[0] if args else kwargs.get("values")) if name in _GSPREAD_WRITES else 0
+            with timed("gspread", f"{self._label}.{name}", size) as info:
+                result = attr(*args, **kwargs)
+                if isinstance(result, list):
+                    info["bytes"] += payload_size(result)
+            return self._wrap(result)
+        return call
+
+def instrument_gspread(client) -> InstrumentedGspread:
+    return client if isinstance(client, InstrumentedGspread) else InstrumentedGspread(client)
@@ -0,0 +1,168 @@
+import os
+import threading
+import time
+from typing import Iterable, List, Tuple
+import numpy as np
+from PIL import Image
+from modules.hash_index import iter_slip_rows
+
+DUPLICATE_MODE = os.getenv("DUPLICATE_MODE", "perceptual")
+PERCEPTUAL_HASH = os.getenv("PERCEPTUAL_HASH", "dhash")
+PHASH_MAX_DISTANCE = int(os.getenv("PHASH_MAX_DISTANCE", "4"))
+PHASH_INDEX_REFRESH = int(os.getenv("PHASH_INDEX_REFRESH", "60"))
+
+def _pack_bits(bits: np.ndarray) -> int:
+    return int.from_bytes(np.packbits(bits.astype(np.uint8).ravel()).tobytes(), "big")
+
+def dhash(image: Image.Image, size: int = 8) -> int:
+    """64-bit difference hash: sign of horizontal gradients on a 9x8 thumbnail"""
+    pixels = np.asarray(image.convert("L").resize((size + 1, size), Image.LANCZOS), dtype=np.int16)
+    return _pack_bits(pixels[:, 1:] > pixels[:, :-1])
+
+def _dct_matrix(n: int) -> np.ndarray:
+    k = np.arange(n)
+    matrix = np.cos(np.pi * (2 * k[None, :] + 1) * k[:, None] / (2 * n)) * np.sqrt(2 / n)
+    matrix[0] /= np.sqrt(2)
+    return matrix
+
+_DCT_32 = _dct_matrix(32)
+
+def phash(image: Image.Image) -> int:
+    """64-bit DCT hash: low-frequency coefficients of a 32x32 thumbnail vs their median"""
+    pixels = np.asarray(image.convert("L").resize((32, 32), Image.LANCZOS), dtype=np.float64)
+    low = (_DCT_32 @ pixels @ _DCT_32.T)[:8, :8].ravel()
+    return _pack_bits(low > np.median(low[1:]))
+
+def perceptual_hash(image: Image.Image) -> str:
+    """Hash an image with the configured algorithm, as 16 hex digits"""
+    value = phash(image) if PERCEPTUAL_HASH == "phash" else dhash(image)
+    return f"{value:016x}"
+
+def hamming(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+class BKTree:
+    """Burkhard-Keller tree over 64-bit hashes under Hamming distance.
+
+    Each node is [hash, items, children] where children maps the distance
+    to the parent onto the child node. A radius query only descends into
+    children whose edge distance lies within radius of the query distance.
+    """
+
+    def __init__(self):
+        self.root = None
+        self.size = 0
+
+    def add(self, value: int, item):
+        self.size += 1
+        if self.root is None:
+            self.root = [value, [item], {}]
+            return
+        node = self.root
+        while True:
+            distance = hamming(value, node[0])
+            if distance == 0:
+                node[1].append(item)
+                return
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = [value, [item], {}]
+                return
+            node = child
+
+    def search(self, value: int, radius: int) -> List[Tuple[int, object]]:
+        """Return (distance, item) for every item within radius, nearest first"""
+        if self.root is None:
+            return []
+        matches = []
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            distance = hamming(value, node[0])
+            if distance <= radius:
+                matches.extend((distance, item) for item in node[1])
+            for edge, child in node[2].items():
+                if distance - radius <= edge <= distance + radius:
+                    stack.append(child)
+        matches.sort(key=lambda match: match[0])
+        return matches
+
+class NearDuplicateIndex:
+    """Process-wide BK-tree of perceptual hashes of submitted slip images"""
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __new__(cls):
+        with cls._instance_lock:
+            if cls._instance is None:
+                instance = super().__new__(cls)
+                instance._lock = threading.RLock()
+                instance._tree = BKTree()
+                instance._seen = set()
+                instance._watermark = None
+                instance._refreshed_at = 0.0
+                instance._seeded = False
+                cls._instance = instance
+        return cls._instance
+
+    def _insert(self, slip: dict):
+        key = (slip.get('image_phash'), slip.get('image_path'))
+        if not slip.get('image_phash') or key in self._seen:
+            return
+        self._seen.add(key)
+        self._tree.add(int(slip['image_phash'], 16), {
+            "image_path": slip.get('image_path'),
+            "branch_code": slip.get('branch_code'),
+            "rider_name": slip.get('rider_name'),
+            "submitted_at": slip.get('submitted_at'),
+        })
+
+    def _pull_slips(self):
+        columns = ['image_phash', 'image_path', 'branch_code', 'rider_name', 'submitted_at']
+        for row in iter_slip_rows(columns, self._watermark):
+            self._insert(row)
+            self._watermark = row['id']
+        self._refreshed_at = time.monotonic()
+        self._seeded = True
+
+    def _ensure_fresh(self):
+        if not self._seeded or time.monotonic() - self._refreshed_at >= PHASH_INDEX_REFRESH:
+            self._pull_slips()
+
+    def find(self, image_phash: str, max_distance: int = PHASH_MAX_DISTANCE) -> List[Tuple[int, dict]]:
+        """Return (distance, slip) pairs within max_distance, nearest first"""
+        with self._lock:
+            self._ensure_fresh()
+            return self._tree.search(int(image_phash, 16), max_distance)
+
+    def add_many(self, slips: Iterable[dict]):
+        with self._lock:
+            for slip in slips:
+                self._insert(slip)
+
+def get_near_duplicate_index() -> NearDuplicateIndex:
+    return NearDuplicateIndex()
+
+def check_near_duplicates(image_phash: str, pending: Iterable[dict] = (),
+                          max_distance: int = PHASH_MAX_DISTANCE) -> List[Tuple[int, dict]]:
+    """Match a perceptual hash against the unsubmitted batch and submitted slips"""
+    value = int(image_phash, 16)
+    matches = []
+    for slip in pending:
+        if slip.get('image_phash'):
+            distance = hamming(value, int(slip['image_phash'], 16))
+            if distance <= max_distance:
+                matches.append((distance, slip))
+    matches.extend(get_near_duplicate_index().find(image_phash, max_distance))
+    matches.sort(key=lambda match: match[0])
+    return matches
+
+def near_duplicate_flag(matches: List[Tuple[int, dict]]) -> dict:
+    """Slip fields recording the nearest match for admin review (all None when unmatched)"""
+    if not matches:
+        return {"near_duplicate_of": None, "near_duplicate_distance": None}
+    distance, slip = matches[0]
+    return {"near_duplicate_of": slip.get('image_path'), "near_duplicate_distance": distance}
+
+def perceptual_check_enabled() -> bool:
+    return DUPLICATE_MODE == "perceptual"
@@ -0,0 +1,236 @@
+import os
+import sys
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+from modules.hash_index import iter_slip_rows
+from modules.storage import get_repository
+
+ROLLUP_COLUMNS = ['branch_code', 'week', 'rider_name', 'slip_type', 'status', 'quantity', 'commission', 'submitted_at']
+ROLLUP_REFRESH = int(os.getenv("ROLLUP_REFRESH", "60"))
+# Optional safety net: a full rebuild every this many seconds (0 disables it)
+ROLLUP_REBUILD_INTERVAL = int(os.getenv("ROLLUP_REBUILD_INTERVAL", "0"))
+STATUS_CHANGE_PAGE_SIZE = 1000
+
+# cells[week][branch_code][(rider_name, slip_type, status)] = [count, quantity, commission]
+Cells = Dict[str, Dict[str, Dict[Tuple[str, str, str], List]]]
+
+def _add(cells: Cells, slip: Dict, status: str, sign: int):
+    key = (slip['rider_name'], slip['slip_type'], status)
+    week, branch_code = slip['week'], slip['branch_code']
+    if sign < 0 and key not in cells.get(week, {}).get(branch_code, {}):
+        return
+    branches = cells.setdefault(week, {})
+    group = branches.setdefault(branch_code, {})
+    cell = group.setdefault(key, [0, 0, 0.0])
+    cell[0] += sign
+    cell[1] += sign * int(slip.get('quantity') or 0)
+    # Rounded to cents on every step so the totals do not depend on the
+    # order slips were applied in
+    cell[2] = round(cell[2] + sign * float(slip.get('commission') or 0), 2)
+    if cell[0] == 0:
+        del group[key]
+        if not group:
+            del branches[branch_code]
+            if not branches:
+                del cells[week]
+
+def build_cells(slips: Iterable[Dict]) -> Cells:
+    """Aggregate slips from scratch"""
+    cells: Cells = {}
+    for slip in slips:
+        _add(cells, slip, slip.get('status') or 'pending', 1)
+    return cells
+
+class WeeklyRollups:
+    """Process-wide weekly totals per branch and rider.
+
+    Totals are keyed by week, then branch_code, and updated in place as
+    slips are inserted, change status or are deleted, so a summary,
+    leaderboard or branch total only touches that week's cells. Every
+    ROLLUP_REFRESH seconds new slips and the slip_status_changes log
+    (written by a database trigger) are pulled past their id watermarks,
+    so inserts, status changes and deletes made by other processes reach
+    the totals without a full rebuild.
+    """
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __new__(cls):
+        with cls._instance_lock:
+            if cls._instance is None:
+                instance = super().__new__(cls)
+                instance._lock = threading.RLock()
+                instance._cells = {}
+                # slip key -> status the slip is counted under
+                instance._seen = {}
+                instance._watermark = None
+                instance._status_watermark = None
+                instance._refreshed_at = 0.0
+                instance._rebuilt_at = 0.0
+                cls._instance = instance
+        return cls._instance
+
+    def _slip_key(self, slip: Dict):
+        return slip.get('idempotency_key') or slip.get('id') or (
+            slip['branch_code'], slip['rider_name'], slip.get('transaction_id'), slip.get('submitted_at')
+        )
+
+    def rebuild(self):
+        """Recompute every total from the slips table"""
+        with self._lock:
+            # Read the log position first: changes made while the slips are
+            # read are replayed afterwards and converge on the same status
+            status_watermark = get_repository().last_status_change_id()
+            rows = list(iter_slip_rows(ROLLUP_COLUMNS + ['id', 'idempotency_key']))
+            self._cells = build_cells(rows)
+            self._seen = {self._slip_key(row): row.get('status') or 'pending' for row in rows}
+            self._watermark = rows[-1]['id'] if rows else None
+            self._status_watermark = status_watermark
+            self._refreshed_at = self._rebuilt_at = time.monotonic()
+
+    def refresh(self):
+        """Pull slips inserted and status changes logged since the last pull"""
+        with self._lock:
+            if not self._rebuilt_at:
+                self.rebuild()
+                return
+            for row in iter_slip_rows(ROLLUP_COLUMNS + ['id', 'idempotency_key'], self._watermark):
+                self.apply_insert(row)
+                self._watermark = row['id']
+            repository = get_repository()
+            while True:
+                changes = repository.status_changes_after(self._status_watermark, STATUS_CHANGE_PAGE_SIZE)
+                for change in changes:
+                    slip = {**change, 'id': change['slip_id']}
+                    if change['new_status'] is None:
+                        self.apply_delete(slip)
+                    else:
+                        self.apply_status_change(slip, change['old_status'], change['new_status'])
+                    self._status_watermark = change['id']
+                if len(changes) < STATUS_CHANGE_PAGE_SIZE:
+                    break
+            self._refreshed_at = time.monotonic()
+
+    def _ensure_fresh(self):
+        now = time.monotonic()
+        if not self._rebuilt_at or (ROLLUP_REBUILD_INTERVAL and now - self._rebuilt_at >= ROLLUP_REBUILD_INTERVAL):
+            self.rebuild()
+        elif now - self._refreshed_at >= ROLLUP_REFRESH:
+            self.refresh()
+
+    def apply_insert(self, slip: Dict):
+        with self._lock:
+            key = self._slip_key(slip)
+            if key in self._seen:
+                return
+            status = slip.get('status') or 'pending'
+            self._seen[key] = status
+            _add(self._cells, slip, status, 1)
+
+    def apply_status_change(self, slip: Dict, old_status: str, new_status: str):
+        """Move a slip to new_status.
+
+        The slip leaves the status it is currently counted under, which may
+        differ from old_status when changes arrive out of order; slips not
+        counted yet are left to the next insert pull.
+        """
+        with self._lock:
+            key = self._slip_key(slip)
+            current = self._seen.get(key)
+            if current is None or current == new_status:
+                return
+            self._seen[key] = new_status
+            _add(self._cells, slip, current, -1)
+            _add(self._cells, slip, new_status, 1)
+
+    def apply_delete(self, slip: Dict):
+        with self._lock:
+            current = self._seen.pop(self._slip_key(slip), None)
+            if current is not None:
+                _add(self._cells, slip, current, -1)
+
+    def summary(self, branch_code: str, week: str) -> List[Dict]:
+        """Totals by rider, slip_type and status for one branch/week"""
+        with self._lock:
+            self._ensure_fresh()
+            group = self._cells.get(week, {}).get(branch_code, {})
+            return [
+                {
+                    "rider_name": rider,
+                    "slip_type": slip_type,
+                    "status": status,
+                    "slips": count,
+                    "quantity": quantity,
+                    "commission": commission
+                }
+                for (rider, slip_type, status), (count, quantity, commission) in sorted(group.items())
+            ]
+
+    def branch_totals(self, week: str) -> List[Dict]:
+        """One row per branch with slips in the week"""
+        with self._lock:
+            self._ensure_fresh()
+            return [
+                {
+                    "branch_code": branch_code,
+                    "slips": sum(cell[0] for cell in group.values()),
+                    "quantity": sum(cell[1] for cell in group.values()),
+                    "commission": round(sum(cell[2] for cell in group.values()), 2)
+                }
+                for branch_code, group in sorted(self._cells.get(week, {}).items())
+            ]
+
+    def leaderboard(self, branch_code: str, week: str, status: Optional[str] = None,
+                    limit: int = 10) -> List[Dict]:
+        """Riders of a branch ranked by commission for the week"""
+        riders: Dict[str, List] = {}
+        for row in self.summary(branch_code, week):
+            if status and row["status"] != status:
+                continue
+            total = riders.setdefault(row["rider_name"], [0, 0, 0.0])
+            total[0] += row["slips"]
+            total[1] += row["quantity"]
+            total[2] = round(total[2] + row["commission"], 2)
+        ranked = sorted(riders.items(), key=lambda item: (-item[1][2], item[0]))[:limit]
+        return [
+            {"rider_name": rider, "slips": count, "quantity": quantity, "commission": commission}
+            for rider, (count, quantity, commission) in ranked
+        ]
+
+    def snapshot(self) -> Cells:
+        with self._lock:
+            self._ensure_fresh()
+            return {
+                week: {
+                    branch_code: {key: list(cell) for key, cell in group.items()}
+                    for branch_code, group in branches.items()
+                }
+                for week, branches in self._cells.items()
+            }
+
+def get_weekly_rollups() -> WeeklyRollups:
+    return WeeklyRollups()
+
+def verify_rollups() -> bool:
+    """Compare the incrementally maintained totals with a full rebuild"""
+    rollups = get_weekly_rollups()
+    incremental = rollups.snapshot()
+    rebuilt = build_cells(iter_slip_rows(ROLLUP_COLUMNS))
+    return incremental == rebuilt
+
+if __name__ == "__main__":
+    # python -m modules.rollups [--verify]
+    rows = list(iter_slip_rows(ROLLUP_COLUMNS + ['id', 'idempotency_key']))
+    rebuilt = build_cells(rows)
+    groups = sum(len(branches) for branches in rebuilt.values())
+    print(f"Rebuilt {groups} branch/week groups from {len(rows)} slips")
+    if "--verify" in sys.argv:
+        # Replay the slips one by one through the incremental path
+        rollups = get_weekly_rollups()
+        rollups._rebuilt_at = rollups._refreshed_at = time.monotonic()
+        for row in rows:
+            rollups.apply_insert(row)
+        ok = rollups.snapshot() == rebuilt
+        print("Incremental rollups match a full rebuild" if ok else "Incremental rollups differ from a full rebuild")
+        sys.exit(0 if ok else 1)
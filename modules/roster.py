@@ -0,0 +1,61 @@
+import sys
+from typing import Iterable, Tuple
+from modules.directory import get_branch_directory
+from modules.storage import get_repository
+
+def _clean(name: str) -> str:
+    name = (name or "").strip()
+    if not name:
+        raise ValueError("Rider name is required")
+    return name
+
+def add_rider(branch_code: str, rider_name: str):
+    """Add one rider to a branch as a single-row insert"""
+    get_repository().add_rider(branch_code, _clean(rider_name))
+    get_branch_directory().invalidate(branch_code)
+
+def remove_rider(branch_code: str, rider_name: str):
+    get_repository().remove_rider(branch_code, rider_name)
+    get_branch_directory().invalidate(branch_code)
+
+def rename_rider(branch_code: str, old_name: str, new_name: str):
+    get_repository().rename_rider(branch_code, old_name, _clean(new_name))
+    get_branch_directory().invalidate(branch_code)
+
+def import_riders(branch_code: str, names: Iterable[str]) -> int:
+    """Bulk-add riders to a branch, skipping blanks and existing riders.
+
+    Returns the number of riders actually inserted.
+    """
+    unique = sorted({name.strip() for name in names if name and name.strip()})
+    if not unique:
+        return 0
+    inserted = get_repository().add_riders([{"branch_code": branch_code, "name": name} for name in unique])
+    get_branch_directory().invalidate(branch_code)
+    return inserted
+
+def migrate_rider_arrays() -> Tuple[int, int]:
+    """Copy every branch's legacy riders array into the riders table.
+
+    Safe to re-run: existing riders are skipped. Returns (branches, riders).
+    """
+    repository = get_repository()
+    riders = []
+    branches = 0
+    for branch in repository.list_branches():
+        names = {name.strip() for name in (branch.get('riders') or []) if name and name.strip()}
+        if names:
+            branches += 1
+            riders.extend({"branch_code": branch['code'], "name": name} for name in sorted(names))
+    for start in range(0, len(riders), 500):
+        repository.add_riders(riders[start:start + 500])
+    get_branch_directory().invalidate()
+    return branches, len(riders)
+
+if __name__ == "__main__":
+    # python -m modules.roster migrate
+    if sys.argv[1:] == ["migrate"]:
+        branches, riders = migrate_rider_arrays()
+        print(f"Migrated {riders} riders from {branches} branches")
+    else:
+        sys.exit("Usage: python -m modules.roster migrate")
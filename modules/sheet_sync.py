@@ -0,0 +1,133 @@
+import hashlib
+import json
+import math
+import os
+import threading
+from datetime import date, datetime
+from typing import Dict, List, Optional, Tuple
+
+SHEET_SYNC_STATE_FILE = os.getenv("SHEET_SYNC_STATE_FILE", "data/sheet_sync_state.json")
+
+def _col_letter(col: int) -> str:
+    letters = ""
+    while col:
+        col, rem = divmod(col - 1, 26)
+        letters = chr(65 + rem) + letters
+    return letters
+
+def _a1(first_row: int, first_col: int, last_row: int, last_col: int) -> str:
+    return f"{_col_letter(first_col)}{first_row}:{_col_letter(last_col)}{last_row}"
+
+def _cell(value):
+    if hasattr(value, "item"):
+        value = value.item()
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return ""
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return value
+
+def dataframe_values(df) -> List[List]:
+    """Header plus rows as JSON-safe cell values, like set_with_dataframe writes them"""
+    return [[str(c) for c in df.columns]] + [[_cell(v) for v in row] for row in df.itertuples(index=False)]
+
+def _row_hash(row: List) -> str:
+    return hashlib.sha1(json.dumps(row, default=str).encode("utf-8")).hexdigest()[:16]
+
+def diff_rows(old_hashes: List[str], old_width: int, values: List[List]) -> Tuple[List[Dict], List[str]]:
+    """Compute the batched writes and clears that turn the old sheet into `values`.
+
+    Consecutive changed rows are merged into one range. Rows and columns
+    that existed before but not anymore are cleared.
+    """
+    width = max((len(row) for row in values), default=0)
+    hashes = [_row_hash(row) for row in values]
+    updates = []
+    start = None
+    for i in range(len(values) + 1):
+        changed = i < len(values) and (i >= len(old_hashes) or hashes[i] != old_hashes[i])
+        if changed and start is None:
+            start = i
+        elif not changed and start is not None:
+            block = [row + [""] * (width - len(row)) for row in values[start:i]]
+            updates.append({"range": _a1(start + 1, 1, i, width), "values": block})
+            start = None
+
+    clears = []
+    if len(old_hashes) > len(values) and old_width:
+        clears.append(_a1(len(values) + 1, 1, len(old_hashes), old_width))
+    if old_width > width and values:
+        clears.append(_a1(1, width + 1, len(values), old_width))
+    return updates, clears
+
+class SheetSyncState:
+    """Last-synced row hashes per spreadsheet/worksheet, persisted as JSON"""
+
+    def __init__(self, path: str = SHEET_SYNC_STATE_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+        self._state: Dict[str, Dict] = {}
+        if path and os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                self._state = json.load(f)
+
+    def get(self, spreadsheet: str, worksheet: str) -> Optional[Dict]:
+        return self._state.get(spreadsheet, {}).get(worksheet)
+
+    def set(self, spreadsheet: str, worksheet: str, values: List[List]):
+        with self._lock:
+            self._state.setdefault(spreadsheet, {})[worksheet] = {
+                "hashes": [_row_hash(row) for row in values],
+                "width": max((len(row) for row in values), default=0),
+            }
+            if self.path:
+                os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+                tmp_path = f"{self.path}.tmp"
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    json.dump(self._state, f)
+                os.replace(tmp_path, self.path)
+
+    def forget(self, spreadsheet: str, worksheet: Optional[str] = None):
+        with self._lock:
+            if worksheet is None:
+                self._state.pop(spreadsheet, None)
+            else:
+                self._state.get(spreadsheet, {}).pop(worksheet, None)
+
+def sync_worksheet(spreadsheet, title: str, values: List[List],
+                   state: SheetSyncState, full: bool = False) -> Dict[str, int]:
+    """Push only the rows of `values` that changed since the last sync.
+
+    Without a recorded state (first sync, or full=True) the worksheet is
+    treated as holding unknown content and rewritten in one batch. Returns
+    counts of written rows and API calls for reporting.
+    """
+    import gspread
+    width = max((len(row) for row in values), default=0)
+    try:
+        worksheet = spreadsheet.worksheet(title)
+        calls = 1
+    except gspread.exceptions.WorksheetNotFound:
+        worksheet = spreadsheet.add_worksheet(title=title, rows=max(len(values), 100), cols=max(width, 20))
+        state.forget(spreadsheet.title, title)
+        calls = 2
+
+    previous = None if full else state.get(spreadsheet.title, title)
+    if previous is None:
+        worksheet.clear()
+        calls += 1
+        previous = {"hashes": [], "width": 0}
+
+    updates, clears = diff_rows(previous["hashes"], previous["width"], values)
+    if len(values) > worksheet.row_count or width > worksheet.col_count:
+        worksheet.resize(rows=max(len(values), worksheet.row_count), cols=max(width, worksheet.col_count))
+        calls += 1
+    if clears:
+        worksheet.batch_clear(clears)
+        calls += 1
+    if updates:
+        worksheet.batch_update(updates, value_input_option="USER_ENTERED")
+        calls += 1
+
+    state.set(spreadsheet.title, title, values)
+    return {"rows_written": sum(len(update["values"]) for update in updates), "api_calls": calls}
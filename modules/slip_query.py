@@ -0,0 +1,82 @@
+import os
+import threading
+import time
+from typing import Dict, Iterator, List, Optional, Tuple
+from modules.storage import get_repository
+
+SLIP_STATUSES = ["pending", "approved", "rejected"]
+SLIP_BROWSER_COLUMNS = [
+    'id', 'branch_code', 'rider_name', 'slip_type', 'quantity', 'commission', 'status', 'week', 'submitted_at',
+    'near_duplicate_of', 'near_duplicate_distance',
+]
+SLIP_PAGE_SIZE = int(os.getenv("SLIP_PAGE_SIZE", "50"))
+SLIP_QUERY_TTL = int(os.getenv("SLIP_QUERY_TTL", "120"))
+SLIP_QUERY_CACHE_SIZE = 256
+
+_cache: Dict[tuple, Tuple[float, List[dict], Optional[int]]] = {}
+_cache_lock = threading.Lock()
+
+def _fetch_page(filters: Dict, after_id: Optional[int], page_size: int,
+                columns: List[str]) -> Tuple[List[dict], Optional[int]]:
+    rows = get_repository().slip_page(filters, columns, after_id, page_size + 1)
+    next_cursor = rows[page_size - 1]['id'] if len(rows) > page_size else None
+    return rows[:page_size], next_cursor
+
+def fetch_slip_page(filters: Dict, after_id: Optional[int] = None,
+                    page_size: int = SLIP_PAGE_SIZE,
+                    columns: List[str] = SLIP_BROWSER_COLUMNS) -> Tuple[List[dict], Optional[int]]:
+    """Return one page of slips (newest first) and the cursor for the next page.
+
+    Pages are keyed on id, so deep pages cost the same as the first one.
+    Results are cached per filter state and cursor for SLIP_QUERY_TTL
+    seconds, or until invalidate_slip_queries() is called.
+    """
+    key = (tuple(sorted((k, v) for k, v in filters.items() if v)), after_id, page_size, tuple(columns))
+    now = time.monotonic()
+    with _cache_lock:
+        cached = _cache.get(key)
+        if cached and cached[0] > now:
+            return cached[1], cached[2]
+
+    rows, next_cursor = _fetch_page(filters, after_id, page_size, columns)
+    with _cache_lock:
+        if len(_cache) >= SLIP_QUERY_CACHE_SIZE:
+            _cache.pop(min(_cache, key=lambda k: _cache[k][0]))
+        _cache[key] = (now + SLIP_QUERY_TTL, rows, next_cursor)
+    return rows, next_cursor
+
+def iter_slips(filters: Dict, columns: List[str] = SLIP_BROWSER_COLUMNS,
+               page_size: int = 1000) -> Iterator[List[dict]]:
+    """Yield every slip matching the filters, one uncached page at a time"""
+    after_id = None
+    while True:
+        rows, after_id = _fetch_page(filters, after_id, page_size, columns)
+        if rows:
+            yield rows
+        if after_id is None:
+            break
+
+def apply_slip_status_changes(changes: Dict[str, List[int]]) -> int:
+    """Write slip status changes with one update per target status.
+
+    The database logs every change to slip_status_changes; the weekly
+    totals of this process pull it straight away, other processes on their
+    next refresh. Returns the number of slips updated.
+    """
+    from modules.rollups import get_weekly_rollups
+    repository = get_repository()
+    updated = 0
+    for status, slip_ids in changes.items():
+        if status not in SLIP_STATUSES:
+            raise ValueError(f"Unknown status: {status}")
+        repository.update_slips(slip_ids, {"status": status})
+        updated += len(slip_ids)
+    if updated:
+        invalidate_slip_queries()
+        get_weekly_rollups().refresh()
+    return updated
+
+def invalidate_slip_queries():
+    """Drop cached slip pages, e.g. after new slips were submitted"""
+    with _cache_lock:
+        _cache.clear()
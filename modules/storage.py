@@ -0,0 +1,600 @@
+import json
+import os
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from typing import Dict, Iterable, List, Optional
+
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "supabase")
+SQLITE_PATH = os.getenv("SQLITE_PATH", "data/rider_slips.db")
+IMAGE_STORAGE_PATH = os.getenv("IMAGE_STORAGE_PATH") or "data/slip_images"
+
+SLIP_COLUMNS = [
+    "id", "branch_code", "rider_name", "slip_type", "quantity", "commission", "status", "week",
+    "transaction_id", "manager_name", "image_path", "image_hash", "image_phash", "submitted_at",
+    "idempotency_key", "near_duplicate_of", "near_duplicate_distance",
+]
+CHANGE_REQUEST_COLUMNS = ["id", "branch_code", "description", "status", "requested_at", "requested_by"]
+# Filled by a database trigger whenever a slip's status changes or the slip
+# is deleted (new_status NULL); see migrations/003_slip_status_changes.sql
+STATUS_CHANGE_COLUMNS = [
+    "id", "slip_id", "idempotency_key", "branch_code", "week", "rider_name", "slip_type", "quantity",
+    "commission", "old_status", "new_status", "changed_at",
+]
+
+class Repository(ABC):
+    """Data access for branches, riders, slips and change_requests.
+
+    Slip filters are a dict with any of branch_code, status, week,
+    date_from and date_to (submitted_at range, end exclusive). Change
+    request filters use the same keys minus week, with the date range on
+    requested_at. Every method is abstract, so a backend that misses one
+    fails when it is instantiated rather than on first use.
+    """
+
+    # Branches
+    @abstractmethod
+    def list_branches(self) -> List[Dict]:
+        ...
+
+    @abstractmethod
+    def get_branch(self, code: str) -> Optional[Dict]:
+        ...
+
+    @abstractmethod
+    def insert_branch(self, branch: Dict):
+        ...
+
+    @abstractmethod
+    def update_branch(self, code: str, fields: Dict):
+        ...
+
+    @abstractmethod
+    def delete_branch(self, code: str):
+        """Delete the branch together with its riders"""
+
+    # Riders, one row per (branch_code, name)
+    @abstractmethod
+    def list_riders(self, branch_code: Optional[str] = None) -> List[Dict]:
+        ...
+
+    @abstractmethod
+    def add_rider(self, branch_code: str, name: str):
+        """Insert one rider; raises ValueError if the branch already has it"""
+
+    @abstractmethod
+    def add_riders(self, riders: List[Dict]) -> int:
+        """Bulk insert riders, skipping ones that already exist; returns how many were inserted"""
+
+    @abstractmethod
+    def remove_rider(self, branch_code: str, name: str):
+        ...
+
+    @abstractmethod
+    def rename_rider(self, branch_code: str, old_name: str, new_name: str):
+        """Rename in place; raises ValueError if new_name is taken"""
+
+    # Slips
+    @abstractmethod
+    def insert_slips(self, slips: List[Dict]):
+        """Insert slips, skipping rows whose idempotency_key already exists; other violations raise"""
+
+    @abstractmethod
+    def slip_page(self, filters: Dict, columns: List[str], after_id: Optional[int], limit: int) -> List[Dict]:
+        """Slips matching filters with id < after_id, newest id first"""
+
+    @abstractmethod
+    def slips_after(self, columns: List[str], after_id: Optional[int], limit: int) -> List[Dict]:
+        """Up to limit slips with id > after_id, lowest id first.
+
+        Incremental readers keep the highest id they have seen. The id is
+        assigned by the database when the row is inserted, whereas
+        submitted_at is set by the client when the slip is added and can be
+        older than rows inserted before it.
+        """
+
+    @abstractmethod
+    def update_slips(self, slip_ids: List[int], fields: Dict):
+        """Apply the same fields to every listed slip in one statement"""
+
+    @abstractmethod
+    def status_changes_after(self, after_id: Optional[int], limit: int) -> List[Dict]:
+        """Up to limit slip_status_changes rows with id > after_id, lowest id first"""
+
+    @abstractmethod
+    def last_status_change_id(self) -> Optional[int]:
+        """Highest slip_status_changes id, or None if the log is empty"""
+
+    # Change requests
+    @abstractmethod
+    def insert_change_request(self, request: Dict):
+        ...
+
+    @abstractmethod
+    def change_request_page(self, filters: Dict, after_id: Optional[int], limit: int) -> List[Dict]:
+        """Up to limit change requests with id < after_id, newest first"""
+
+    @abstractmethod
+    def update_change_requests(self, request_ids: List[int], fields: Dict):
+        """Apply the same fields to every listed change request in one statement"""
+
+    # Images
+    @abstractmethod
+    def upload_image(self, path: str, data: bytes, content_type: str):
+        ...
+
+    @abstractmethod
+    def download_image(self, path: str) -> bytes:
+        ...
+
+class SupabaseRepository(Repository):
+    """Supabase (PostgREST) backend; the tables must match migrations/*.sql"""
+
+    def __init__(self, client=None):
+        if client is None:
+            from supabase_client import get_supabase
+            client = get_supabase()
+        self.client = client
+
+    def _filtered_query(self, table: str, columns: List[str], filters: Dict, date_column: str):
+        query = self.client.table(table).select(", ".join(columns))
+        if filters.get('branch_code'):
+            query = query.eq('branch_code', filters['branch_code'])
+        if filters.get('status'):
+            query = query.eq('status', filters['status'])
+        if filters.get('week'):
+            query = query.eq('week', filters['week'])
+        if filters.get('date_from'):
+            query = query.gte(date_column, filters['date_from'])
+        if filters.get('date_to'):
+            query = query.lt(date_column, filters['date_to'])
+        return query
+
+    def _slips_query(self, columns: List[str], filters: Dict):
+        return self._filtered_query('slips', columns, filters, 'submitted_at')
+
+    def list_branches(self):
+        return self.client.table('branches').select('*').execute().data
+
+    def get_branch(self, code):
+        rows = self.client.table('branches').select('*').eq('code', code).execute().data
+        return rows[0] if rows else None
+
+    def insert_branch(self, branch):
+        self.client.table('branches').insert(branch).execute()
+
+    def update_branch(self, code, fields):
+        self.client.table('branches').update(fields).eq('code', code).execute()
+
+    def delete_branch(self, code):
+        # Riders first, so a failure never leaves riders of a deleted branch
+        # that would reappear if the code were reused
+        self.client.table('riders').delete().eq('branch_code', code).execute()
+        self.client.table('branches').delete().eq('code', code).execute()
+
+    def _unique_violation(self, e: Exception) -> bool:
+        return getattr(e, "code", None) == "23505" or "duplicate key" in str(e)
+
+    def list_riders(self, branch_code=None):
+        riders = []
+        while True:
+            query = self.client.table('riders').select('branch_code, name')
+            if branch_code:
+                query = query.eq('branch_code', branch_code)
+            page = query.order('branch_code').order('name').range(len(riders), len(riders) + 999).execute().data
+            riders.extend(page)
+            if len(page) < 1000:
+                return riders
+
+    def add_rider(self, branch_code, name):
+        try:
+            self.client.table('riders').insert({"branch_code": branch_code, "name": name}).execute()
+        except Exception as e:
+            if self._unique_violation(e):
+                raise ValueError(f"Rider {name} already exists in {branch_code}")
+            raise
+
+    def add_riders(self, riders):
+        # With ignore_duplicates only the inserted rows come back
+        inserted = self.client.table('riders').upsert(
+            riders,
+            on_conflict='branch_code,name',
+            ignore_duplicates=True
+        ).execute().data
+        return len(inserted or [])
+
+    def remove_rider(self, branch_code, name):
+        self.client.table('riders').delete().eq('branch_code', branch_code).eq('name', name).execute()
+
+    def rename_rider(self, branch_code, old_name, new_name):
+        try:
+            self.client.table('riders').update({"name": new_name}).eq(
+                'branch_code', branch_code
+            ).eq('name', old_name).execute()
+        except Exception as e:
+            if self._unique_violation(e):
+                raise ValueError(f"Rider {new_name} already exists in {branch_code}")
+            raise
+
+    def insert_slips(self, slips):
+        self.client.table('slips').upsert(
+            slips,
+            on_conflict='idempotency_key',
+            ignore_duplicates=True
+        ).execute()
+
+    def slip_page(self, filters, columns, after_id, limit):
+        query = self._slips_query(columns, filters)
+        if after_id is not None:
+            query = query.lt('id', after_id)
+        return query.order('id', desc=True).limit(limit).execute().data
+
+    def slips_after(self, columns, after_id, limit):
+        query = self._slips_query(columns, {})
+        if after_id is not None:
+            query = query.gt('id', after_id)
+        return query.order('id').limit(limit).execute().data
+
+    def update_slips(self, slip_ids, fields):
+        if slip_ids:
+            self.client.table('slips').update(fields).in_('id', list(slip_ids)).execute()
+
+    def status_changes_after(self, after_id, limit):
+        query = self.client.table('slip_status_changes').select(", ".join(STATUS_CHANGE_COLUMNS))
+        if after_id is not None:
+            query = query.gt('id', after_id)
+        return query.order('id').limit(limit).execute().data
+
+    def last_status_change_id(self):
+        rows = self.client.table('slip_status_changes').select('id').order('id', desc=True).limit(1).execute().data
+        return rows[0]['id'] if rows else None
+
+    def insert_change_request(self, request):
+        self.client.table('change_requests').insert(request).execute()
+
+    def change_request_page(self, filters, after_id, limit):
+        query = self._filtered_query('change_requests', CHANGE_REQUEST_COLUMNS, filters, 'requested_at')
+        if after_id is not None:
+            query = query.lt('id', after_id)
+        return query.order('id', desc=True).limit(limit).execute().data
+
+    def update_change_requests(self, request_ids, fields):
+        if request_ids:
+            self.client.table('change_requests').update(fields).in_('id', list(request_ids)).execute()
+
+    def upload_image(self, path, data, content_type):
+        self.client.storage.from_('slip_images').upload(path, data, {"content-type": content_type})
+
+    def download_image(self, path):
+        return self.client.storage.from_('slip_images').download(path)
+
+_SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS branches (
+    code TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    riders TEXT NOT NULL DEFAULT '[]'
+);
+CREATE TABLE IF NOT EXISTS riders (
+    branch_code TEXT NOT NULL,
+    name TEXT NOT NULL,
+    PRIMARY KEY (branch_code, name)
+);
+CREATE TABLE IF NOT EXISTS slips (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    branch_code TEXT,
+    rider_name TEXT,
+    slip_type TEXT,
+    quantity INTEGER,
+    commission REAL,
+    status TEXT DEFAULT 'pending',
+    week TEXT,
+    transaction_id TEXT,
+    manager_name TEXT,
+    image_path TEXT,
+    image_hash TEXT,
+    image_phash TEXT,
+    submitted_at TEXT,
+    idempotency_key TEXT UNIQUE,
+    near_duplicate_of TEXT,
+    near_duplicate_distance INTEGER
+);
+CREATE INDEX IF NOT EXISTS idx_slips_image_hash ON slips (image_hash);
+CREATE INDEX IF NOT EXISTS idx_slips_branch_code ON slips (branch_code);
+CREATE INDEX IF NOT EXISTS idx_slips_status ON slips (status);
+CREATE INDEX IF NOT EXISTS idx_slips_week ON slips (week);
+CREATE INDEX IF NOT EXISTS idx_slips_transaction_id ON slips (transaction_id);
+CREATE INDEX IF NOT EXISTS idx_slips_submitted_at ON slips (submitted_at);
+CREATE TABLE IF NOT EXISTS slip_status_changes (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    slip_id INTEGER NOT NULL,
+    idempotency_key TEXT,
+    branch_code TEXT,
+    week TEXT,
+    rider_name TEXT,
+    slip_type TEXT,
+    quantity INTEGER,
+    commission REAL,
+    old_status TEXT,
+    new_status TEXT,
+    changed_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+CREATE TRIGGER IF NOT EXISTS slips_status_changed AFTER UPDATE OF status ON slips
+WHEN OLD.status IS NOT NEW.status
+BEGIN
+    INSERT INTO slip_status_changes (slip_id, idempotency_key, branch_code, week, rider_name, slip_type,
+                                     quantity, commission, old_status, new_status)
+    VALUES (NEW.id, NEW.idempotency_key, NEW.branch_code, NEW.week, NEW.rider_name, NEW.slip_type,
+            NEW.quantity, NEW.commission, OLD.status, NEW.status);
+END;
+CREATE TRIGGER IF NOT EXISTS slips_deleted AFTER DELETE ON slips
+BEGIN
+    INSERT INTO slip_status_changes (slip_id, idempotency_key, branch_code, week, rider_name, slip_type,
+                                     quantity, commission, old_status, new_status)
+    VALUES (OLD.id, OLD.idempotency_key, OLD.branch_code, OLD.week, OLD.rider_name, OLD.slip_type,
+            OLD.quantity, OLD.commission, OLD.status, NULL);
+END;
+CREATE TABLE IF NOT EXISTS change_requests (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    branch_code TEXT,
+    description TEXT,
+    status TEXT DEFAULT 'pending',
+    requested_at TEXT,
+    requested_by TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_change_requests_status ON change_requests (status);
+CREATE INDEX IF NOT EXISTS idx_change_requests_branch_code ON change_requests (branch_code);
+CREATE INDEX IF NOT EXISTS idx_change_requests_requested_at ON change_requests (requested_at);
+"""
+
+# Slip columns added after the SQLite backend shipped (migrations 004+)
+_SQLITE_ADDED_COLUMNS = [("near_duplicate_of", "TEXT"), ("near_duplicate_distance", "INTEGER")]
+
+class SQLiteRepository(Repository):
+    """Local SQLite backend in WAL mode, one connection per thread.
+
+    The legacy branches.riders column is kept as a JSON array so branch rows
+    match the Supabase ones; the roster itself lives in the riders table.
+    Images are written under IMAGE_STORAGE_PATH.
+    """
+
+    def __init__(self, path: str = SQLITE_PATH, image_root: str = IMAGE_STORAGE_PATH):
+        self.path = path
+        self.image_root = image_root
+        self._local = threading.local()
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn().executescript(_SQLITE_SCHEMA)
+        self._add_missing_columns()
+
+    def _add_missing_columns(self):
+        # CREATE TABLE IF NOT EXISTS leaves databases from before a column
+        # was added untouched; same columns as the numbered migrations
+        conn = self._conn()
+        existing = {row["name"] for row in conn.execute("PRAGMA table_info(slips)")}
+        for column, column_type in _SQLITE_ADDED_COLUMNS:
+            if column not in existing:
+                conn.execute(f"ALTER TABLE slips ADD COLUMN {column} {column_type}")
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _query(self, sql: str, params: Iterable = ()) -> List[Dict]:
+        return [dict(row) for row in self._conn().execute(sql, tuple(params))]
+
+    def _branch(self, row: Dict) -> Dict:
+        row["riders"] = json.loads(row["riders"]) if row.get("riders") else []
+        return row
+
+    def _where(self, filters: Dict, date_column: str = 'submitted_at'):
+        clauses, params = [], []
+        for column in ('branch_code', 'status', 'week'):
+            if filters.get(column):
+                clauses.append(f"{column} = ?")
+                params.append(filters[column])
+        if filters.get('date_from'):
+            clauses.append(f"{date_column} >= ?")
+            params.append(filters['date_from'])
+        if filters.get('date_to'):
+            clauses.append(f"{date_column} < ?")
+            params.append(filters['date_to'])
+        return clauses, params
+
+    def _columns(self, columns: List[str], allowed: List[str]) -> str:
+        unknown = [c for c in columns if c not in allowed]
+        if unknown:
+            raise ValueError(f"Unknown columns: {', '.join(unknown)}")
+        return ", ".join(columns)
+
+    def list_branches(self):
+        return [self._branch(row) for row in self._query("SELECT * FROM branches ORDER BY code")]
+
+    def get_branch(self, code):
+        rows = self._query("SELECT * FROM branches WHERE code = ?", [code])
+        return self._branch(rows[0]) if rows else None
+
+    def insert_branch(self, branch):
+        self._conn().execute(
+            "INSERT INTO branches (code, name, riders) VALUES (?, ?, ?)",
+            (branch["code"], branch["name"], json.dumps(branch.get("riders") or []))
+        )
+
+    def update_branch(self, code, fields):
+        fields = dict(fields)
+        if "riders" in fields:
+            fields["riders"] = json.dumps(fields["riders"] or [])
+        assignments = ", ".join(f"{self._columns([k], ['name', 'riders'])} = ?" for k in fields)
+        self._conn().execute(f"UPDATE branches SET {assignments} WHERE code = ?", (*fields.values(), code))
+
+    def delete_branch(self, code):
+        conn = self._conn()
+        conn.execute("BEGIN")
+        try:
+            conn.execute("DELETE FROM riders WHERE branch_code = ?", (code,))
+            conn.execute("DELETE FROM branches WHERE code = ?", (code,))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def list_riders(self, branch_code=None):
+        if branch_code:
+            return self._query("SELECT branch_code, name FROM riders WHERE branch_code = ? ORDER BY name", [branch_code])
+        return self._query("SELECT branch_code, name FROM riders ORDER BY branch_code, name")
+
+    def add_rider(self, branch_code, name):
+        try:
+            self._conn().execute("INSERT INTO riders (branch_code, name) VALUES (?, ?)", (branch_code, name))
+        except sqlite3.IntegrityError:
+            raise ValueError(f"Rider {name} already exists in {branch_code}")
+
+    def add_riders(self, riders):
+        conn = self._conn()
+        conn.execute("BEGIN")
+        try:
+            cursor = conn.executemany(
+                "INSERT INTO riders (branch_code, name) VALUES (?, ?) ON CONFLICT(branch_code, name) DO NOTHING",
+                [(rider["branch_code"], rider["name"]) for rider in riders]
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return cursor.rowcount
+
+    def remove_rider(self, branch_code, name):
+        self._conn().execute("DELETE FROM riders WHERE branch_code = ? AND name = ?", (branch_code, name))
+
+    def rename_rider(self, branch_code, old_name, new_name):
+        try:
+            self._conn().execute(
+                "UPDATE riders SET name = ? WHERE branch_code = ? AND name = ?", (new_name, branch_code, old_name)
+            )
+        except sqlite3.IntegrityError:
+            raise ValueError(f"Rider {new_name} already exists in {branch_code}")
+
+    def insert_slips(self, slips):
+        columns = [c for c in SLIP_COLUMNS if c != "id"]
+        conn = self._conn()
+        conn.execute("BEGIN")
+        try:
+            conn.executemany(
+                f"INSERT INTO slips ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))}) "
+                "ON CONFLICT(idempotency_key) DO NOTHING",
+                [tuple(slip.get(c) for c in columns) for slip in slips]
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def slip_page(self, filters, columns, after_id, limit):
+        clauses, params = self._where(filters)
+        if after_id is not None:
+            clauses.append("id < ?")
+            params.append(after_id)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        return self._query(
+            f"SELECT {self._columns(columns, SLIP_COLUMNS)} FROM slips {where} ORDER BY id DESC LIMIT ?",
+            [*params, limit]
+        )
+
+    def slips_after(self, columns, after_id, limit):
+        where = "WHERE id > ?" if after_id is not None else ""
+        params = [after_id] if after_id is not None else []
+        return self._query(
+            f"SELECT {self._columns(columns, SLIP_COLUMNS)} FROM slips {where} ORDER BY id LIMIT ?",
+            [*params, limit]
+        )
+
+    def update_slips(self, slip_ids, fields):
+        slip_ids = list(slip_ids)
+        if not slip_ids:
+            return
+        assignments = ", ".join(f"{self._columns([k], SLIP_COLUMNS)} = ?" for k in fields)
+        self._conn().execute(
+            f"UPDATE slips SET {assignments} WHERE id IN ({', '.join('?' * len(slip_ids))})",
+            (*fields.values(), *slip_ids)
+        )
+
+    def status_changes_after(self, after_id, limit):
+        where = "WHERE id > ?" if after_id is not None else ""
+        params = [after_id] if after_id is not None else []
+        return self._query(f"SELECT * FROM slip_status_changes {where} ORDER BY id LIMIT ?", [*params, limit])
+
+    def last_status_change_id(self):
+        return self._conn().execute("SELECT MAX(id) FROM slip_status_changes").fetchone()[0]
+
+    def insert_change_request(self, request):
+        columns = [c for c in CHANGE_REQUEST_COLUMNS if c != "id" and c in request]
+        self._conn().execute(
+            f"INSERT INTO change_requests ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+            tuple(request[c] for c in columns)
+        )
+
+    def change_request_page(self, filters, after_id, limit):
+        clauses, params = self._where(filters, 'requested_at')
+        if after_id is not None:
+            clauses.append("id < ?")
+            params.append(after_id)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        return self._query(
+            f"SELECT * FROM change_requests {where} ORDER BY id DESC LIMIT ?", [*params, limit]
+        )
+
+    def update_change_requests(self, request_ids, fields):
+        request_ids = list(request_ids)
+        if not request_ids:
+            return
+        assignments = ", ".join(f"{self._columns([k], CHANGE_REQUEST_COLUMNS)} = ?" for k in fields)
+        self._conn().execute(
+            f"UPDATE change_requests SET {assignments} WHERE id IN ({', '.join('?' * len(request_ids))})",
+            (*fields.values(), *request_ids)
+        )
+
+    def _image_file(self, path: str) -> str:
+        root = os.path.realpath(self.image_root)
+        target = os.path.realpath(os.path.join(root, path))
+        if os.path.commonpath([root, target]) != root or target == root:
+            raise ValueError(f"Invalid image path: {path}")
+        return target
+
+    def upload_image(self, path, data, content_type):
+        target = self._image_file(path)
+        if os.path.exists(target):
+            raise ValueError(f"Image already exists: {path}")
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        with open(target, "wb") as f:
+            f.write(data)
+
+    def download_image(self, path):
+        with open(self._image_file(path), "rb") as f:
+            return f.read()
+
+_repository = None
+_repository_lock = threading.Lock()
+
+def get_repository() -> Repository:
+    """Return the process-wide repository for the configured STORAGE_BACKEND"""
+    global _repository
+    with _repository_lock:
+        if _repository is None:
+            if STORAGE_BACKEND == "sqlite":
+                _repository = SQLiteRepository()
+            elif STORAGE_BACKEND == "supabase":
+                _repository = SupabaseRepository()
+            else:
+                raise ValueError(f"Unknown STORAGE_BACKEND: {STORAGE_BACKEND}")
+        return _repository
+
+def set_repository(repository: Optional[Repository]):
+    """Swap the process-wide repository, e.g. for benchmarks and load tests"""
+    global _repository
+    with _repository_lock:
+        _repository = repository
@@ -0,0 +1,162 @@
+import os
+import random
+import time
+import uuid
+from typing import Callable, Dict, List, Optional, Tuple
+from modules.storage import get_repository
+
+SUBMIT_CHUNK_SIZE = int(os.getenv("SUBMIT_CHUNK_SIZE", "100"))
+SUBMIT_MAX_RETRIES = int(os.getenv("SUBMIT_MAX_RETRIES", "4"))
+SUBMIT_BACKOFF = float(os.getenv("SUBMIT_BACKOFF", "0.5"))
+
+def new_idempotency_key() -> str:
+    """Client-generated key stored with each slip row (unique in the slips table)"""
+    return str(uuid.uuid4())
+
+def _insert_chunk(rows: List[Dict]):
+    # Rows that already landed on an earlier attempt are skipped by the
+    # unique idempotency_key instead of being inserted a second time
+    get_repository().insert_slips(rows)
+
+def _with_retries(rows: List[Dict], max_retries: int, backoff: float,
+                  sleep: Callable[[float], None]) -> Optional[Exception]:
+    for attempt in range(max_retries + 1):
+        try:
+            _insert_chunk(rows)
+            return None
+        except Exception as e:
+            error = e
+            if attempt < max_retries:
+                sleep(backoff * (2 ** attempt) * (1 + random.random()))
+    return error
+
+def submit_slips(entries: List[Dict],
+                 chunk_size: int = SUBMIT_CHUNK_SIZE,
+                 max_retries: int = SUBMIT_MAX_RETRIES,
+                 backoff: float = SUBMIT_BACKOFF,
+                 sleep: Callable[[float], None] = time.sleep) -> List[Dict]:
+    """Insert slips in chunks with retries and return a per-row report.
+
+    Each chunk is retried with exponential backoff and jitter. A chunk that
+    still fails is split in half (without further retries) until the rows
+    that cannot be inserted are isolated. The report has one dict per entry,
+    in order: {"index", "idempotency_key", "ok", "error"}.
+    """
+    for entry in entries:
+        entry.setdefault("idempotency_key", new_idempotency_key())
+
+    report = [
+        {"index": i, "idempotency_key": entry["idempotency_key"], "ok": False, "error": None}
+        for i, entry in enumerate(entries)
+    ]
+
+    def run(start: int, end: int, retries: int):
+        error = _with_retries(entries[start:end], retries, backoff, sleep)
+        if error is None:
+            for row in report[start:end]:
+                row["ok"] = True
+        elif end - start == 1:
+            report[start]["error"] = str(error)
+        else:
+            middle = (start + end) // 2
+            run(start, middle, 0)
+            run(middle, end, 0)
+
+    chunk_size = max(1, chunk_size)
+    for start in range(0, len(entries), chunk_size):
+        run(start, min(start + chunk_size, len(entries)), max_retries)
+    return report
+
+def enqueue_submission(entries: List[Dict], uploads: Dict[str, Dict]) -> List[int]:
+    """Queue each slip's image upload and row insert as background jobs.
+
+    `uploads` maps image_path to the prepared upload. The insert waits for
+    its upload; both are deduplicated on the slip's idempotency key, so
+    submitting the same entries twice queues nothing new. Returns the
+    insert job ids. Raises jobs.QueueFull when the queue is backed up.
+    """
+    from modules.jobs import get_job_queue
+    jobs = []
+    for entry in entries:
+        entry.setdefault("idempotency_key", new_idempotency_key())
+        key = entry["idempotency_key"]
+        insert = {
+            "kind": "insert_slip",
+            "payload": entry,
+            "dedup_key": f"insert_slip:{key}",
+            "ref": key,
+            "owner": entry.get("branch_code"),
+        }
+        upload = uploads.get(entry.get("image_path"))
+        if upload is not None:
+            jobs.append({
+                "kind": "upload_image",
+                "payload": {"path": upload["path"], "content_type": upload["content_type"]},
+                "data": upload["data"],
+                "dedup_key": f"upload_image:{key}",
+                "ref": key,
+                "owner": entry.get("branch_code"),
+            })
+            insert["after"] = len(jobs) - 1
+        jobs.append(insert)
+    ids = get_job_queue().enqueue_many(jobs)
+    return [job_id for job, job_id in zip(jobs, ids) if job["kind"] == "insert_slip"]
+
+def queued_conflicts(entries: List[Dict]) -> Tuple[Dict[str, str], Dict[Tuple[str, str], str]]:
+    """Image hashes and (slip_type, transaction_id) pairs of `entries` already waiting on the queue.
+
+    The duplicate indexes only learn a slip once its insert succeeds, so
+    slips still queued are checked here. Same shape as the indexes'
+    check_batch results.
+    """
+    from modules.jobs import get_job_queue
+    from modules.transaction_index import normalize_transaction_id
+    queued_hashes, queued_ids = set(), set()
+    for payload in get_job_queue().pending_payloads("insert_slip"):
+        queued_hashes.add(payload.get("image_hash"))
+        if payload.get("transaction_id"):
+            queued_ids.add((payload.get("slip_type"), normalize_transaction_id(payload["transaction_id"])))
+    duplicate_hashes, duplicate_ids = {}, {}
+    for entry in entries:
+        if entry.get("image_hash") and entry["image_hash"] in queued_hashes:
+            duplicate_hashes[entry["image_hash"]] = "already queued"
+        if entry.get("transaction_id"):
+            pair = (entry.get("slip_type"), normalize_transaction_id(entry["transaction_id"]))
+            if pair in queued_ids:
+                duplicate_ids[pair] = "already queued"
+    return duplicate_hashes, duplicate_ids
+
+def submission_status(branch_code: str, limit: int = 50) -> List[Dict]:
+    """Background status of the branch's most recent slips, newest first"""
+    from modules.jobs import get_job_queue
+    slips = {}
+    for job in get_job_queue().list_jobs(owner=branch_code, limit=limit * 2):
+        slips.setdefault(job["ref"], {})[job["kind"]] = job
+    rows = []
+    for slip_jobs in list(slips.values())[:limit]:
+        insert, upload = slip_jobs.get("insert_slip"), slip_jobs.get("upload_image")
+        if insert is None:
+            continue
+        failed = [job for job in (upload, insert) if job and job["status"] == "failed"]
+        if insert["status"] == "done":
+            status = "saved"
+        elif failed:
+            status = "failed"
+        elif upload and upload["status"] != "done":
+            status = "uploading" if upload["status"] == "running" else "queued"
+        else:
+            status = "saving"
+        error = failed[0]["last_error"] if failed else next(
+            (job["last_error"] for job in (upload, insert) if job and job["last_error"]), None
+        )
+        rows.append({
+            "rider_name": insert["payload"].get("rider_name"),
+            "slip_type": insert["payload"].get("slip_type"),
+            "transaction_id": insert["payload"].get("transaction_id"),
+            "quantity": insert["payload"].get("quantity"),
+            "status": status,
+            "attempts": max(job["attempts"] for job in (upload, insert) if job),
+            "error": error,
+            "job_ids": [job["id"] for job in failed],
+        })
+    return rows
@@ -0,0 +1,183 @@
+import hashlib
+import io
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional
+from modules.metrics import scoped, timed
+from modules.storage import get_repository
+
+THUMBNAIL_DIR = os.getenv("THUMBNAIL_DIR", "data/thumbnails")
+THUMBNAIL_CACHE_BYTES = int(os.getenv("THUMBNAIL_CACHE_BYTES", str(200 * 1024 * 1024)))
+THUMBNAIL_SIZE = int(os.getenv("THUMBNAIL_SIZE", "320"))
+THUMBNAIL_QUALITY = int(os.getenv("THUMBNAIL_QUALITY", "70"))
+THUMBNAIL_WORKERS = int(os.getenv("THUMBNAIL_WORKERS", "4"))
+THUMBNAIL_EXTENSIONS = ['.jpg', '.jpeg', '.png', '.webp']
+
+def thumbnail_key(slip: Dict) -> Optional[str]:
+    """Cache key for a slip's image: its SHA-256, or a hash of the path for slips without one"""
+    if slip.get('image_hash'):
+        return slip['image_hash']
+    if slip.get('image_path'):
+        return hashlib.sha256(slip['image_path'].encode("utf-8")).hexdigest()
+    return None
+
+def make_thumbnail(data: bytes, size: int = THUMBNAIL_SIZE, quality: int = THUMBNAIL_QUALITY) -> bytes:
+    """Downscale an image to fit size x size and encode it as WEBP"""
+    from PIL import Image
+    image = Image.open(io.BytesIO(data))
+    # JPEGs are decoded straight at a reduced scale
+    image.draft("RGB", (size, size))
+    if image.mode not in ("RGB", "L"):
+        image = image.convert("RGB")
+    image.thumbnail((size, size), Image.LANCZOS)
+    buffer = io.BytesIO()
+    image.save(buffer, format="WEBP", quality=quality)
+    return buffer.getvalue()
+
+class ThumbnailCache:
+    """Process-wide, size-bounded LRU cache of slip thumbnails on disk.
+
+    Thumbnails are generated from the original on first access and stored
+    under THUMBNAIL_DIR keyed by image hash. Once the files exceed
+    THUMBNAIL_CACHE_BYTES the least recently used ones are deleted. The
+    recency order is rebuilt from file mtimes, which a hit refreshes, so it
+    survives restarts. Concurrent requests for the same image share one
+    download.
+    """
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __new__(cls):
+        with cls._instance_lock:
+            if cls._instance is None:
+                instance = super().__new__(cls)
+                instance._lock = threading.Lock()
+                instance._entries = OrderedDict()
+                instance._bytes = 0
+                instance._pending = {}
+                instance._pool = None
+                instance.stats = {"hits": 0, "misses": 0, "evictions": 0, "original_bytes": 0}
+                instance._scan()
+                cls._instance = instance
+        return cls._instance
+
+    def _path(self, key: str) -> str:
+        return os.path.join(THUMBNAIL_DIR, key[:2], f"{key}.webp")
+
+    def _scan(self):
+        files = []
+        if os.path.isdir(THUMBNAIL_DIR):
+            for prefix in os.scandir(THUMBNAIL_DIR):
+                if prefix.is_dir():
+                    for entry in os.scandir(prefix.path):
+                        if entry.name.endswith(".webp"):
+                            stat = entry.stat()
+                            files.append((stat.st_mtime, entry.name[:-5], stat.st_size))
+        for _, key, size in sorted(files):
+            self._entries[key] = size
+            self._bytes += size
+
+    def _evict(self):
+        while self._bytes > THUMBNAIL_CACHE_BYTES and len(self._entries) > 1:
+            key, size = self._entries.popitem(last=False)
+            self._bytes -= size
+            self.stats["evictions"] += 1
+            try:
+                os.remove(self._path(key))
+            except FileNotFoundError:
+                pass
+
+    def _read(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            if key not in self._entries:
+                return None
+            self._entries.move_to_end(key)
+        try:
+            with open(self._path(key), "rb") as f:
+                data = f.read()
+            os.utime(self._path(key))
+            return data
+        except FileNotFoundError:
+            # Evicted by another process sharing the directory
+            with self._lock:
+                self._bytes -= self._entries.pop(key, 0)
+            return None
+
+    def _generate(self, key: str, image_path: str) -> bytes:
+        with timed("thumbnail", "generate") as info:
+            original = get_repository().download_image(image_path)
+            thumbnail = make_thumbnail(original)
+            info["bytes"] = len(original)
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp = f"{path}.{threading.get_ident()}.tmp"
+        with open(temp, "wb") as f:
+            f.write(thumbnail)
+        os.replace(temp, path)
+        with self._lock:
+            self._bytes += len(thumbnail) - self._entries.pop(key, 0)
+            self._entries[key] = len(thumbnail)
+            self.stats["original_bytes"] += len(original)
+            self._evict()
+        return thumbnail
+
+    def get(self, slip: Dict) -> Optional[bytes]:
+        """Thumbnail bytes for a slip, or None if it has no previewable image"""
+        key = thumbnail_key(slip)
+        image_path = slip.get('image_path')
+        if key is None or os.path.splitext(image_path or "")[1].lower() not in THUMBNAIL_EXTENSIONS:
+            return None
+        data = self._read(key)
+        if data is not None:
+            with self._lock:
+                self.stats["hits"] += 1
+            return data
+
+        with self._lock:
+            future = self._pending.get(key)
+            owner = future is None
+            if owner:
+                future = self._pending[key] = Future()
+                self.stats["misses"] += 1
+        if not owner:
+            return future.result()
+        try:
+            data = self._generate(key, image_path)
+            future.set_result(data)
+            return data
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._pending.pop(key, None)
+
+    def _executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=THUMBNAIL_WORKERS, thread_name_prefix="thumbnail")
+            return self._pool
+
+    def _get_quietly(self, slip: Dict) -> Optional[bytes]:
+        try:
+            return self.get(slip)
+        except Exception:
+            return None
+
+    def get_many(self, slips: List[Dict]) -> List[Optional[bytes]]:
+        """Thumbnails for a page of slips, generated concurrently; None where unavailable"""
+        return list(self._executor().map(scoped(self._get_quietly), slips))
+
+    def prefetch(self, slips: Iterable[Dict]) -> List[Future]:
+        """Generate thumbnails in the background, e.g. for the next page"""
+        pool = self._executor()
+        return [pool.submit(scoped(self._get_quietly), slip) for slip in slips if thumbnail_key(slip)]
+
+    def size(self) -> Dict[str, int]:
+        with self._lock:
+            return {"files": len(self._entries), "bytes": self._bytes, "limit": THUMBNAIL_CACHE_BYTES}
+
+def get_thumbnail_cache() -> ThumbnailCache:
+    return ThumbnailCache()
@@ -0,0 +1,164 @@
+import bisect
+import hashlib
+import heapq
+import json
+import os
+import threading
+import time
+from array import array
+from typing import Dict, Iterable, Iterator, Optional, Tuple
+from modules.hash_index import iter_slip_rows
+
+TRANSACTION_INDEX_FILE = os.getenv("TRANSACTION_INDEX_FILE", "data/transaction_index.bin")
+TRANSACTION_INDEX_REFRESH = int(os.getenv("TRANSACTION_INDEX_REFRESH", "60"))
+# New keys are kept in a set and folded into the sorted array (and the
+# snapshot file) once there are this many of them
+TRANSACTION_MERGE_SIZE = int(os.getenv("TRANSACTION_MERGE_SIZE", "50000"))
+
+def normalize_transaction_id(transaction_id) -> str:
+    """Strip whitespace and ignore case, so " ab12 " and "AB12" are the same serial"""
+    return str(transaction_id or "").strip().upper()
+
+def transaction_key(slip_type: str, transaction_id) -> int:
+    """64-bit key for a (slip_type, transaction_id) pair.
+
+    At a few million keys the chance of two different pairs sharing a key
+    is below one in a million, so keys are stored instead of the strings.
+    """
+    pair = f"{slip_type}\x1f{normalize_transaction_id(transaction_id)}".encode("utf-8")
+    return int.from_bytes(hashlib.blake2b(pair, digest_size=8).digest(), "big")
+
+def _unique(keys: Iterable[int]) -> Iterator[int]:
+    previous = None
+    for key in keys:
+        if key != previous:
+            yield key
+            previous = key
+
+class TransactionIndex:
+    """Process-wide index of every (slip_type, transaction_id) already submitted.
+
+    Keys live in a sorted array('Q') searched with bisect (8 bytes per slip)
+    plus a set of recent keys. The array and the highest slip id seen are
+    snapshotted to TRANSACTION_INDEX_FILE, so a restart only pulls slips
+    inserted after the snapshot instead of the whole history.
+    """
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __new__(cls):
+        with cls._instance_lock:
+            if cls._instance is None:
+                instance = super().__new__(cls)
+                instance._lock = threading.RLock()
+                instance._sorted = array('Q')
+                instance._recent = set()
+                instance._watermark = None
+                instance._refreshed_at = 0.0
+                instance._seeded = False
+                cls._instance = instance
+        return cls._instance
+
+    def _contains(self, key: int) -> bool:
+        if key in self._recent:
+            return True
+        i = bisect.bisect_left(self._sorted, key)
+        return i < len(self._sorted) and self._sorted[i] == key
+
+    def _merge(self):
+        self._sorted = array('Q', _unique(heapq.merge(self._sorted, sorted(self._recent))))
+        self._recent = set()
+        self._save()
+
+    def _load(self):
+        with open(TRANSACTION_INDEX_FILE, "rb") as f:
+            header = json.loads(f.readline())
+            keys = array('Q')
+            keys.frombytes(f.read())
+        if len(keys) == header["count"]:
+            self._sorted = keys
+            self._watermark = header["watermark"]
+
+    def _save(self):
+        os.makedirs(os.path.dirname(TRANSACTION_INDEX_FILE) or ".", exist_ok=True)
+        temp = f"{TRANSACTION_INDEX_FILE}.tmp"
+        with open(temp, "wb") as f:
+            f.write(json.dumps({"watermark": self._watermark, "count": len(self._sorted)}).encode() + b"\n")
+            self._sorted.tofile(f)
+        os.replace(temp, TRANSACTION_INDEX_FILE)
+
+    def _seed(self):
+        if os.path.exists(TRANSACTION_INDEX_FILE):
+            try:
+                self._load()
+            except (ValueError, KeyError, OSError):
+                # A damaged snapshot is rebuilt from the slips table
+                self._sorted, self._watermark = array('Q'), None
+        loaded = self._watermark is not None
+        self._pull_slips()
+        if not loaded:
+            # First build: fold the whole history into the array and snapshot it
+            self._merge()
+        self._seeded = True
+
+    def _pull_slips(self):
+        """Fetch keys of slips inserted after the watermark id, page by page"""
+        for row in iter_slip_rows(['slip_type', 'transaction_id'], self._watermark):
+            if row.get('transaction_id'):
+                self._recent.add(transaction_key(row.get('slip_type'), row['transaction_id']))
+            self._watermark = row['id']
+        self._refreshed_at = time.monotonic()
+        if len(self._recent) >= TRANSACTION_MERGE_SIZE:
+            self._merge()
+
+    def _ensure_fresh(self):
+        if not self._seeded:
+            self._seed()
+        elif time.monotonic() - self._refreshed_at >= TRANSACTION_INDEX_REFRESH:
+            self._pull_slips()
+
+    def contains(self, slip_type: str, transaction_id) -> bool:
+        """Return True if this transaction ID or serial was already submitted for the slip type"""
+        with self._lock:
+            self._ensure_fresh()
+            return self._contains(transaction_key(slip_type, transaction_id))
+
+    def check_batch(self, entries: Iterable[Dict]) -> Dict[Tuple[str, str], str]:
+        """Check a whole batch of slip entries at once.
+
+        Returns {(slip_type, transaction_id): reason} for every pair that is
+        already indexed or appears more than once within the batch itself.
+        """
+        duplicates = {}
+        seen = set()
+        with self._lock:
+            self._ensure_fresh()
+            for entry in entries:
+                if not entry.get('transaction_id'):
+                    continue
+                pair = (entry.get('slip_type'), normalize_transaction_id(entry['transaction_id']))
+                key = transaction_key(*pair)
+                if key in seen:
+                    duplicates[pair] = "repeated in this batch"
+                elif self._contains(key):
+                    duplicates[pair] = "already submitted"
+                seen.add(key)
+        return duplicates
+
+    def conflict(self, slip_type: str, transaction_id, pending: Iterable[Dict] = ()) -> Optional[str]:
+        """Why this pair cannot be added to the pending batch, or None if it can"""
+        candidate = {"slip_type": slip_type, "transaction_id": transaction_id}
+        duplicates = self.check_batch([*pending, candidate])
+        return duplicates.get((slip_type, normalize_transaction_id(transaction_id)))
+
+    def add_many(self, entries: Iterable[Dict]):
+        """Record the transaction IDs of newly submitted slips"""
+        with self._lock:
+            for entry in entries:
+                if entry.get('transaction_id'):
+                    self._recent.add(transaction_key(entry.get('slip_type'), entry['transaction_id']))
+            if len(self._recent) >= TRANSACTION_MERGE_SIZE:
+                self._merge()
+
+def get_transaction_index() -> TransactionIndex:
+    return TransactionIndex()
@@ -1,19 +1,20 @@
-import os
 import hashlib
+import os
+import re
 from datetime import datetime, timedelta
-from typing import Tuple, List
-from PIL import Image
-import io
+from typing import Tuple, List, Iterable, Dict, Optional
 import streamlit as st
-from supabase_client import get_supabase
 
-def calculate_commission(slip_type: str, quantity: int) -> float:
-    """Calculate commission based on slip type and quantity"""
-    rates = {
-        "Cash Slip": 25,
-        "Online Slip": 50
-    }
-    return rates.get(slip_type, 0) * quantity
+# The image and commission helpers pull in numpy and PIL, so they are
+# imported inside the functions that need them; the admin panel and
+# google_sync only use the light helpers in this module.
+
+DATA_FILE = "data/all_branch_data.xlsx"
+
+def calculate_commission(slip_type: str, quantity: int, on=None) -> float:
+    """Calculate commission based on slip type and quantity at the rates in force on `on` (default today)"""
+    from modules.commission import get_rate_table
+    return get_rate_table().rate_for(slip_type, on) * quantity
 
 def generate_week_ranges(weeks: int = 12) -> List[Tuple[str, Tuple[datetime, datetime]]]:
     """Generate weekly date ranges for the last N weeks"""
@@ -24,31 +25,75 @@ def generate_week_ranges(weeks: int = 12) -> List[Tuple[str, Tuple[datetime, dat
         for start in week_starts
     ]
 
-def save_uploaded_image(file, branch_code: str, rider_name: str) -> str:
-    """Save uploaded image with hash verification"""
-    supabase = get_supabase()
+def path_component(name: str) -> str:
+    """A branch code or rider name made safe to use as one folder of an image path"""
+    cleaned = re.sub(r"[^\w .-]", "_", str(name)).strip(" .")
+    return cleaned or "_"
+
+def prepare_uploaded_image(file, branch_code: str, rider_name: str,
+                           pending: Iterable[dict] = ()) -> Tuple[Dict[str, Optional[str]], Dict]:
+    """Validate, hash, duplicate-check and normalize an upload.
+
+    `pending` is the current unsubmitted batch. The exact check runs on the
+    SHA-256 of the raw bytes and the perceptual check on the decoded image,
+    both before the image is downscaled and re-encoded, so an exact
+    duplicate is rejected without paying for the encode. A near duplicate
+    is not rejected: the nearest match is recorded in near_duplicate_of and
+    near_duplicate_distance for an admin to review. Returns the image and
+    near-duplicate fields for the slip entry plus the upload to hand to
+    upload_images(). Nothing is sent to storage here.
+    """
+    from modules.hash_index import get_hash_index
+    from modules.ingest import IMAGE_EXTENSIONS, decode_image, normalize_image, passthrough_file
+    from modules.phash import (
+        check_near_duplicates,
+        near_duplicate_flag,
+        perceptual_check_enabled,
+        perceptual_hash
+    )
+    pending = list(pending)
     file_bytes = file.getvalue()
+    file_ext = os.path.splitext(file.name)[1]
     file_hash = hashlib.sha256(file_bytes).hexdigest()
     
-    # Check for duplicates
-    res = supabase.table('slips').select('image_hash').eq('image_hash', file_hash).execute()
-    if len(res.data) > 0:
+    # Check for duplicates in the unsubmitted batch and in submitted slips
+    if file_hash in {e.get('image_hash') for e in pending} or get_hash_index().contains(file_hash):
         raise ValueError("Duplicate image detected")
     
-    # Save to storage
-    file_ext = os.path.splitext(file.name)[1]
-    file_name = f"{datetime.now().timestamp()}{file_ext}"
-    file_path = f"{branch_code}/{rider_name}/{file_name}"
+    if file_ext.lower() not in IMAGE_EXTENSIONS:
+        ingested = passthrough_file(file_bytes, file_ext)
+        image_phash = None
+        matches = []
+    else:
+        image = decode_image(file_bytes)
+        image_phash = perceptual_hash(image)
+        matches = check_near_duplicates(image_phash, pending) if perceptual_check_enabled() else []
+        ingested = normalize_image(image)
     
-    try:
-        # For images, we can validate them
-        if file_ext.lower() in ['.jpg', '.jpeg', '.png']:
-            Image.open(io.BytesIO(file_bytes))
-        
-        supabase.storage().from_('slip_images').upload(file_path, file_bytes)
-        return file_path
-    except Exception as e:
-        raise ValueError(f"Failed to save image: {str(e)}")
+    file_name = f"{datetime.now().timestamp()}{ingested['ext']}"
+    file_path = f"{path_component(branch_code)}/{path_component(rider_name)}/{file_name}"
+    image_info = {
+        "image_path": file_path,
+        "image_hash": file_hash,
+        "image_phash": image_phash,
+        **near_duplicate_flag(matches)
+    }
+    upload = {
+        "path": file_path,
+        "data": ingested["data"],
+        "content_type": ingested["content_type"]
+    }
+    return image_info, upload
+
+def save_uploaded_image(file, branch_code: str, rider_name: str,
+                        pending: Iterable[dict] = ()) -> Dict[str, Optional[str]]:
+    """Prepare an upload and store it right away, returning the slip entry image fields"""
+    from modules.ingest import upload_images
+    image_info, upload = prepare_uploaded_image(file, branch_code, rider_name, pending)
+    error = upload_images([upload])[0]
+    if error is not None:
+        raise ValueError(f"Failed to save image: {str(error)}")
+    return image_info
 
 def validate_transaction_id(slip_type: str, transaction_id: str) -> bool:
     """Validate transaction ID based on slip type"""
@@ -1,20 +1,70 @@
+import importlib.util
 import os
-from supabase import create_client, Client
+import threading
 from dotenv import load_dotenv
+from modules.metrics import instrument_supabase
 
 load_dotenv()
 
+SUPABASE_POOL_SIZE = int(os.getenv("SUPABASE_POOL_SIZE", "20"))
+SUPABASE_KEEPALIVE = float(os.getenv("SUPABASE_KEEPALIVE", "60"))
+SUPABASE_HTTP2 = os.getenv("SUPABASE_HTTP2", "1") == "1"
+
+def _setting(name: str):
+    value = os.getenv(name)
+    if value:
+        return value
+    # Streamlit Cloud keeps credentials in secrets rather than the environment
+    try:
+        import streamlit as st
+        return st.secrets.get(name)
+    except Exception:
+        return None
+
+def _pooled(session):
+    """Rebuild an httpx session with a shared keep-alive pool (HTTP/2 if h2 is installed)"""
+    import httpx
+    return type(session)(
+        base_url=session.base_url,
+        headers=session.headers,
+        timeout=session.timeout,
+        http2=SUPABASE_HTTP2 and importlib.util.find_spec("h2") is not None,
+        limits=httpx.Limits(
+            max_connections=SUPABASE_POOL_SIZE,
+            max_keepalive_connections=SUPABASE_POOL_SIZE,
+            keepalive_expiry=SUPABASE_KEEPALIVE
+        )
+    )
+
 class SupabaseClient:
+    """One client per process; every Streamlit session shares its connection pools"""
     _instance = None
-    
+    _lock = threading.Lock()
+
     def __new__(cls):
-        if cls._instance is None:
-            url = os.getenv("SUPABASE_URL")
-            key = os.getenv("SUPABASE_KEY")
-            if not url or not key:
-                raise ValueError("Supabase URL and Key must be set in environment variables")
-            cls._instance = create_client(url, key)
+        with cls._lock:
+            if cls._instance is None:
+                from supabase import create_client
+                url = _setting("SUPABASE_URL")
+                key = _setting("SUPABASE_KEY")
+                if not url or not key:
+                    raise ValueError("Supabase URL and Key must be set in environment variables")
+                client = create_client(url, key)
+                try:
+                    client.postgrest.session = _pooled(client.postgrest.session)
+                    storage = client.storage
+                    storage.session = storage._client = _pooled(storage.session)
+                except AttributeError:
+                    # Client internals differ from supabase 2.3; keep its default sessions
+                    pass
+                cls._instance = client
         return cls._instance
 
+_instrumented = None
+
 def get_supabase():
-    return SupabaseClient()
+    """Shared client wrapped so every query and upload is timed"""
+    global _instrumented
+    if _instrumented is None:
+        _instrumented = instrument_supabase(SupabaseClient())
+    return _instrumented
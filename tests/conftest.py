@@ -0,0 +1,36 @@
+import os
+import tempfile
+import pytest
+from benchmarks.run import _isolate
+
+# Module settings are read from the environment at import time
+_isolate(tempfile.mkdtemp(prefix="slip_tests_"))
+os.environ["JOB_WORKERS"] = "0"
+
+@pytest.fixture
+def client():
+    """A fresh in-memory FakeSupabase installed as the repository"""
+    from benchmarks.cases import fake_backend
+    from modules.storage import set_repository
+    yield fake_backend()
+    set_repository(None)
+
+class Clock:
+    def __init__(self, now: float = 1_000_000.0):
+        self.now = now
+
+    def time(self) -> float:
+        return self.now
+
+@pytest.fixture
+def clock():
+    return Clock()
+
+@pytest.fixture
+def queue(tmp_path, monkeypatch, clock):
+    """An empty JobQueue in its own file, driven by run_once() and a fake clock"""
+    from modules import jobs
+    monkeypatch.setattr(jobs, "JOB_QUEUE_PATH", str(tmp_path / "jobs.db"))
+    monkeypatch.setattr(jobs.JobQueue, "_instance", None)
+    monkeypatch.setattr(jobs, "time", clock)
+    return jobs.JobQueue()
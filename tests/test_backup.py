@@ -0,0 +1,55 @@
+import pandas as pd
+import pytest
+from modules import backup
+
+@pytest.fixture
+def journal(tmp_path, monkeypatch):
+    """An empty journal and snapshot directory"""
+    monkeypatch.setattr(backup, "BACKUP_DIR", str(tmp_path))
+    monkeypatch.setattr(backup, "JOURNAL_FILE", str(tmp_path / "journal.jsonl.gz"))
+    monkeypatch.setattr(backup, "SNAPSHOT_DIR", str(tmp_path / "snapshots"))
+    return tmp_path
+
+def sheet(*riders):
+    return pd.DataFrame({
+        "Rider Name": list(riders),
+        "Quantity": [len(rider) for rider in riders],
+        "Week": ["2025-05-12"] * len(riders),
+    })
+
+DAYS = [
+    {"Ali Hamza": sheet("Bilal", "Asad"), "Ali Branch": sheet("Umar")},
+    # Reordered, a row inserted in the middle and a repeated row
+    {"Ali Hamza": sheet("Asad", "Zain", "Bilal", "Bilal"), "Ali Branch": sheet("Umar")},
+    # Rows removed from the front, a sheet dropped and one added
+    {"Ali Hamza": sheet("Bilal", "Bilal"), "New Branch": sheet("Saad", "Hamid")},
+    # Fully reversed
+    {"Ali Hamza": sheet("Bilal", "Kamran", "Bilal", "Asad")[::-1].reset_index(drop=True)},
+]
+
+def assert_same(expected, restored):
+    assert sorted(expected) == sorted(restored)
+    for name, df in expected.items():
+        assert df.equals(restored[name]), name
+
+def test_restore_round_trips_every_day_in_row_order(journal):
+    for day, tables in enumerate(DAYS):
+        backup.record(tables, f"2025-05-1{day}T23:59:59")
+    for day, tables in enumerate(DAYS):
+        assert_same(tables, backup.restore(f"2025-05-1{day}T23:59:59"))
+
+def test_out_of_order_record_and_snapshot_keep_row_order(journal, monkeypatch):
+    monkeypatch.setattr(backup, "SNAPSHOT_EVERY", 3)
+    # A legacy backup converted after newer days were already journaled
+    for day in (0, 2, 3, 1):
+        backup.record(DAYS[day], f"2025-05-1{day}T23:59:59")
+    assert backup._snapshots()
+    for day, tables in enumerate(DAYS):
+        assert_same(tables, backup.restore(f"2025-05-1{day}T23:59:59"))
+
+def test_unchanged_order_writes_nothing(journal):
+    backup.record(DAYS[1], "2025-05-10T00:00:00")
+    assert backup.record(DAYS[1], "2025-05-11T00:00:00") == 0
+    # Moving one row rewrites that row only
+    moved = {"Ali Hamza": sheet("Zain", "Asad", "Bilal", "Bilal"), "Ali Branch": sheet("Umar")}
+    assert backup.record(moved, "2025-05-12T00:00:00") == 2
@@ -0,0 +1,40 @@
+from datetime import date
+import pandas as pd
+import pytest
+from modules import commission
+from modules.utils import calculate_commission
+
+def legacy_commission(slip_type: str, quantity: int) -> float:
+    """calculate_commission as it was before the rate table"""
+    rates = {
+        "Cash Slip": 25,
+        "Online Slip": 50
+    }
+    return rates.get(slip_type, 0) * quantity
+
+SLIP_TYPES = ["Cash Slip", "Online Slip", "Unknown Slip", ""]
+QUANTITIES = [0, 1, 2, 99, 100, 10_000]
+DATES = [None, "2000-01-01", "2025-05-12", "2025-05-12 to 2025-05-18", date(2031, 12, 31)]
+
+@pytest.fixture(autouse=True)
+def default_rates(monkeypatch):
+    """The built-in rate versions, whatever rates file the checkout has"""
+    monkeypatch.setattr(commission, "_rate_table", commission.RateTable(commission.DEFAULT_RATE_VERSIONS))
+
+@pytest.mark.parametrize("slip_type", SLIP_TYPES)
+@pytest.mark.parametrize("quantity", QUANTITIES)
+def test_matches_the_hardcoded_rates_without_a_date(slip_type, quantity):
+    assert calculate_commission(slip_type, quantity) == legacy_commission(slip_type, quantity)
+
+@pytest.mark.parametrize("slip_type", SLIP_TYPES)
+@pytest.mark.parametrize("quantity", QUANTITIES)
+@pytest.mark.parametrize("on", DATES)
+def test_matches_the_hardcoded_rates_on_any_date(slip_type, quantity, on):
+    assert calculate_commission(slip_type, quantity, on=on) == legacy_commission(slip_type, quantity)
+
+def test_vectorized_pricing_matches_the_hardcoded_rates():
+    rows = [(t, q, d) for t in SLIP_TYPES for q in QUANTITIES for d in DATES if d is None or isinstance(d, str)]
+    df = pd.DataFrame(rows, columns=["slip_type", "quantity", "week"])
+    expected = [legacy_commission(t, q) for t, q, _ in rows]
+    assert commission.recompute_commissions(df).tolist() == expected
+    assert commission.get_rate_table().compute(df["slip_type"], df["quantity"]).tolist() == expected
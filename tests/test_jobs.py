@@ -0,0 +1,162 @@
+import pytest
+from modules import jobs
+from modules.jobs import QueueFull
+
+@pytest.fixture
+def handlers(monkeypatch):
+    """Register test job kinds; outcomes[kind] is a list of errors to raise in turn (None succeeds)"""
+    outcomes = {"work": [], "first": [], "second": []}
+    ran = []
+
+    def make(kind):
+        def run(job):
+            ran.append((kind, job["id"]))
+            error = outcomes[kind].pop(0) if outcomes[kind] else None
+            if error:
+                raise RuntimeError(error)
+        return run
+
+    for kind in outcomes:
+        monkeypatch.setitem(jobs._HANDLERS, kind, (make(kind), False))
+    return outcomes, ran
+
+def job(queue, job_id):
+    return next(row for row in queue.list_jobs() if row["id"] == job_id)
+
+def test_lease_is_taken_over_after_it_expires(queue, clock, handlers):
+    job_id = queue.enqueue("work", {})
+    claimed = queue._claim()
+    assert [row["id"] for row in claimed] == [job_id]
+    # The worker died without finishing: nobody else may take the job yet
+    assert queue._claim() == []
+    clock.now += jobs.JOB_LEASE + 1
+    reclaimed = queue._claim()
+    assert [row["id"] for row in reclaimed] == [job_id]
+    assert reclaimed[0]["attempts"] == 2
+
+def test_failed_job_is_retried_with_backoff(queue, clock, handlers, monkeypatch):
+    monkeypatch.setattr(jobs, "JOB_BACKOFF", 10.0)
+    outcomes, ran = handlers
+    outcomes["work"] += ["timeout", "timeout"]
+    job_id = queue.enqueue("work", {}, data=b"blob", max_attempts=3)
+
+    assert queue.run_once() == 1
+    row = job(queue, job_id)
+    assert (row["status"], row["attempts"], row["last_error"]) == ("queued", 1, "timeout")
+    # Not ready before the backoff (10 s, jittered up to 20 s) has passed
+    clock.now += 9
+    assert queue.run_once() == 0
+    clock.now += 11
+    assert queue.run_once() == 1
+    assert job(queue, job_id)["attempts"] == 2
+    # Second retry waits twice as long
+    clock.now += 19
+    assert queue.run_once() == 0
+    clock.now += 21
+    assert queue.run_once() == 1
+    row = job(queue, job_id)
+    assert (row["status"], row["attempts"], row["last_error"]) == ("done", 3, None)
+    assert queue._conn().execute("SELECT data FROM jobs WHERE id = ?", (job_id,)).fetchone()[0] is None
+    assert len(ran) == 3
+
+def test_job_fails_for_good_after_max_attempts(queue, clock, handlers, monkeypatch):
+    monkeypatch.setattr(jobs, "JOB_BACKOFF", 0.0)
+    outcomes, _ = handlers
+    outcomes["work"] += ["boom"] * 2
+    job_id = queue.enqueue("work", {}, max_attempts=2)
+    assert queue.run_once() == 1
+    assert queue.run_once() == 1
+    row = job(queue, job_id)
+    assert (row["status"], row["last_error"]) == ("failed", "boom")
+    assert row["finished_at"] is not None
+    assert queue.run_once() == 0
+
+def test_dependent_waits_and_fails_with_its_dependency(queue, clock, handlers, monkeypatch):
+    monkeypatch.setattr(jobs, "JOB_BACKOFF", 10.0)
+    outcomes, ran = handlers
+    outcomes["first"] += ["refused", "refused"]
+    first, second = queue.enqueue_many([
+        {"kind": "first", "payload": {}, "max_attempts": 2},
+        {"kind": "second", "payload": {}, "after": 0},
+    ])
+
+    assert queue.run_once() == 1
+    # first is backing off; second must not overtake it
+    assert queue.run_once() == 0
+    clock.now += 20
+    assert queue.run_once() == 1
+    assert job(queue, first)["status"] == "failed"
+    row = job(queue, second)
+    assert (row["status"], row["last_error"]) == ("failed", f"Depends on failed job {first}")
+    assert ran == [("first", first), ("first", first)]
+
+    # Retrying the dependency queues its dependents again too
+    queue.retry([first])
+    assert job(queue, second)["status"] == "queued"
+    assert queue.run_once() == 1
+    assert queue.run_once() == 1
+    assert [job(queue, job_id)["status"] for job_id in (first, second)] == ["done", "done"]
+    assert ran[2:] == [("first", first), ("second", second)]
+
+def test_dedup_key_returns_the_existing_job(queue, clock, handlers, monkeypatch):
+    monkeypatch.setattr(jobs, "JOB_BACKOFF", 0.0)
+    outcomes, _ = handlers
+    job_id = queue.enqueue("work", {"n": 1}, dedup_key="slip:1", max_attempts=1)
+    assert queue.enqueue("work", {"n": 2}, dedup_key="slip:1") == job_id
+    assert queue.counts()["queued"] == 1
+    queue.run_once()
+    # A finished job still absorbs duplicates
+    assert queue.enqueue("work", {}, dedup_key="slip:1") == job_id
+    assert queue.counts()["done"] == 1
+
+    outcomes["work"].append("boom")
+    failed_id = queue.enqueue("work", {}, dedup_key="slip:2", max_attempts=1)
+    queue.run_once()
+    assert job(queue, failed_id)["status"] == "failed"
+    # A failed match is queued again under the same id
+    assert queue.enqueue("work", {}, dedup_key="slip:2") == failed_id
+    row = job(queue, failed_id)
+    assert (row["status"], row["attempts"], row["last_error"]) == ("queued", 0, None)
+
+def test_coalesce_only_matches_jobs_that_have_not_started(queue, handlers):
+    job_id = queue.enqueue("work", {}, dedup_key="sync", coalesce=True)
+    assert queue.enqueue("work", {}, dedup_key="sync", coalesce=True) == job_id
+    queue._claim()
+    # The running sync may already have read the old data, so queue another
+    later = queue.enqueue("work", {}, dedup_key="sync", coalesce=True)
+    assert later != job_id
+    assert queue.enqueue("work", {}, dedup_key="sync", coalesce=True) == later
+
+def test_queue_full_rejects_the_whole_batch(queue, handlers, monkeypatch):
+    monkeypatch.setattr(jobs, "JOB_MAX_PENDING", 2)
+    queue.enqueue("work", {})
+    with pytest.raises(QueueFull):
+        queue.enqueue_many([{"kind": "work", "payload": {}}, {"kind": "work", "payload": {}}])
+    assert queue.counts()["queued"] == 1
+    queue.enqueue("work", {})
+    queue.run_once()
+    once = queue.enqueue("work", {}, dedup_key="once")
+    assert queue.counts()["queued"] == 2
+    # A duplicate of a waiting job does not count against the limit
+    assert queue.enqueue("work", {}, dedup_key="once") == once
+    with pytest.raises(QueueFull):
+        queue.enqueue("work", {})
+
+def test_unknown_kind_is_refused(queue):
+    with pytest.raises(ValueError, match="Unknown job kind"):
+        queue.enqueue("nope", {})
+
+def test_batch_handler_gets_every_ready_job_of_its_kind(queue, clock, monkeypatch):
+    batches = []
+
+    def insert(batch):
+        batches.append([row["payload"]["n"] for row in batch])
+        return [None if row["payload"]["n"] % 2 else "bad row" for row in batch]
+
+    monkeypatch.setitem(jobs._HANDLERS, "batch", (insert, True))
+    monkeypatch.setattr(jobs, "JOB_BACKOFF", 0.0)
+    ids = queue.enqueue_many([{"kind": "batch", "payload": {"n": n}, "max_attempts": 1} for n in range(4)])
+    assert queue.run_once() == 4
+    assert batches == [[0, 1, 2, 3]]
+    assert [job(queue, job_id)["status"] for job_id in ids] == ["failed", "done", "failed", "done"]
+    assert job(queue, ids[0])["last_error"] == "bad row"
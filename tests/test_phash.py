@@ -0,0 +1,58 @@
+import random
+from modules.phash import BKTree, hamming
+
+def test_search_matches_a_linear_scan():
+    rng = random.Random(7)
+    base = [rng.getrandbits(64) for _ in range(20)]
+    # Clusters of near copies so small radii have several hits
+    values = base + [b ^ (1 << rng.randrange(64)) ^ (1 << rng.randrange(64)) for b in base for _ in range(5)]
+    tree = BKTree()
+    for i, value in enumerate(values):
+        tree.add(value, i)
+    assert tree.size == len(values)
+
+    for query in base[:5] + [rng.getrandbits(64) for _ in range(5)]:
+        for radius in (0, 2, 4, 10):
+            expected = sorted((hamming(query, v), i) for i, v in enumerate(values) if hamming(query, v) <= radius)
+            found = tree.search(query, radius)
+            assert sorted(found) == expected
+            assert [d for d, _ in found] == sorted(d for d, _ in found)
+
+def test_equal_hashes_share_a_node():
+    tree = BKTree()
+    tree.add(0xABC, "a")
+    tree.add(0xABC, "b")
+    tree.add(0xABD, "c")
+    assert tree.search(0xABC, 0) == [(0, "a"), (0, "b")]
+    assert tree.search(0xABC, 1)[-1] == (1, "c")
+
+def test_empty_tree():
+    assert BKTree().search(0, 64) == []
+
+class Upload:
+    def __init__(self, name: str, data: bytes):
+        self.name = name
+        self._data = data
+
+    def getvalue(self) -> bytes:
+        return self._data
+
+def jpeg(quality: int) -> Upload:
+    from io import BytesIO
+    from PIL import Image
+    image = Image.linear_gradient("L").resize((400, 300)).convert("RGB")
+    buffer = BytesIO()
+    image.save(buffer, "JPEG", quality=quality)
+    return Upload("slip.jpg", buffer.getvalue())
+
+def test_near_duplicate_is_flagged_not_rejected(client):
+    from modules.utils import prepare_uploaded_image
+    first, _ = prepare_uploaded_image(jpeg(95), "BR1", "Rider", [])
+    assert first["near_duplicate_of"] is None
+
+    # Same picture re-encoded: a different SHA-256 but a close perceptual hash
+    second, upload = prepare_uploaded_image(jpeg(60), "BR1", "Rider", [first])
+    assert second["image_hash"] != first["image_hash"]
+    assert second["near_duplicate_of"] == first["image_path"]
+    assert second["near_duplicate_distance"] <= 4
+    assert upload["data"]
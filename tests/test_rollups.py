@@ -0,0 +1,70 @@
+import random
+import pytest
+from benchmarks.cases import fake_backend, make_slips, reset_caches
+from modules.rollups import ROLLUP_COLUMNS, WeeklyRollups, build_cells, get_weekly_rollups
+from modules.hash_index import iter_slip_rows
+from modules.slip_query import apply_slip_status_changes
+from modules.storage import SQLiteRepository, get_repository, set_repository
+
+BRANCHES = ["BR00000", "BR00001", "BR00002"]
+
+@pytest.fixture(params=["supabase", "sqlite"])
+def repository(request, tmp_path):
+    """A repository holding 300 slips, on the fake Supabase or on SQLite"""
+    if request.param == "supabase":
+        fake_backend(slips=0)
+    else:
+        set_repository(SQLiteRepository(str(tmp_path / "slips.db"), str(tmp_path / "images")))
+        reset_caches()
+    get_repository().insert_slips(list(make_slips(300, BRANCHES)))
+    yield get_repository()
+    set_repository(None)
+
+def new_slips(count: int, start: int):
+    slips = list(make_slips(start + count, BRANCHES))[start:]
+    for slip in slips:
+        slip["idempotency_key"] = f"new-{slip['idempotency_key']}"
+    return slips
+
+def slip_ids():
+    return [row["id"] for row in iter_slip_rows(["id"])]
+
+def assert_matches_rebuild(rollups):
+    rollups.refresh()
+    incremental = rollups.snapshot()
+    assert incremental == build_cells(iter_slip_rows(ROLLUP_COLUMNS))
+    WeeklyRollups._instance = None
+    assert get_weekly_rollups().snapshot() == incremental
+
+def test_incremental_updates_match_a_full_rebuild(repository):
+    rng = random.Random(11)
+    rollups = get_weekly_rollups()
+    rollups.snapshot()
+    start = 300
+    for _ in range(5):
+        # Inserted here and applied straight away, as the insert_slip job does
+        local = new_slips(20, start)
+        repository.insert_slips(local)
+        for slip in local:
+            rollups.apply_insert(slip)
+        # Inserted by another process, picked up by the next pull
+        repository.insert_slips(new_slips(20, start + 20))
+        start += 40
+        ids = slip_ids()
+        # Status changes made here, and by another process
+        apply_slip_status_changes({
+            status: rng.sample(ids, 15) for status in ("approved", "rejected", "pending")
+        })
+        repository.update_slips(rng.sample(ids, 25), {"status": rng.choice(["approved", "rejected"])})
+        assert_matches_rebuild(rollups)
+        rollups = get_weekly_rollups()
+
+def test_repeated_status_changes_settle_on_the_last(repository):
+    rollups = get_weekly_rollups()
+    before = rollups.snapshot()
+    ids = slip_ids()[:50]
+    for status in ("approved", "rejected", "approved", "pending"):
+        repository.update_slips(ids, {"status": status})
+    rollups.refresh()
+    assert rollups.snapshot() != before
+    assert_matches_rebuild(rollups)
@@ -0,0 +1,40 @@
+from modules.sheet_sync import _row_hash, diff_rows
+
+def hashes(values):
+    return [_row_hash(row) for row in values]
+
+def test_unchanged_sheet_needs_no_writes():
+    values = [["a", "b"], [1, 2], [3, 4]]
+    assert diff_rows(hashes(values), 2, values) == ([], [])
+
+def test_consecutive_changed_rows_are_one_range():
+    old = [["h1", "h2"], [1, 2], [3, 4], [5, 6], [7, 8]]
+    new = [["h1", "h2"], [1, 9], [3, 9], [5, 6], [7, 9]]
+    updates, clears = diff_rows(hashes(old), 2, new)
+    assert updates == [
+        {"range": "A2:B3", "values": [[1, 9], [3, 9]]},
+        {"range": "A5:B5", "values": [[7, 9]]},
+    ]
+    assert clears == []
+
+def test_appended_rows_and_short_rows_are_padded():
+    old = [["h1", "h2", "h3"]]
+    new = [["h1", "h2", "h3"], [1], [2, 3, 4]]
+    updates, _ = diff_rows(hashes(old), 3, new)
+    assert updates == [{"range": "A2:C3", "values": [[1, "", ""], [2, 3, 4]]}]
+
+def test_removed_rows_and_columns_are_cleared():
+    old = [["h1", "h2", "h3"], [1, 2, 3], [4, 5, 6], [7, 8, 9]]
+    new = [["h1", "h2"], [1, 2]]
+    updates, clears = diff_rows(hashes(old), 3, new)
+    assert [update["range"] for update in updates] == ["A1:B2"]
+    assert clears == ["A3:C4", "C1:C2"]
+
+def test_first_sync_writes_everything():
+    new = [["h"], [1], [2]]
+    assert diff_rows([], 0, new) == ([{"range": "A1:A3", "values": new}], [])
+
+def test_columns_past_z_use_two_letters():
+    new = [list(range(28))]
+    updates, _ = diff_rows([], 0, new)
+    assert updates[0]["range"] == "A1:AB1"
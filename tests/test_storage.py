@@ -0,0 +1,151 @@
+import os
+import pytest
+from modules.storage import SQLiteRepository
+from modules.utils import path_component
+
+@pytest.fixture
+def repo(tmp_path):
+    return SQLiteRepository(str(tmp_path / "slips.db"), str(tmp_path / "images"))
+
+def slip(i: int, **fields):
+    return {
+        "branch_code": "BR1" if i % 2 else "BR2",
+        "rider_name": f"Rider {i % 3}",
+        "slip_type": "Cash Slip",
+        "quantity": 1 + i % 4,
+        "commission": 25.0 * (1 + i % 4),
+        "status": "pending",
+        "week": "2025-05-12 to 2025-05-18",
+        "transaction_id": f"{i:010d}",
+        "submitted_at": f"2025-05-{12 + i % 7:02d}T10:00:00",
+        "idempotency_key": f"key-{i}",
+        **fields,
+    }
+
+def test_branches_and_riders(repo):
+    repo.insert_branch({"code": "BR1", "name": "One", "riders": ["Legacy"]})
+    repo.insert_branch({"code": "BR2", "name": "Two"})
+    repo.update_branch("BR1", {"name": "First"})
+    assert [(b["code"], b["name"], b["riders"]) for b in repo.list_branches()] == [
+        ("BR1", "First", ["Legacy"]), ("BR2", "Two", []),
+    ]
+    repo.add_rider("BR1", "Ali")
+    with pytest.raises(ValueError):
+        repo.add_rider("BR1", "Ali")
+    assert repo.add_riders([{"branch_code": "BR1", "name": n} for n in ("Ali", "Bilal", "Zain")]) == 2
+    repo.rename_rider("BR1", "Zain", "Asad")
+    with pytest.raises(ValueError):
+        repo.rename_rider("BR1", "Asad", "Ali")
+    repo.remove_rider("BR1", "Bilal")
+    assert [r["name"] for r in repo.list_riders("BR1")] == ["Ali", "Asad"]
+    # Deleting a branch takes its roster with it
+    repo.delete_branch("BR1")
+    assert repo.get_branch("BR1") is None
+    assert repo.list_riders() == []
+
+def test_slips_insert_page_and_update(repo):
+    repo.insert_slips([slip(i) for i in range(10)])
+    # Same idempotency keys: nothing inserted twice
+    repo.insert_slips([slip(i) for i in range(5)])
+    ids = [row["id"] for row in repo.slips_after(["id"], None, 100)]
+    assert len(ids) == 10 and ids == sorted(ids)
+    assert [row["id"] for row in repo.slips_after(["id"], ids[6], 100)] == ids[7:]
+
+    page = repo.slip_page({"branch_code": "BR1"}, ["id", "branch_code"], None, 3)
+    assert [row["id"] for row in page] == sorted((i for i, n in zip(ids, range(10)) if n % 2), reverse=True)[:3]
+    after = repo.slip_page({"branch_code": "BR1"}, ["id"], page[-1]["id"], 3)
+    assert all(row["id"] < page[-1]["id"] for row in after) and len(after) == 2
+    dated = repo.slip_page({"date_from": "2025-05-13", "date_to": "2025-05-14"}, ["idempotency_key"], None, 100)
+    assert sorted(row["idempotency_key"] for row in dated) == ["key-1", "key-8"]
+    with pytest.raises(ValueError):
+        repo.slip_page({}, ["id; DROP TABLE slips"], None, 1)
+
+    repo.update_slips(ids[:3], {"status": "approved"})
+    assert len(repo.slip_page({"status": "approved"}, ["id"], None, 100)) == 3
+
+def test_change_requests(repo):
+    for i in range(3):
+        repo.insert_change_request({
+            "branch_code": "BR1", "description": f"fix {i}", "status": "pending",
+            "requested_at": f"2025-05-1{i}T09:00:00", "requested_by": "Manager",
+        })
+    requests = repo.change_request_page({"status": "pending"}, None, 10)
+    assert [r["description"] for r in requests] == ["fix 2", "fix 1", "fix 0"]
+    repo.update_change_requests([requests[0]["id"]], {"status": "done"})
+    assert [r["description"] for r in repo.change_request_page({"status": "done"}, None, 10)] == ["fix 2"]
+    assert len(repo.change_request_page({"date_from": "2025-05-11"}, None, 10)) == 2
+
+def test_status_changes_and_deletes_are_logged(repo):
+    repo.insert_slips([slip(i) for i in range(3)])
+    ids = [row["id"] for row in repo.slips_after(["id"], None, 10)]
+    assert repo.last_status_change_id() is None
+    repo.update_slips(ids[:2], {"status": "approved"})
+    # Unchanged status and other columns are not logged
+    repo.update_slips(ids[:1], {"status": "approved"})
+    repo.update_slips(ids, {"manager_name": "Someone"})
+    repo._conn().execute("DELETE FROM slips WHERE id = ?", (ids[0],))
+    changes = repo.status_changes_after(None, 10)
+    assert [(c["slip_id"], c["old_status"], c["new_status"]) for c in changes] == [
+        (ids[0], "pending", "approved"), (ids[1], "pending", "approved"), (ids[0], "approved", None),
+    ]
+    assert changes[0]["idempotency_key"] == "key-0" and changes[0]["commission"] == 25.0
+    assert repo.last_status_change_id() == changes[-1]["id"]
+    assert repo.status_changes_after(changes[0]["id"], 10) == changes[1:]
+
+@pytest.mark.parametrize("filters, index", [
+    ({"branch_code": "BR1"}, "idx_slips_branch_code"),
+    ({"status": "pending"}, "idx_slips_status"),
+    ({"week": "2025-05-12 to 2025-05-18"}, "idx_slips_week"),
+])
+def test_slip_filters_use_an_index(repo, filters, index):
+    clauses, params = repo._where(filters)
+    plan = repo._conn().execute(
+        f"EXPLAIN QUERY PLAN SELECT id FROM slips WHERE {' AND '.join(clauses)}", params
+    ).fetchall()
+    assert any(index in row["detail"] for row in plan)
+
+def test_indexes_exist(repo):
+    names = {row["name"] for row in repo._conn().execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+    assert {
+        "idx_slips_image_hash", "idx_slips_branch_code", "idx_slips_status", "idx_slips_week",
+        "idx_slips_transaction_id", "idx_slips_submitted_at", "idx_change_requests_status",
+        "idx_change_requests_branch_code", "idx_change_requests_requested_at",
+    } <= names
+
+def test_images_stay_under_the_image_root(repo, tmp_path):
+    repo.upload_image("BR1/Ali/1.webp", b"image", "image/webp")
+    assert repo.download_image("BR1/Ali/1.webp") == b"image"
+    with pytest.raises(ValueError):
+        repo.upload_image("BR1/Ali/1.webp", b"again", "image/webp")
+    for path in ("BR1/../../outside.webp", "../outside.webp", str(tmp_path / "outside.webp"), ""):
+        with pytest.raises(ValueError):
+            repo.upload_image(path, b"image", "image/webp")
+        with pytest.raises(ValueError):
+            repo.download_image(path)
+    assert not os.path.exists(tmp_path / "outside.webp")
+
+@pytest.mark.parametrize("name, expected", [
+    ("Ali Hamza", "Ali Hamza"),
+    ("BR00001", "BR00001"),
+    ("../../etc", "_.._etc"),
+    ("..", "_"),
+    ("a/b\\c", "a_b_c"),
+    ("", "_"),
+    ("Zaïd", "Zaïd"),
+])
+def test_path_component(name, expected):
+    assert path_component(name) == expected
+    assert "/" not in path_component(name) and path_component(name) not in (".", "..")
+
+class Upload:
+    name = "slip.pdf"
+
+    def getvalue(self) -> bytes:
+        return b"%PDF-1.4 path test"
+
+def test_uploaded_image_path_cannot_leave_the_branch_folder(client):
+    from modules.utils import prepare_uploaded_image
+    image_info, upload = prepare_uploaded_image(Upload(), "BR1", "../../../etc", [])
+    branch, rider, file_name = image_info["image_path"].split("/")
+    assert (branch, rider) == ("BR1", "_.._.._etc")
+    assert upload["path"] == image_info["image_path"]
@@ -0,0 +1,124 @@
+import pytest
+from modules import submission
+from modules.submission import submit_slips
+
+def slip(i: int, **fields):
+    return {
+        "branch_code": "BR00000",
+        "rider_name": "Rider 0",
+        "slip_type": "Cash Slip",
+        "transaction_id": f"{i:010d}",
+        "quantity": 1,
+        "commission": 10.0,
+        "week": "2025-01-06 to 2025-01-12",
+        "submitted_at": "2025-01-06T10:00:00",
+        "idempotency_key": f"key-{i}",
+        **fields,
+    }
+
+@pytest.fixture
+def chunks(monkeypatch):
+    """Record every chunk insert; rows with bad=True make the whole chunk fail"""
+    calls = []
+
+    def insert(rows):
+        calls.append([row["idempotency_key"] for row in rows])
+        bad = [row["idempotency_key"] for row in rows if row.get("bad")]
+        if bad:
+            raise ValueError(f"rejected {', '.join(bad)}")
+
+    monkeypatch.setattr(submission, "_insert_chunk", insert)
+    return calls
+
+def test_report_isolates_bad_rows_by_bisecting(chunks):
+    entries = [slip(i, bad=i in (2, 5)) for i in range(8)]
+    report = submit_slips(entries, chunk_size=8, max_retries=0)
+
+    assert [row["index"] for row in report] == list(range(8))
+    assert [row["ok"] for row in report] == [i not in (2, 5) for i in range(8)]
+    assert report[2]["error"] == "rejected key-2"
+    assert report[5]["error"] == "rejected key-5"
+    assert all(row["error"] is None for row in report if row["ok"])
+    # 8 -> 4 + 4 -> 2 + 2 + 2 + 2 -> single rows only around the bad ones
+    assert chunks[0] == [f"key-{i}" for i in range(8)]
+    assert ["key-2"] in chunks and ["key-3"] in chunks
+    assert ["key-4", "key-5"] in chunks and ["key-6", "key-7"] in chunks
+
+def test_retries_with_backoff_only_on_the_whole_chunk(chunks):
+    sleeps = []
+    entries = [slip(0), slip(1, bad=True)]
+    report = submit_slips(entries, chunk_size=2, max_retries=3, backoff=0.5, sleep=sleeps.append)
+
+    assert [row["ok"] for row in report] == [True, False]
+    # Three retries of the full chunk, then the halves are tried once each
+    assert len(chunks) == 4 + 2
+    assert len(sleeps) == 3
+    for attempt, delay in enumerate(sleeps):
+        assert 0.5 * 2 ** attempt <= delay <= 0.5 * 2 ** attempt * 2
+
+def test_transient_error_is_retried(monkeypatch):
+    attempts = []
+
+    def flaky(rows):
+        attempts.append(len(rows))
+        if len(attempts) < 3:
+            raise ConnectionError("reset by peer")
+
+    monkeypatch.setattr(submission, "_insert_chunk", flaky)
+    report = submit_slips([slip(0), slip(1)], max_retries=4, sleep=lambda _: None)
+    assert all(row["ok"] for row in report)
+    assert attempts == [2, 2, 2]
+
+def test_chunks_are_independent(chunks):
+    entries = [slip(i, bad=i == 0) for i in range(5)]
+    report = submit_slips(entries, chunk_size=2, max_retries=0)
+    assert [row["ok"] for row in report] == [False, True, True, True, True]
+    assert chunks[:1] == [["key-0", "key-1"]]
+    assert ["key-2", "key-3"] in chunks and ["key-4"] in chunks
+
+def test_missing_idempotency_keys_are_generated(chunks):
+    entries = [slip(0, idempotency_key=None), slip(1)]
+    del entries[0]["idempotency_key"]
+    report = submit_slips(entries)
+    assert report[0]["idempotency_key"] == entries[0]["idempotency_key"]
+    assert report[0]["idempotency_key"] not in (None, "key-1")
+
+def test_resubmitting_does_not_insert_twice(client):
+    entries = [slip(i) for i in range(3)]
+    assert all(row["ok"] for row in submit_slips(entries))
+    # e.g. a retry after a timeout whose insert had in fact landed
+    assert all(row["ok"] for row in submit_slips([dict(entry) for entry in entries]))
+    assert len(client.tables["slips"]) == 3
+
+def run_until_finished(queue, clock):
+    while queue.counts()["queued"] or queue.counts()["running"]:
+        clock.now += 3600
+        queue.run_once()
+
+def test_failed_insert_does_not_claim_the_image_or_id(client, queue, clock, monkeypatch):
+    from modules.hash_index import get_hash_index
+    from modules.transaction_index import get_transaction_index
+    first = slip(900, image_hash="9" * 64)
+    again = slip(901, image_hash="9" * 64, transaction_id=first["transaction_id"])
+    submission.enqueue_submission([first], {})
+    # Still waiting on the queue: a second submission is turned away
+    hashes, ids = submission.queued_conflicts([again])
+    assert hashes == {"9" * 64: "already queued"}
+    assert ids == {("Cash Slip", first["transaction_id"]): "already queued"}
+
+    def refuse(rows):
+        raise ValueError("insert refused")
+
+    insert_chunk = submission._insert_chunk
+    monkeypatch.setattr(submission, "_insert_chunk", refuse)
+    run_until_finished(queue, clock)
+    assert queue.counts()["failed"] == 1
+    assert submission.queued_conflicts([again]) == ({}, {})
+    assert get_hash_index().check_batch(["9" * 64]) == {}
+    assert get_transaction_index().check_batch([again]) == {}
+
+    monkeypatch.setattr(submission, "_insert_chunk", insert_chunk)
+    submission.enqueue_submission([again], {})
+    run_until_finished(queue, clock)
+    assert get_hash_index().check_batch(["9" * 64]) == {"9" * 64: "already submitted"}
+    assert get_transaction_index().check_batch([first]) == {("Cash Slip", first["transaction_id"]): "already submitted"}
@@ -0,0 +1,44 @@
+import pytest
+from modules import transaction_index
+from modules.transaction_index import TransactionIndex, get_transaction_index
+
+@pytest.fixture
+def index(client, tmp_path, monkeypatch):
+    monkeypatch.setattr(transaction_index, "TRANSACTION_INDEX_FILE", str(tmp_path / "transaction_index.bin"))
+    monkeypatch.setattr(TransactionIndex, "_instance", None)
+    client.seed("slips", [
+        {"slip_type": "Cash Slip", "transaction_id": "AB12", "idempotency_key": "k1"},
+        {"slip_type": "Bank Transfer", "transaction_id": "TX-9", "idempotency_key": "k2"},
+    ])
+    return get_transaction_index()
+
+def test_check_batch_flags_submitted_and_repeated_pairs(index):
+    duplicates = index.check_batch([
+        {"slip_type": "Cash Slip", "transaction_id": " ab12 "},
+        {"slip_type": "Bank Transfer", "transaction_id": "AB12"},
+        {"slip_type": "Cash Slip", "transaction_id": "NEW1"},
+        {"slip_type": "Cash Slip", "transaction_id": "new1"},
+        {"slip_type": "Cash Slip", "transaction_id": ""},
+    ])
+    assert duplicates == {
+        ("Cash Slip", "AB12"): "already submitted",
+        ("Cash Slip", "NEW1"): "repeated in this batch",
+    }
+
+def test_conflict_checks_against_the_pending_batch(index):
+    pending = [{"slip_type": "Cash Slip", "transaction_id": "P1"}]
+    assert index.conflict("Cash Slip", "p1", pending) == "repeated in this batch"
+    assert index.conflict("Bank Transfer", "tx-9", pending) == "already submitted"
+    assert index.conflict("Cash Slip", "P2", pending) is None
+
+def test_new_slips_are_seen_after_add_many_and_after_a_restart(index, client, monkeypatch):
+    index.add_many([{"slip_type": "Cash Slip", "transaction_id": "LATER"}])
+    assert index.contains("Cash Slip", "later")
+
+    # Another process inserts a slip; a fresh index loads the snapshot and
+    # pulls only the rows past its watermark
+    client.seed("slips", [{"slip_type": "Cash Slip", "transaction_id": "REMOTE", "idempotency_key": "k3"}])
+    monkeypatch.setattr(TransactionIndex, "_instance", None)
+    restarted = get_transaction_index()
+    assert restarted.contains("Cash Slip", "REMOTE")
+    assert restarted.contains("Bank Transfer", "TX-9")